@@ -0,0 +1,446 @@
+'''
+Maintain the LevelDB HTTP cache under .scrapy/httpcache, see
+`pystock-crawler cache`. Nothing is ever evicted from it by Scrapy, so failed
+responses and stale browse pages pile up next to the filings.
+
+Entries are found with the metadata that CompressedLeveldbCacheStorage keeps
+(see httpcache.META_PREFIX), so no bodies are read except to find CIKs on
+browse pages. Databases written before it are indexed the first time.
+
+Both the LevelDB databases and the SQLite ones of CompressedSqliteCacheStorage
+are supported, see migrate().
+
+'''
+import cPickle as pickle
+import os
+import re
+import shutil
+import time
+import urlparse
+
+from collections import namedtuple
+
+from scrapy import log
+
+from pystock_crawler import sqlitekv
+from pystock_crawler.ciks import CikMap, find_cik
+from pystock_crawler.concepts import RE_CIK
+from pystock_crawler.httpcache import (INDEXED_KEY, META_PREFIX, ZlibCodec, get_atime_key, get_body,
+                                       get_dict_path, get_meta_key, get_url_class)
+
+
+# `atime` is the last time the entry is retrieved, or the time it's stored
+Entry = namedtuple('Entry', 'key url status size time atime')
+
+RE_SIZE = re.compile(r'^(\d+(?:\.\d+)?)([KMGT]?)B?$', re.IGNORECASE)
+
+SIZE_UNITS = 'KMGT'
+
+# Number of writes in a batch
+BATCH_SIZE = 1000
+
+DB_EXTS = ('.leveldb', '.sqlite')
+
+
+def open_db(path, create=False):
+    if path.endswith('.sqlite'):
+        return sqlitekv.SqliteDB(path, create_if_missing=create)
+    import leveldb
+    return leveldb.LevelDB(path, create_if_missing=create)
+
+
+def iter_db_paths(cache_dir):
+    '''Generate (spider name, path) of all databases in `cache_dir`.'''
+    if not os.path.isdir(cache_dir):
+        return
+    for filename in sorted(os.listdir(cache_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext in DB_EXTS:
+            yield name, os.path.join(cache_dir, filename)
+
+
+def get_db_path(cache_dir, spider, default_ext='.leveldb'):
+    '''Path of the database of `spider` in `cache_dir`, or a new one with `default_ext`.'''
+    for ext in DB_EXTS:
+        path = os.path.join(cache_dir, spider + ext)
+        if os.path.exists(path):
+            return path
+    return os.path.join(cache_dir, spider + default_ext)
+
+
+def get_dir_size(path):
+    size = 0
+    for root, dirnames, filenames in os.walk(path):
+        size += sum(os.path.getsize(os.path.join(root, filename)) for filename in filenames)
+    return size
+
+
+def parse_size(value):
+    '''Number of bytes in a size like '500M' or '20G' (powers of 1024).'''
+    match = RE_SIZE.match(value.strip())
+    if not match:
+        raise ValueError("Invalid size: '%s'" % value)
+    number, unit = match.groups()
+    power = SIZE_UNITS.index(unit.upper()) + 1 if unit else 0
+    return int(float(number) * 1024 ** power)
+
+
+def format_size(size):
+    if size < 1024:
+        return '%dB' % size
+    for unit in SIZE_UNITS:
+        size /= 1024.0
+        if size < 1024 or unit == SIZE_UNITS[-1]:
+            return '%.1f%s' % (size, unit)
+
+
+def parse_statuses(value):
+    '''Set of statuses like '404' and status classes like '5xx' in a comma-separated string.'''
+    statuses = set()
+    for status in value.split(','):
+        status = status.strip().lower()
+        if not re.match(r'^\d(\d\d|xx)$', status):
+            raise ValueError("Invalid status: '%s'" % status)
+        statuses.add(status)
+    return statuses
+
+
+def match_status(status, statuses):
+    return str(status) in statuses or '%dxx' % (status // 100) in statuses
+
+
+def index(db):
+    '''Add the missing metadata of the entries in `db`. Return the number of entries indexed.'''
+    if db.Get(INDEXED_KEY, default=None) is not None:
+        return 0
+
+    count = 0
+    batch = _new_batch(db)
+    for key, value in db.RangeIter():
+        if key.startswith(META_PREFIX) or not key.endswith('_data'):
+            continue
+        key = key[:-len('_data')]
+        if db.Get(get_meta_key(key), default=None) is not None:
+            continue
+
+        data = pickle.loads(value)
+        stored = float(db.Get('%s_time' % key, default=None) or 0)
+        batch.Put(get_meta_key(key), pickle.dumps((data['url'], data['status'], len(value), stored), protocol=2))
+        count += 1
+        if count % BATCH_SIZE == 0:
+            db.Write(batch)
+            batch = _new_batch(db)
+
+    batch.Put(INDEXED_KEY, '1')
+    db.Write(batch)
+    return count
+
+
+def iter_entries(db):
+    '''Generate Entry of all entries in `db`, see index().'''
+    entry = None
+    for key, value in db.RangeIter(key_from=META_PREFIX, key_to=META_PREFIX[:-1] + ';'):
+        key = key[len(META_PREFIX):]
+        if key.endswith(':atime'):
+            if entry and entry.key == key[:-len(':atime')]:
+                entry = entry._replace(atime=float(value))
+            continue
+
+        if entry:
+            yield entry
+        url, status, size, stored = pickle.loads(value)
+        entry = Entry(key, url, status, size, stored, stored)
+    if entry:
+        yield entry
+
+
+def open_indexed_dbs(cache_dir):
+    '''Generate (spider name, db) of all databases in `cache_dir`, indexed.'''
+    for spider, path in iter_db_paths(cache_dir):
+        db = open_db(path)
+        num_indexed = index(db)
+        if num_indexed:
+            log.msg(u'Indexed %d entries of %s' % (num_indexed, path))
+        yield spider, db
+
+
+def get_stats(cache_dir):
+    '''
+    Return {spider: {url_class: [count, size]}} and {status class: count} of
+    all entries in `cache_dir`.
+
+    '''
+    classes = {}
+    statuses = {}
+    for spider, db in open_indexed_dbs(cache_dir):
+        spider_classes = classes.setdefault(spider, {})
+        for entry in iter_entries(db):
+            stats = spider_classes.setdefault(get_url_class(entry.url), [0, 0])
+            stats[0] += 1
+            stats[1] += entry.size
+            status_class = '%dxx' % (entry.status // 100)
+            statuses[status_class] = statuses.get(status_class, 0) + 1
+    return classes, statuses
+
+
+def format_stats(cache_dir):
+    classes, statuses = get_stats(cache_dir)
+    lines = ['%-10s %-10s %10s %10s' % ('Spider', 'URL class', 'Entries', 'Size')]
+    total_count = total_size = 0
+    for spider, spider_classes in sorted(classes.iteritems()):
+        for url_class, (count, size) in sorted(spider_classes.iteritems()):
+            lines.append('%-10s %-10s %10d %10s' % (spider, url_class, count, format_size(size)))
+            total_count += count
+            total_size += size
+    lines.append('%-21s %10d %10s' % ('Total', total_count, format_size(total_size)))
+    lines.append('')
+    lines.append('Statuses: %s' % ', '.join('%s %d' % item for item in sorted(statuses.iteritems())))
+    lines.append('On disk: %s' % format_size(get_dir_size(cache_dir)))
+    return '\n'.join(lines)
+
+
+def delete_entries(db, keys):
+    batch = _new_batch(db)
+    for i, key in enumerate(keys, 1):
+        for db_key in ('%s_data' % key, '%s_time' % key, get_meta_key(key), get_atime_key(key)):
+            batch.Delete(db_key)
+        if i % BATCH_SIZE == 0:
+            db.Write(batch)
+            batch = _new_batch(db)
+    db.Write(batch)
+
+
+def evict(cache_dir, max_age=None, statuses=None, budget=None, url_classes=None):
+    '''
+    Delete the entries in `cache_dir` that were stored more than `max_age`
+    seconds ago or have one of `statuses` (see parse_statuses()). Then delete
+    the least recently used entries until the rest take at most `budget`
+    bytes. Only the entries of `url_classes` are deleted if it's given.
+
+    Sizes are of the pickled entries, before LevelDB compresses them on
+    disk. Return (number of entries, bytes) deleted.
+
+    '''
+    now = time.time()
+    dbs = {}
+    to_delete = {}
+    lru = []
+    total_size = num_deleted = size_deleted = 0
+
+    for spider, db in open_indexed_dbs(cache_dir):
+        dbs[spider] = db
+        keys = to_delete[spider] = []
+        for entry in iter_entries(db):
+            total_size += entry.size
+            if url_classes and get_url_class(entry.url) not in url_classes:
+                continue
+            if (max_age is not None and now - entry.time > max_age) or \
+                    (statuses and match_status(entry.status, statuses)):
+                keys.append(entry.key)
+                num_deleted += 1
+                size_deleted += entry.size
+            elif budget is not None:
+                lru.append((entry.atime, entry.size, spider, entry.key))
+
+    if budget is not None and total_size - size_deleted > budget:
+        lru.sort()
+        for atime, size, spider, key in lru:
+            if total_size - size_deleted <= budget:
+                break
+            to_delete[spider].append(key)
+            num_deleted += 1
+            size_deleted += size
+
+    for spider, keys in to_delete.iteritems():
+        if keys:
+            delete_entries(dbs[spider], keys)
+            dbs[spider].CompactRange()
+            log.msg(u'Evicted %d entries of %s' % (len(keys), spider))
+    return num_deleted, size_deleted
+
+
+def compact(cache_dir):
+    '''Compact all databases in `cache_dir`. Return the sizes on disk before and after.'''
+    size = get_dir_size(cache_dir)
+    for spider, path in iter_db_paths(cache_dir):
+        open_db(path).CompactRange()
+    return size, get_dir_size(cache_dir)
+
+
+def migrate(cache_dir):
+    '''
+    Copy the LevelDB databases in `cache_dir` to SQLite databases of the same
+    spiders for CompressedSqliteCacheStorage, and rename them to
+    *.leveldb.bak. A spider that already has a SQLite database is skipped.
+    Return the number of entries copied.
+
+    '''
+    num_copied = 0
+    for spider, path in list(iter_db_paths(cache_dir)):
+        if not path.endswith('.leveldb'):
+            continue
+        sqlite_path = os.path.join(cache_dir, '%s.sqlite' % spider)
+        if os.path.exists(sqlite_path):
+            log.msg(u'Skipped %s, %s already exists' % (path, sqlite_path), level=log.WARNING)
+            continue
+
+        source = open_db(path)
+        index(source)
+
+        # Written to a temporary file first, so the storage never sees half of it
+        tmp_path = '%s.tmp' % sqlite_path
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        target = sqlitekv.SqliteDB(tmp_path)
+        count = 0
+        batch = _new_batch(target)
+        for i, (key, value) in enumerate(source.RangeIter(), 1):
+            batch.Put(key, value)
+            if key.endswith('_data') and not key.startswith(META_PREFIX):
+                count += 1
+            if i % BATCH_SIZE == 0:
+                target.Write(batch)
+                batch = _new_batch(target)
+        target.Write(batch)
+        target.CompactRange()
+        target.close()
+        del source
+
+        os.rename(tmp_path, sqlite_path)
+        os.rename(path, '%s.bak' % path)
+        num_copied += count
+        log.msg(u'Migrated %d entries of %s to %s' % (count, spider, sqlite_path))
+    return num_copied
+
+
+def get_query_param(url, name):
+    values = urlparse.parse_qs(urlparse.urlparse(url).query).get(name)
+    return values[0].upper() if values else None
+
+
+def select_symbols(db, symbols, cik_map=None, dict_path=None):
+    '''
+    Keys of the entries in `db` of `symbols`: browse pages of SEC EDGAR,
+    filings of their CIKs and prices on Yahoo Finance. CIKs are looked up in
+    `cik_map` (a CikMap) and on the cached browse pages.
+
+    '''
+    cik_map = cik_map or CikMap()
+    symbols = set(symbol.upper() for symbol in symbols)
+    ciks = set(filter(None, (cik_map.get_cik(symbol) for symbol in symbols)))
+
+    keys = []
+    archive_entries = []
+    for entry in iter_entries(db):
+        url_class = get_url_class(entry.url)
+        if url_class == 'archive':
+            archive_entries.append(entry)
+        elif url_class == 'browse':
+            symbol = get_query_param(entry.url, 'CIK')
+            if symbol and (symbol in symbols or symbol.lstrip('0') in ciks):
+                keys.append(entry.key)
+                data = db.Get('%s_data' % entry.key, default=None)
+                cik = find_cik(get_body(pickle.loads(data), dict_path)) if data and entry.status == 200 else None
+                if cik:
+                    ciks.add(cik)
+        elif url_class == 'yahoo':
+            if get_query_param(entry.url, 's') in symbols:
+                keys.append(entry.key)
+
+    for entry in archive_entries:
+        match = RE_CIK.search(entry.url)
+        if match.group(1).lstrip('0') in ciks:
+            keys.append(entry.key)
+    return keys
+
+
+def copy_entries(source_dir, target_dir, symbols=None, cik_map=None, skip_newer=False):
+    '''
+    Copy the entries of all databases in `source_dir` to the databases of the
+    same spiders in `target_dir`, or only the ones of `symbols` (see
+    select_symbols()). Entries that are newer in the target are kept if
+    `skip_newer` is True. Return the number of entries copied.
+
+    Compression dictionaries are copied along if the target doesn't have one.
+    Entries compressed with a dictionary the target doesn't have are
+    recompressed with zlib.
+
+    '''
+    if not os.path.isdir(target_dir):
+        os.makedirs(target_dir)
+
+    num_copied = 0
+    for spider, source in open_indexed_dbs(source_dir):
+        source_path = get_db_path(source_dir, spider)
+        target_path = get_db_path(target_dir, spider, os.path.splitext(source_path)[1])
+        source_dict = get_dict_path(source_path)
+        target_dict = get_dict_path(target_path)
+        if not os.path.exists(source_dict):
+            source_dict = None
+        elif not os.path.exists(target_dict):
+            shutil.copyfile(source_dict, target_dict)
+        same_dict = source_dict and _read_file(source_dict) == _read_file(target_dict)
+
+        target = open_db(target_path, create=True)
+        if next(target.RangeIter(include_value=False), None) is None:
+            target.Put(INDEXED_KEY, '1')
+        else:
+            index(target)
+
+        if symbols is None:
+            keys = [entry.key for entry in iter_entries(source)]
+        else:
+            keys = select_symbols(source, symbols, cik_map, source_dict)
+
+        count = 0
+        batch = _new_batch(target)
+        for key in keys:
+            meta = source.Get(get_meta_key(key))
+            if skip_newer:
+                target_meta = target.Get(get_meta_key(key), default=None)
+                if target_meta and pickle.loads(target_meta)[3] >= pickle.loads(meta)[3]:
+                    continue
+
+            data = source.Get('%s_data' % key)
+            if source_dict and not same_dict:
+                data, meta = _recompress(data, meta, source_dict)
+            batch.Put('%s_data' % key, data)
+            batch.Put('%s_time' % key, source.Get('%s_time' % key))
+            batch.Put(get_meta_key(key), meta)
+            batch.Put(get_atime_key(key), source.Get(get_atime_key(key), default=None) or
+                      repr(pickle.loads(meta)[3]))
+            count += 1
+            if count % BATCH_SIZE == 0:
+                target.Write(batch)
+                batch = _new_batch(target)
+        target.Write(batch)
+        num_copied += count
+        log.msg(u'Copied %d entries of %s' % (count, spider))
+    return num_copied
+
+
+def _recompress(data, meta, dict_path):
+    entry = pickle.loads(data)
+    if not entry.get('dict_id'):
+        return data, meta
+
+    entry['body'] = ZlibCodec().compress(get_body(entry, dict_path))
+    entry['codec'] = ZlibCodec.name
+    entry['dict_id'] = ZlibCodec.dict_id
+    data = pickle.dumps(entry, protocol=2)
+    url, status, size, stored = pickle.loads(meta)
+    return data, pickle.dumps((url, status, len(data), stored), protocol=2)
+
+
+def _read_file(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _new_batch(db):
+    if isinstance(db, sqlitekv.SqliteDB):
+        return sqlitekv.WriteBatch()
+    import leveldb
+    return leveldb.WriteBatch()
@@ -0,0 +1,63 @@
+'''
+Map ticker symbols to the CIKs of companies, so EdgarSpider can crawl by CIK
+(see EDGAR_CIK_MAP). Symbols of the same company, e.g., dual-class shares,
+are crawled once.
+
+The map is stored in a text file in the same format as
+https://www.sec.gov/include/ticker.txt, so that file can be used as is:
+
+    aapl    320193
+    goog    1652044
+
+Symbols that aren't in the file are looked up on the browse pages of SEC
+EDGAR as before, and added to the file.
+
+'''
+import os
+import re
+
+from pystock_crawler.utils import open_atomic
+
+
+# CIK in the links of a browse page of SEC EDGAR
+RE_BROWSE_CIK = re.compile(r'[?&;]CIK=(\d{10})\b')
+
+
+def find_cik(body):
+    '''CIK of the company on a browse page of SEC EDGAR, or None.'''
+    match = RE_BROWSE_CIK.search(body)
+    if match:
+        return match.group(1).lstrip('0')
+    return None
+
+
+class CikMap(object):
+
+    def __init__(self, path=None):
+        self.path = path
+
+        # Upper-case symbol -> CIK without leading zeros
+        self.ciks = {}
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            for line in f:
+                values = line.split()
+                if len(values) >= 2 and values[1].isdigit():
+                    self.ciks[values[0].upper()] = values[1].lstrip('0')
+
+    def save(self):
+        with open_atomic(self.path) as f:
+            for symbol, cik in sorted(self.ciks.iteritems()):
+                f.write('%s\t%s\n' % (symbol.lower(), cik))
+
+    def get_cik(self, symbol):
+        '''CIK of `symbol`, or None if it's unknown. A CIK maps to itself.'''
+        if symbol.isdigit():
+            return symbol.lstrip('0')
+        return self.ciks.get(symbol.upper())
+
+    def add(self, symbol, cik):
+        self.ciks[symbol.upper()] = cik.lstrip('0')
@@ -0,0 +1,342 @@
+'''
+Load reports from the company facts JSON of SEC EDGAR instead of crawling
+XBRL documents one by one. A company facts file has every XBRL fact that a
+company has filed, so one file replaces all the reports of the company.
+
+https://www.sec.gov/edgar/sec-api-documentation
+
+The files (e.g., CIK0000320193.json) can be in a directory or in the bulk
+archive companyfacts.zip. A file looks like:
+
+    {"cik": 320193, "entityName": "Apple Inc.", "facts": {
+        "us-gaap": {
+            "Revenues": {"label": ..., "description": ..., "units": {
+                "USD": [{"start": "2013-09-29", "end": "2013-12-28",
+                         "val": 57594000000, "accn": "0001193125-14-024487",
+                         "fy": 2014, "fp": "Q1", "form": "10-Q",
+                         "filed": "2014-01-28"}, ...]
+            }}, ...
+        }, ...
+    }}
+
+Files of large companies are tens of MBs, so they are read concept by
+concept with JsonStream. Facts are matched to fields the same way as in
+fsds, and there's a row for each (fiscal_year, period_focus) of a company.
+Like the data sets, company facts only have facts without dimensions, and
+there are no ticker symbols, so the symbol of a row is the CIK.
+
+'''
+import json
+import os
+import re
+import zipfile
+
+from collections import Counter
+from datetime import datetime
+from scrapy import log
+
+from pystock_crawler import settings, utils
+from pystock_crawler.exporters import CsvItemExporter2
+from pystock_crawler.fsds import FORMS, TagRules, build_item, match_fact
+from pystock_crawler.loaders import DATE_FORMAT
+
+
+RE_FILENAME = re.compile(r'^CIK(\d+)\.json$', re.IGNORECASE)
+
+# Bytes to read at a time
+CHUNK_SIZE = 64 * 1024
+
+RE_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JsonStream(object):
+    '''
+    Read a JSON document from a file-like object piece by piece. Objects can
+    be walked key by key with iter_keys(), so only the values that are read
+    with read_value() are loaded in memory at a time.
+
+    '''
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        '''Read more data into the buffer. Return False if there's nothing left.'''
+        if self.eof:
+            return False
+        data = self.f.read(size or self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        return ValueError('%s at byte %d of the buffer' % (message, self.pos))
+
+    def peek(self):
+        '''Skip whitespace and return the next character, or '' at the end.'''
+        while True:
+            self.pos = RE_WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error('Expecting %r' % char)
+        self.pos += 1
+
+    def read_value(self):
+        '''Decode the next value, e.g., a whole object.'''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # Incomplete value, read as much again as there's pending
+                if not self._fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    raise
+                continue
+
+            # A number may go on in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+
+            self.pos = end
+            return value
+
+    def iter_keys(self):
+        '''
+        Generate the keys of the next object. The caller must read the
+        value of a key with read_value() before asking for the next key.
+
+        '''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            if self.peek() != '"':
+                raise self._error('Expecting property name')
+            key = self.read_value()
+            self.expect(':')
+            yield key
+
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise self._error("Expecting ',' or '}'")
+
+
+def iter_concepts(f):
+    '''
+    Generate (cik, taxonomy, concept name, concept) of a company facts file
+    without loading the whole file.
+
+    '''
+    stream = JsonStream(f)
+    cik = None
+    for key in stream.iter_keys():
+        if key == 'cik':
+            cik = str(stream.read_value()).lstrip('0')
+        elif key == 'facts':
+            for taxonomy in stream.iter_keys():
+                for name in stream.iter_keys():
+                    yield cik, taxonomy, name, stream.read_value()
+        else:
+            stream.read_value()
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, DATE_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_company(f, rules, start_date='', end_date=''):
+    '''
+    Return (cik, a dict of accession number -> report) of 10-Q and 10-K
+    reports in a company facts file filed between `start_date` and
+    `end_date` (YYYYMMDD). A report is a dict like a submission of fsds, with
+    'facts' as a list of (matches, tag, value, start date, end date).
+
+    Company facts don't say which period a report is for, so the fiscal year
+    and period focus are the ones most of its facts have, and the period is
+    the end date that most of those facts have. Facts dated after the period,
+    e.g., dividends declared after it, don't move it.
+
+    '''
+    cik = None
+    reports = {}
+    dates = {}
+
+    def get_date(value):
+        try:
+            return dates[value]
+        except KeyError:
+            date = dates[value] = parse_date(value)
+            return date
+
+    for cik, taxonomy, tag, concept in iter_concepts(f):
+        matches = rules.match(taxonomy, tag)
+        if not matches:
+            continue
+
+        for facts in concept.get('units', {}).itervalues():
+            for fact in facts:
+                form = fact.get('form')
+                if form not in FORMS:
+                    continue
+
+                filed = fact.get('filed', '').replace('-', '')
+                if (start_date and filed < start_date) or (end_date and filed > end_date):
+                    continue
+
+                fact_end_date = get_date(fact.get('end'))
+                if fact_end_date is None:
+                    continue
+
+                try:
+                    value = float(fact['val'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+                report = reports.get(fact.get('accn'))
+                if report is None:
+                    report = reports[fact.get('accn')] = {
+                        'doc_type': form.split('/')[0],
+                        'amend': form.endswith('/A'),
+                        'filed': filed,
+                        'end_dates': Counter(),
+                        'facts': []
+                    }
+
+                focus = (fact.get('fy'), (fact.get('fp') or '').upper() or None)
+                report['end_dates'][focus + (fact_end_date,)] += 1
+                report['facts'].append((matches, tag, value, get_date(fact.get('start')),
+                                        fact_end_date))
+
+    for report in reports.itervalues():
+        set_report_period(report, report.pop('end_dates'))
+
+    return cik, reports
+
+
+def set_report_period(report, end_dates):
+    '''
+    Set the fiscal year, period focus and period of a report from the counts
+    of (fiscal year, period focus, end date) of its facts. Ties go to the
+    latest.
+
+    '''
+    focuses = Counter()
+    for (fiscal_year, period_focus, date), count in end_dates.iteritems():
+        focuses[(fiscal_year, period_focus)] += count
+    focus = max(focuses.iteritems(), key=lambda (key, count): (count, key))[0]
+    report['fiscal_year'], report['period_focus'] = focus
+
+    dates = [(count, key[2]) for key, count in end_dates.iteritems() if key[:2] == focus]
+    report['period'] = max(dates)[1]
+
+
+def iter_company_items(f, rules, start_date='', end_date='', ciks=None, fields=None):
+    '''
+    Generate a ReportItem for each (fiscal_year, period_focus) of a company.
+    If a period is in several reports, the latest filed one is taken.
+
+    '''
+    cik, reports = load_company(f, rules, start_date, end_date)
+    if ciks and cik not in ciks:
+        return
+
+    periods = {}
+    for accession, report in reports.iteritems():
+        if report['doc_type'] == '10-K':
+            report['period_focus'] = 'FY'
+        key = (report['fiscal_year'], report['period_focus'])
+        other = periods.get(key)
+        if other is None or (report['filed'], accession) > (other['filed'], other['accession']):
+            report['accession'] = accession
+            periods[key] = report
+
+    for report in sorted(periods.itervalues(), key=lambda a: a['period']):
+        report['symbol'] = cik
+        facts = []
+        for matches, tag, value, fact_start_date, fact_end_date in report['facts']:
+            facts.extend(match_fact(report, rules, matches, tag, value, fact_start_date,
+                                    fact_end_date))
+        yield build_item(report, facts, rules, fields)
+
+
+def iter_files(source):
+    '''Generate (filename, file-like object) of company facts files in `source`.'''
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            if RE_FILENAME.match(filename):
+                with open(os.path.join(source, filename), 'rb') as f:
+                    yield filename, f
+    elif zipfile.is_zipfile(source):
+        zip_file = zipfile.ZipFile(source)
+        try:
+            for name in sorted(zip_file.namelist()):
+                if RE_FILENAME.match(os.path.basename(name)):
+                    f = zip_file.open(name)
+                    try:
+                        yield name, f
+                    finally:
+                        f.close()
+        finally:
+            zip_file.close()
+    else:
+        with open(source, 'rb') as f:
+            yield os.path.basename(source), f
+
+
+def get_file_cik(filename):
+    match = RE_FILENAME.match(os.path.basename(filename))
+    return match.group(1).lstrip('0') if match else None
+
+
+def iter_reports(source, ciks=None, start_date='', end_date='', fields=None):
+    '''Generate ReportItems of all company facts files in `source`.'''
+    rules = TagRules(fields=fields)
+    if ciks:
+        ciks = set(cik.lstrip('0') for cik in ciks)
+
+    for filename, f in iter_files(source):
+        # Don't read the files of other companies
+        cik = get_file_cik(filename)
+        if ciks and cik and cik not in ciks:
+            continue
+
+        for item in iter_company_items(f, rules, start_date, end_date, ciks, fields):
+            yield item
+
+
+def ingest(source, output, ciks=None, start_date='', end_date='', fields=None):
+    '''
+    Write the reports in the company facts files in `source` to `output` as
+    CSV. Return the number of reports written.
+
+    '''
+    num_reports = 0
+    with open(output, 'wb') as f:
+        export_fields = utils.get_export_fields(settings.EXPORT_FIELDS, fields)
+        exporter = CsvItemExporter2(f, fields_to_export=export_fields)
+        exporter.start_exporting()
+        for item in iter_reports(source, ciks, start_date, end_date, fields):
+            exporter.export_item(item)
+            num_reports += 1
+        exporter.finish_exporting()
+
+    log.msg(u'Ingested %d reports from %s' % (num_reports, source))
+    return num_reports
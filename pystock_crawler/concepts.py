@@ -0,0 +1,52 @@
+'''
+Remember which XPath of each field yielded values in the last report of a
+company. ReportItemLoader tries it first on the next report of the same
+company (see concept_hints of XmlXPathItemLoader), which saves walking the
+fallback XPaths on multi-year backfills.
+
+'''
+import json
+import os
+import re
+
+from pystock_crawler.utils import write_json_atomic
+
+
+RE_CIK = re.compile(r'/Archives/edgar/data/(\d+)/')
+
+
+def get_company_key(url):
+    '''CIK of the company that filed the report at `url`, or the symbol if there's no CIK in it.'''
+    match = RE_CIK.search(url)
+    if match:
+        return match.group(1)
+    filename = url.split('/')[-1]
+    return filename.split('-')[0].upper()
+
+
+class ConceptCache(object):
+    '''
+    Concept hints of all companies, stored in a JSON file like:
+
+        {"<CIK>": {"<field>": "<XPath>", ...}, ...}
+
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.companies = {}
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            self.companies = json.load(f)
+
+    def save(self):
+        write_json_atomic(self.path, self.companies)
+
+    def get_hints(self, url):
+        '''Concept hints of the company that filed `url`. Changes to the dict go to the cache.'''
+        return self.companies.setdefault(get_company_key(url), {})
+
+    def update(self, url, hints):
+        self.get_hints(url).update(hints)
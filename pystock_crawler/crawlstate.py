@@ -0,0 +1,76 @@
+'''
+Remember the reports that EdgarSpider has exported, so the next crawl only
+fetches the filings that are newer (see EDGAR_STATE_FILE).
+
+For each symbol, the latest period and its accession number are kept as a
+high-water mark. The next crawl only lists the filings of the symbol filed
+after that period, and skips the filings that have been exported already.
+
+'''
+import json
+import os
+
+from datetime import datetime, timedelta
+
+from pystock_crawler.loaders import DATE_FORMAT
+from pystock_crawler.utils import write_json_atomic
+
+
+class CrawlState(object):
+    '''
+    Exported reports, stored in a JSON file like:
+
+        {"symbols": {"<SYMBOL>": {"end_date": "<YYYY-MM-DD>", "accession": "<accession>"}, ...},
+         "accessions": ["<accession>", ...]}
+
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.symbols = {}
+        self.accessions = set()
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        self.symbols = data.get('symbols', {})
+        self.accessions = set(data.get('accessions', []))
+
+    def save(self):
+        write_json_atomic(self.path, {'symbols': self.symbols, 'accessions': sorted(self.accessions)})
+
+    def get_start_date(self, symbol, start_date=''):
+        '''
+        Start date (YYYYMMDD) of the filings to crawl for `symbol`, i.e., the
+        day after the latest period exported, or `start_date` if it's later.
+
+        '''
+        mark = self.symbols.get(symbol.upper())
+        if not mark:
+            return start_date
+        date = datetime.strptime(mark['end_date'], DATE_FORMAT) + timedelta(days=1)
+        return max(date.strftime('%Y%m%d'), start_date)
+
+    def is_exported(self, accession):
+        return accession in self.accessions
+
+    def add_report(self, item, accession, symbol=None):
+        '''
+        Record an exported report. The mark is kept for `symbol`, i.e., the
+        symbol that was requested, or the symbol of the item by default.
+
+        '''
+        if accession:
+            self.accessions.add(accession)
+
+        symbol = symbol or item.get('symbol')
+        end_date = item.get('end_date')
+        if not (symbol and end_date):
+            return
+
+        # Amendments of earlier periods don't move the mark back
+        symbol = symbol.upper()
+        mark = self.symbols.get(symbol)
+        if not mark or end_date >= mark['end_date']:
+            self.symbols[symbol] = {'end_date': end_date, 'accession': accession}
@@ -1,7 +1,68 @@
+import csv
+import os
+
 from scrapy.conf import settings
 from scrapy.contrib.exporter import BaseItemExporter, CsvItemExporter
 
 
+def get_report_key(item):
+    '''(symbol, doc_type, end_date) of a ReportItem, or None for other items.'''
+    if 'doc_type' not in item.fields:
+        return None
+    return item.get('symbol'), item.get('doc_type'), item.get('end_date')
+
+
+def dedupe_comparatives(path):
+    '''
+    Drop the comparative periods in the CSV file at `path` that have a report
+    of their own, or another comparative period with a smaller accession
+    number, like CsvItemExporter2 does with the items it exports. It only sees
+    one crawl, so this is for the outputs of several, e.g., the batches of
+    `pystock-crawler reports` and the output of an earlier run appended to.
+    Return the number of rows dropped.
+
+    '''
+    with open(path, 'rb') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header or not all(name in header for name in ('symbol', 'doc_type', 'end_date', 'comparative')):
+            return 0
+        key_indexes = [header.index(name) for name in ('symbol', 'doc_type', 'end_date')]
+        comparative_index = header.index('comparative')
+        accession_index = header.index('accession') if 'accession' in header else None
+
+        # Report keys, and report key -> (accession, row number) of the
+        # comparative period to keep
+        report_keys = set()
+        comparatives = {}
+        num_comparatives = 0
+        for i, row in enumerate(reader):
+            key = tuple(row[j] for j in key_indexes)
+            if row[comparative_index] in ('', 'False'):
+                report_keys.add(key)
+                continue
+            num_comparatives += 1
+            accession = row[accession_index] if accession_index is not None else ''
+            if key not in comparatives or accession < comparatives[key][0]:
+                comparatives[key] = (accession, i)
+
+    kept_rows = set(i for key, (accession, i) in comparatives.iteritems() if key not in report_keys)
+    num_dropped = num_comparatives - len(kept_rows)
+    if not num_dropped:
+        return 0
+
+    tmp_path = '%s.tmp' % path
+    with open(path, 'rb') as f, open(tmp_path, 'wb') as out:
+        reader = csv.reader(f)
+        writer = csv.writer(out)
+        writer.writerow(next(reader))
+        for i, row in enumerate(reader):
+            if row[comparative_index] in ('', 'False') or i in kept_rows:
+                writer.writerow(row)
+    os.rename(tmp_path, path)
+    return num_dropped
+
+
 class CsvItemExporter2(CsvItemExporter):
     '''
     The standard CsvItemExporter class does not pass the kwargs through to the
@@ -12,11 +73,41 @@ class CsvItemExporter2(CsvItemExporter):
 
     '''
     def __init__(self, *args, **kwargs):
-        kwargs['fields_to_export'] = settings.getlist('EXPORT_FIELDS') or None
-        kwargs['encoding'] = settings.get('EXPORT_ENCODING', 'utf-8')
+        kwargs.setdefault('fields_to_export', settings.getlist('EXPORT_FIELDS') or None)
+        kwargs.setdefault('encoding', settings.get('EXPORT_ENCODING', 'utf-8'))
 
         super(CsvItemExporter2, self).__init__(*args, **kwargs)
 
+        # Keys of the reports exported so far, and report key -> comparative
+        # item of the same period, which waits until all reports are exported
+        self._report_keys = set()
+        self._comparatives = {}
+
+    def export_item(self, item):
+        # Comparative periods (see EDGAR_COMPARATIVE_PERIODS) are exported
+        # only if there's no report of their own. If several reports compare
+        # with the same period, the one with the smallest accession number is
+        # kept so the output doesn't depend on the crawl order.
+        key = get_report_key(item)
+        if key is None:
+            return super(CsvItemExporter2, self).export_item(item)
+
+        if item.get('comparative'):
+            other = self._comparatives.get(key)
+            if other is None or (item.get('accession') or '') < (other.get('accession') or ''):
+                self._comparatives[key] = item
+            return
+
+        self._report_keys.add(key)
+        return super(CsvItemExporter2, self).export_item(item)
+
+    def finish_exporting(self):
+        for key, item in sorted(self._comparatives.iteritems()):
+            if key not in self._report_keys:
+                super(CsvItemExporter2, self).export_item(item)
+        self._comparatives = {}
+        super(CsvItemExporter2, self).finish_exporting()
+
     def _write_headers_and_set_fields_to_export(self, item):
         # HACK: Override this private method to filter fields that are in
         # fields_to_export but not in item
@@ -0,0 +1,325 @@
+'''
+Load reports from the Financial Statement Data Sets of SEC EDGAR instead of
+crawling XBRL documents one by one.
+
+http://www.sec.gov/dera/data/financial-statement-data-sets.html
+
+Each quarterly zip (e.g., 2014q1.zip) has a sub.txt table of submissions and
+a num.txt table of their numeric facts. Facts are matched to fields with the
+same XPaths and fallback order as ReportItemLoader.fact_xpaths, and the
+values go through the same output processors, so the rows are in the same
+format as the ones crawled by EdgarSpider. The differences come from the data
+sets themselves:
+
+* end_date is the balance sheet date rounded to the nearest month end
+* symbol comes from the file name of the XBRL instance (there's no
+  dei:TradingSymbol) and amend from the form type (there's no
+  dei:AmendmentFlag)
+* only facts without dimensions are included, so values that are only
+  reported for members can't be summed up
+
+'''
+import csv
+import os
+import re
+import zipfile
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from scrapy import log
+
+from pystock_crawler import settings, utils
+from pystock_crawler.exporters import CsvItemExporter2
+from pystock_crawler.loaders import (DATE_FORMAT, IntermediateValue, ReportItemLoader,
+                                     compile_xpath, date_range_matches_doc_type)
+
+
+RE_ZIP_FILENAME = re.compile(r'^\d{4}q[1-4]\.zip$')
+
+# Document types that ReportItemLoader loads
+FORMS = ('10-Q', '10-K', '10-Q/A', '10-K/A')
+
+# FSDS dates look like '20131231'
+FSDS_DATE_FORMAT = '%Y%m%d'
+
+# Length of 'qtrs' in num.txt, used to tell if a duration matches the document type
+DAYS_PER_QUARTER = 91
+
+
+def iter_zip_files(dir_path):
+    '''Generate the paths of quarterly data set zips in `dir_path` in chronological order.'''
+    for filename in sorted(os.listdir(dir_path)):
+        if RE_ZIP_FILENAME.match(filename):
+            yield os.path.join(dir_path, filename)
+
+
+def read_table(zip_file, name):
+    '''
+    Generate the rows of a tab-delimited table in `zip_file` as lists. The
+    first one is the header.
+
+    '''
+    f = zip_file.open(name)
+    try:
+        for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE):
+            yield row
+    finally:
+        f.close()
+
+
+def parse_fsds_date(value):
+    try:
+        return datetime.strptime(value, FSDS_DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+class TagRules(object):
+    '''
+    Map XBRL tags to the entries of ReportItemLoader.fact_xpaths that select
+    them, as (entry index, XPath index) pairs. Tags are looked up once.
+
+    '''
+    def __init__(self, fact_xpaths=ReportItemLoader.fact_xpaths, fields=None):
+        # List of (field_name, compiled XPaths, ignore_date_range)
+        self.entries = []
+        for field_name, xpaths in fact_xpaths:
+            if fields is not None and field_name not in fields:
+                continue
+            compiled = [compile_xpath(xpath) for xpath in xpaths]
+            if None in compiled:
+                raise ValueError('Cannot match %s of %s to tags' % (xpaths, field_name))
+            self.entries.append((field_name, compiled, get_ignore_date_range(field_name)))
+
+        # (prefix, tag) -> list of (entry index, XPath index)
+        self._matches = {}
+
+    def match(self, prefix, tag):
+        '''Return the rules that select `tag`. `prefix` is None for company-specific tags.'''
+        key = (prefix, tag)
+        try:
+            return self._matches[key]
+        except KeyError:
+            pass
+
+        matches = []
+        for entry_index, (__, compiled, __) in enumerate(self.entries):
+            for xpath_index, rule in enumerate(compiled):
+                if rule[0] == 'qname':
+                    selected = rule[1] == prefix and rule[2] == tag
+                else:
+                    selected = rule[1](tag)
+                if selected:
+                    matches.append((entry_index, xpath_index))
+
+        self._matches[key] = matches
+        return matches
+
+
+def get_ignore_date_range(field_name):
+    '''Check if the input processor of the field matches facts of any duration.'''
+    processor = getattr(ReportItemLoader, '%s_in' % field_name)
+    return any(getattr(function, 'ignore_date_range', False) for function in processor.functions)
+
+
+class FsdsItemLoader(ReportItemLoader):
+    '''
+    ReportItemLoader without an XBRL document. Values are added to _values
+    after they've been matched to the report, and go through the output
+    processors of ReportItemLoader.
+
+    '''
+
+
+def load_submissions(zip_file, symbols=None, start_date='', end_date=''):
+    '''
+    Return a dict of adsh (accession number) -> submission of 10-Q and 10-K
+    reports in sub.txt filed between `start_date` and `end_date` (YYYYMMDD).
+
+    '''
+    rows = read_table(zip_file, 'sub.txt')
+    header = rows.next()
+    i_adsh, i_form, i_period, i_fy, i_fp, i_filed, i_instance = [
+        header.index(name) for name in ('adsh', 'form', 'period', 'fy', 'fp', 'filed', 'instance')
+    ]
+
+    submissions = {}
+    for row in rows:
+        form = row[i_form]
+        if form not in FORMS:
+            continue
+
+        filed = row[i_filed]
+        if (start_date and filed < start_date) or (end_date and filed > end_date):
+            continue
+
+        # Same as ReportItemLoader._get_symbol()
+        symbol = row[i_instance].split('-')[0].upper()
+        if symbols and symbol not in symbols:
+            continue
+
+        period = parse_fsds_date(row[i_period])
+        if period is None:
+            continue
+
+        try:
+            fiscal_year = int(row[i_fy])
+        except ValueError:
+            fiscal_year = None
+
+        submissions[row[i_adsh]] = {
+            'symbol': symbol,
+            'doc_type': form.split('/')[0],
+            'amend': form.endswith('/A'),
+            'period': period,
+            'fiscal_year': fiscal_year,
+            'period_focus': row[i_fp].strip().upper() or None
+        }
+
+    return submissions
+
+
+def load_facts(zip_file, submissions, rules):
+    '''
+    Stream num.txt and return a dict of adsh -> list of (entry index, XPath
+    index, IntermediateValue) of the facts that match the submission the way
+    MatchEndDate does.
+
+    '''
+    rows = read_table(zip_file, 'num.txt')
+    header = rows.next()
+    i_adsh, i_tag, i_version, i_coreg, i_ddate, i_qtrs, i_value = [
+        header.index(name) for name in ('adsh', 'tag', 'version', 'coreg', 'ddate', 'qtrs', 'value')
+    ]
+    i_segments = header.index('segments') if 'segments' in header else None
+
+    dates = {}
+    facts = defaultdict(list)
+
+    for row in rows:
+        submission = submissions.get(row[i_adsh])
+        if submission is None or row[i_coreg] or (i_segments is not None and row[i_segments]):
+            continue
+
+        # Company-specific tags have the adsh as version
+        version = row[i_version]
+        prefix = version.split('/')[0] if '/' in version else None
+        matches = rules.match(prefix, row[i_tag])
+        if not matches:
+            continue
+
+        try:
+            date = dates[row[i_ddate]]
+        except KeyError:
+            date = dates[row[i_ddate]] = parse_fsds_date(row[i_ddate])
+        if date is None:
+            continue
+
+        try:
+            qtrs = int(row[i_qtrs])
+            value = float(row[i_value])
+        except ValueError:
+            continue
+
+        start_date = date - timedelta(days=qtrs * DAYS_PER_QUARTER) if qtrs else None
+        facts[row[i_adsh]].extend(
+            match_fact(submission, rules, matches, row[i_tag], value, start_date, date))
+
+    return facts
+
+
+def match_fact(submission, rules, matches, tag, value, start_date, end_date):
+    '''
+    Return (entry index, XPath index, IntermediateValue) of the `matches` of
+    a fact that apply to the submission, the way MatchEndDate does.
+    `start_date` is None if the fact is an instant.
+
+    '''
+    if abs((submission['period'] - end_date).days) >= 30:
+        return []
+
+    if start_date:
+        in_range = date_range_matches_doc_type(submission['doc_type'], start_date, end_date)
+        imd_value = IntermediateValue(tag, value, start_date=start_date, end_date=end_date,
+                                      memberness=0, is_member=False)
+    else:
+        in_range = True
+        imd_value = IntermediateValue(tag, value, instant=end_date, memberness=0, is_member=False)
+
+    return [(entry_index, xpath_index, imd_value) for entry_index, xpath_index in matches
+            if in_range or rules.entries[entry_index][2]]
+
+
+def build_item(submission, facts, rules, fields=None):
+    '''Load a ReportItem from a submission and its matched facts.'''
+    end_date = submission['period'].strftime(DATE_FORMAT)
+    doc_type = submission['doc_type']
+
+    loader = FsdsItemLoader(end_date=end_date, doc_type=doc_type, fields=fields)
+    loader.add_value('symbol', submission['symbol'])
+    loader.add_value('amend', submission['amend'])
+
+    period_focus = 'FY' if doc_type == '10-K' else submission['period_focus']
+    fiscal_year = submission['fiscal_year']
+    if not fiscal_year and period_focus:
+        fiscal_year = loader._guess_fiscal_year(end_date, period_focus)
+
+    loader.add_value('period_focus', period_focus)
+    loader.add_value('fiscal_year', fiscal_year)
+    loader.add_value('end_date', end_date)
+    loader.add_value('doc_type', doc_type)
+
+    # entry index -> XPath index -> values
+    entry_values = defaultdict(lambda: defaultdict(list))
+    for entry_index, xpath_index, imd_value in facts:
+        entry_values[entry_index][xpath_index].append(imd_value)
+
+    # Like add_xpaths(), only the first XPath of an entry that has values counts
+    for entry_index, (field_name, __, __) in enumerate(rules.entries):
+        values = entry_values.get(entry_index)
+        if values:
+            loader._values[field_name].extend(values[min(values)])
+
+    if fields is None or 'dividend' in fields:
+        loader.add_value('dividend', 0.0)
+
+    return loader.load_item()
+
+
+def iter_reports(dir_path, symbols=None, start_date='', end_date='', fields=None):
+    '''Generate ReportItems of all data set zips in `dir_path`.'''
+    rules = TagRules(fields=fields)
+    if symbols:
+        symbols = set(symbol.upper() for symbol in symbols)
+
+    for zip_path in iter_zip_files(dir_path):
+        zip_file = zipfile.ZipFile(zip_path)
+        try:
+            submissions = load_submissions(zip_file, symbols, start_date, end_date)
+            facts = load_facts(zip_file, submissions, rules)
+        finally:
+            zip_file.close()
+
+        log.msg(u'Loaded %d reports from %s' % (len(submissions), zip_path))
+        for adsh in sorted(submissions):
+            yield build_item(submissions[adsh], facts.pop(adsh, ()), rules, fields)
+
+
+def ingest(dir_path, output, symbols=None, start_date='', end_date='', fields=None):
+    '''
+    Write the reports in the data set zips in `dir_path` to `output` as CSV.
+    Return the number of reports written.
+
+    '''
+    num_reports = 0
+    with open(output, 'wb') as f:
+        export_fields = utils.get_export_fields(settings.EXPORT_FIELDS, fields)
+        exporter = CsvItemExporter2(f, fields_to_export=export_fields)
+        exporter.start_exporting()
+        for item in iter_reports(dir_path, symbols, start_date, end_date, fields):
+            exporter.export_item(item)
+            num_reports += 1
+        exporter.finish_exporting()
+
+    log.msg(u'Ingested %d reports from %s' % (num_reports, dir_path))
+    return num_reports
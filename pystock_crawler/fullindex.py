@@ -0,0 +1,153 @@
+'''
+Find 10-Q and 10-K filings in the full index of SEC EDGAR instead of the
+browse pages of each company.
+
+https://www.sec.gov/Archives/edgar/full-index/
+
+The quarterly master.idx, xbrl.idx or form.idx files are read from a local
+mirror of the full index, e.g., full-index/2014/QTR1/master.idx. Every
+filing in them is a line like:
+
+    320193|APPLE INC|10-K|2013-10-30|edgar/data/320193/0001193125-13-416534.txt
+
+The XBRL documents of a filing are in one zip, e.g.,
+edgar/data/320193/000119312513416534/0001193125-13-416534-xbrl.zip, so the
+instance document of a filing is one request away, without going through the
+browse page and the index page of the filing.
+
+Only filings with XBRL have the zip. xbrl.idx lists only those, so it's the
+only index read in a quarter that has it. master.idx and form.idx list all
+filings, so the ones filed before XBRL was phased in (XBRL_START_DATE) are
+skipped. Smaller companies were phased in until mid-2011, so some of their
+filings before that may still have no zip.
+
+'''
+import os
+import re
+
+from collections import defaultdict, namedtuple
+
+
+SEC_ARCHIVES_URL = 'http://www.sec.gov/Archives/'
+
+INDEX_FILENAMES = ('master.idx', 'xbrl.idx', 'form.idx')
+
+# Large accelerated filers had to file XBRL for the periods ended after this
+XBRL_START_DATE = '2009-06-15'
+
+# Document types that ReportItemLoader loads
+FORMS = ('10-Q', '10-K', '10-Q/A', '10-K/A')
+
+# Same as the file names of XML reports that EdgarSpider follows
+RE_INSTANCE_FILENAME = re.compile(r'^[A-Za-z]+\-\d{8}\.xml$')
+
+RE_FILING_FILENAME = re.compile(r'^edgar/data/(\d+)/(\d{10}-\d{2}-\d{6})\.txt$')
+
+
+Filing = namedtuple('Filing', ('cik', 'form', 'date_filed', 'filename'))
+
+
+def iter_index_files(dir_path):
+    '''
+    Generate the paths of all index files under `dir_path`. Only xbrl.idx is
+    taken in a directory that has it.
+
+    '''
+    for root, dirs, filenames in os.walk(dir_path):
+        dirs.sort()
+        if 'xbrl.idx' in filenames:
+            filenames = ['xbrl.idx']
+        for filename in sorted(filenames):
+            if filename in INDEX_FILENAMES:
+                yield os.path.join(root, filename)
+
+
+def parse_index(f):
+    '''
+    Generate Filings in an index file. Both the pipe-delimited master.idx
+    and xbrl.idx and the fixed-width form.idx are supported.
+
+    '''
+    form_width = None
+    body = False
+    for line in f:
+        line = line.rstrip('\r\n')
+        if not body:
+            if line.startswith('Form Type'):
+                form_width = line.index('Company Name')
+            elif line.startswith('-----'):
+                body = True
+            continue
+
+        if form_width is None:
+            values = line.split('|')
+            if len(values) != 5:
+                continue
+            cik, __, form, date_filed, filename = values
+        else:
+            values = line[form_width:].rsplit(None, 3)
+            if len(values) != 4:
+                continue
+            form = line[:form_width].strip()
+            __, cik, date_filed, filename = values
+
+        yield Filing(cik.strip(), form.strip(), date_filed.strip(), filename.strip())
+
+
+def get_xbrl_zip_url(filename):
+    '''
+    URL of the zip of XBRL documents of a filing, given its file name in the
+    index, or None if it's not a file name of a filing.
+
+    '''
+    match = RE_FILING_FILENAME.match(filename)
+    if not match:
+        return None
+    cik, accession = match.groups()
+    return '%sedgar/data/%s/%s/%s-xbrl.zip' % (SEC_ARCHIVES_URL, cik, accession.replace('-', ''),
+                                               accession)
+
+
+class FullIndex(object):
+    '''
+    10-Q and 10-K filings with XBRL in the index files of a directory, by
+    CIK. Only the filings of `ciks` are kept if it's given.
+
+    '''
+    def __init__(self, dir_path, ciks=None, forms=FORMS):
+        self.dir_path = dir_path
+        if ciks is not None:
+            ciks = set(cik.lstrip('0') for cik in ciks)
+
+        # CIK -> set of Filings, the indexes of a quarter may list the same filing
+        self.filings = defaultdict(set)
+
+        for path in iter_index_files(dir_path):
+            with open(path) as f:
+                for filing in parse_index(f):
+                    if filing.form in forms and filing.date_filed >= XBRL_START_DATE and \
+                            (ciks is None or filing.cik in ciks):
+                        self.filings[filing.cik].add(filing)
+
+    def __len__(self):
+        return len(self.filings)
+
+    def get_filings(self, cik, start_date='', end_date=''):
+        '''
+        Return the filings of `cik` filed between `start_date` and `end_date`
+        (YYYYMMDD) in chronological order, or None if `cik` isn't in the index.
+
+        '''
+        cik = cik.lstrip('0')
+        if cik not in self.filings:
+            return None
+
+        filings = []
+        for filing in self.filings[cik]:
+            date_filed = filing.date_filed.replace('-', '')
+            if (start_date and date_filed < start_date) or (end_date and date_filed > end_date):
+                continue
+            filings.append(filing)
+
+        filings.sort(key=lambda a: (a.date_filed, a.filename))
+        return filings
@@ -0,0 +1,448 @@
+'''
+HTTP cache storage that compresses the bodies of responses, and a cache
+policy that knows which pages of SEC EDGAR never change.
+
+XBRL instances are XML documents of several MB, and a cache of all the
+filings of the market takes hundreds of GB with LeveldbCacheStorage. They
+compress very well, e.g., 10-20x with zlib at the lowest level. With the
+zstandard package, bodies can also be compressed with a dictionary trained
+on the XML reports that have been cached, which does better on the tags and
+contexts that all reports share.
+
+Bodies are decompressed when the response is retrieved. Scrapy reads the
+body of every response on its way to the spider anyway, e.g., for the
+downloader/response_bytes stat and the size of the scraper slot.
+
+CompressedSqliteCacheStorage keeps the same entries in SQLite, so that the
+crawls in a working directory can run at the same time.
+
+'''
+import cPickle as pickle
+import os
+import re
+import time
+
+from scrapy import log
+from scrapy.contrib.httpcache import LeveldbCacheStorage, RFC2616Policy, rfc1123_to_epoch
+from scrapy.http import Headers, XmlResponse
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+
+# Classes of URLs in the HTTP cache. Documents of filings and their index
+# pages ('archive') never change once they're published.
+URL_CLASSES = (
+    ('archive', re.compile(r'^https?://[^/]+/Archives/edgar/data/')),
+    ('browse', re.compile(r'^https?://[^/]+/cgi-bin/browse-edgar')),
+    ('nasdaq', re.compile(r'^https?://([^/]+\.)?nasdaq\.com/')),
+    ('yahoo', re.compile(r'^https?://([^/]+\.)?yahoo\.com/'))
+)
+
+# Cache entries are stored under hex fingerprints of requests like
+# LeveldbCacheStorage does. Their metadata, i.e., (url, status, size of the
+# entry, time stored) and the last time it's retrieved, is stored under keys
+# that start with META_PREFIX, so it can be scanned without reading any
+# bodies.
+META_PREFIX = 'meta:'
+
+# Set when every entry in the database has metadata
+INDEXED_KEY = 'meta;indexed'
+
+
+def get_url_class(url):
+    '''Name of the class of `url` in URL_CLASSES, or 'other'.'''
+    for name, regex in URL_CLASSES:
+        if regex.match(url):
+            return name
+    return 'other'
+
+
+def get_meta_key(key):
+    return META_PREFIX + key
+
+
+def get_atime_key(key):
+    return '%s%s:atime' % (META_PREFIX, key)
+
+
+class ZlibCodec(object):
+
+    name = 'zlib'
+
+    dict_id = 0
+
+    def __init__(self, level=None):
+        import zlib
+        self._zlib = zlib
+        self.level = 1 if level is None else level
+
+    def compress(self, data):
+        return self._zlib.compress(data, self.level)
+
+    def decompress(self, data, dict_id=0):
+        return self._zlib.decompress(data)
+
+
+class ZstdCodec(object):
+    '''
+    zstd codec with an optional dictionary. `dict_data` is the content of a
+    dictionary file, e.g., from train_dictionary().
+
+    '''
+    name = 'zstd'
+
+    def __init__(self, level=None, dict_data=None):
+        import zstandard
+        self._zstd = zstandard
+        self.level = 3 if level is None else level
+        self.set_dict(dict_data)
+
+    def set_dict(self, dict_data):
+        if dict_data:
+            self.dict = self._zstd.ZstdCompressionDict(dict_data)
+            self.dict_id = self.dict.dict_id()
+            self._compressor = self._zstd.ZstdCompressor(level=self.level, dict_data=self.dict)
+            self._dict_decompressor = self._zstd.ZstdDecompressor(dict_data=self.dict)
+        else:
+            self.dict = None
+            self.dict_id = 0
+            self._compressor = self._zstd.ZstdCompressor(level=self.level)
+        self._decompressor = self._zstd.ZstdDecompressor()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data, dict_id=0):
+        if not dict_id:
+            return self._decompressor.decompress(data)
+        if dict_id != self.dict_id:
+            raise ValueError('Dictionary %d is not loaded' % dict_id)
+        return self._dict_decompressor.decompress(data)
+
+    def train_dictionary(self, samples, dict_size):
+        return self._zstd.train_dictionary(dict_size, samples).as_bytes()
+
+
+CODECS = {
+    'zlib': ZlibCodec,
+    'zstd': ZstdCodec
+}
+
+
+def get_dict_path(db_path):
+    '''Path of the compression dictionary of a cache database.'''
+    return '%s.dict' % os.path.splitext(db_path.rstrip('/\\'))[0]
+
+
+# (codec name, dictionary path) -> codec, for get_body()
+_codecs = {}
+
+
+def get_body(data, dict_path=None):
+    '''
+    Body of a cache entry stored by CompressedLeveldbCacheStorage or
+    LeveldbCacheStorage. `data` is the unpickled entry and `dict_path` is the
+    compression dictionary of the cache, if any.
+
+    '''
+    codec_name = data.get('codec')
+    if not codec_name:
+        return data['body']
+
+    codec = _codecs.get((codec_name, dict_path))
+    if codec is None:
+        codec = CODECS[codec_name]()
+        if dict_path and isinstance(codec, ZstdCodec):
+            with open(dict_path, 'rb') as f:
+                codec.set_dict(f.read())
+        _codecs[(codec_name, dict_path)] = codec
+    return codec.decompress(data['body'], data.get('dict_id', 0))
+
+
+class CompressedLeveldbCacheStorage(LeveldbCacheStorage):
+    '''
+    LeveldbCacheStorage that compresses response bodies with the codec of
+    HTTPCACHE_COMPRESSION ('zlib' or 'zstd'). Entries stored without
+    compression, e.g., by LeveldbCacheStorage, are still read.
+
+    With 'zstd', bodies are compressed with the dictionary next to the
+    database if there's one, e.g., edgar.dict for edgar.leveldb. If there
+    isn't and HTTPCACHE_COMPRESSION_DICT is set, a dictionary is trained on the
+    first HTTPCACHE_COMPRESSION_DICT_SAMPLES XML responses and saved there.
+    Entries compressed with another dictionary are cache misses.
+
+    The sizes before and after compression and the time spent in the codec
+    are recorded in httpcache/* stats. The metadata of entries is kept for
+    `pystock-crawler cache` (see META_PREFIX). The times entries are
+    retrieved are written in batches, so cache hits don't write, and a
+    read-only cache still serves them.
+
+    '''
+    # Only the beginning of a document is used as a sample to train the
+    # dictionary on. It's where the namespaces and contexts are.
+    SAMPLE_SIZE = 131072
+
+    DB_EXT = '.leveldb'
+
+    # Access times are written every this many cache hits, and at the end
+    ATIME_BATCH_SIZE = 10000
+
+    def __init__(self, settings):
+        # Not LeveldbCacheStorage.__init__(), subclasses may not use leveldb
+        self._leveldb = self._import_db_module()
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.db = None
+
+        codec_cls = CODECS[settings.get('HTTPCACHE_COMPRESSION', 'zlib')]
+        level = settings.get('HTTPCACHE_COMPRESSION_LEVEL')
+        self.codec = codec_cls(None if level is None else int(level))
+
+        # Codecs of entries stored with another HTTPCACHE_COMPRESSION
+        self.codecs = {self.codec.name: self.codec}
+
+        self.use_dict = settings.getbool('HTTPCACHE_COMPRESSION_DICT') and isinstance(self.codec, ZstdCodec)
+        self.dict_size = settings.getint('HTTPCACHE_COMPRESSION_DICT_SIZE', 112640)
+        self.num_dict_samples = settings.getint('HTTPCACHE_COMPRESSION_DICT_SAMPLES', 100)
+        self.dict_path = None
+        self.dict_samples = None
+        self.stats = None
+
+        # Key -> time it's retrieved, not written yet
+        self.atimes = {}
+
+    def open_spider(self, spider):
+        db_path = os.path.join(self.cachedir, spider.name + self.DB_EXT)
+        self.db = self._open_db(db_path)
+        self.stats = spider.crawler.stats
+
+        # All entries of a new database will have metadata
+        if next(self.db.RangeIter(include_value=False), None) is None:
+            self.db.Put(INDEXED_KEY, '1')
+
+        self.dict_path = get_dict_path(db_path)
+        if isinstance(self.codec, ZstdCodec):
+            if os.path.exists(self.dict_path):
+                with open(self.dict_path, 'rb') as f:
+                    self.codec.set_dict(f.read())
+            elif self.use_dict:
+                self.dict_samples = []
+
+    def close_spider(self, spider):
+        stored = self.stats.get_value('httpcache/compressed_bytes')
+        if stored:
+            ratio = float(self.stats.get_value('httpcache/uncompressed_bytes')) / stored
+            self.stats.set_value('httpcache/compression_ratio', round(ratio, 2))
+        self._write_atimes()
+        super(CompressedLeveldbCacheStorage, self).close_spider(spider)
+
+    def retrieve_response(self, spider, request):
+        data = self._read_data(spider, request)
+        if data is None:
+            return  # not cached
+
+        codec_name = data.get('codec')
+        if codec_name:
+            codec = self._get_codec(codec_name)
+            dict_id = data.get('dict_id', 0)
+            if not codec or (dict_id and dict_id != codec.dict_id):
+                return  # can't decompress it here
+
+        self.atimes[self._request_key(request)] = time.time()
+        if len(self.atimes) >= self.ATIME_BATCH_SIZE:
+            self._write_atimes()
+
+        url = data['url']
+        headers = Headers(data['headers'])
+        respcls = responsetypes.from_args(headers=headers, url=url)
+        body = data['body']
+        if codec_name:
+            body = self._decompress(codec, body, dict_id)
+        return respcls(url=url, headers=headers, status=data['status'], body=body)
+
+    def store_response(self, spider, request, response):
+        key = self._request_key(request)
+        data = {
+            'status': response.status,
+            'url': response.url,
+            'headers': dict(response.headers),
+            'body': response.body,
+        }
+
+        # Don't compress bodies that are already compressed, e.g., gzip'ed
+        # ones that HttpCompressionMiddleware decodes after the cache
+        if not response.headers.get('Content-Encoding'):
+            if self.dict_samples is not None and isinstance(response, XmlResponse):
+                self._add_dict_sample(response.body)
+            data['codec'] = self.codec.name
+            data['dict_id'] = self.codec.dict_id
+            data['body'] = self._compress(response.body)
+
+        value = pickle.dumps(data, protocol=2)
+        now = time.time()
+        batch = self._leveldb.WriteBatch()
+        batch.Put('%s_data' % key, value)
+        batch.Put('%s_time' % key, str(now))
+        batch.Put(get_meta_key(key), pickle.dumps((response.url, response.status, len(value), now), protocol=2))
+        batch.Put(get_atime_key(key), repr(now))
+        self.db.Write(batch)
+
+    def _write_atimes(self):
+        if not self.atimes:
+            return
+        batch = self._leveldb.WriteBatch()
+        for key, atime in self.atimes.iteritems():
+            batch.Put(get_atime_key(key), repr(atime))
+        self.atimes = {}
+        try:
+            self.db.Write(batch)
+        except Exception as e:
+            # They only matter to `pystock-crawler cache evict`
+            log.msg('Cannot write access times to the HTTP cache: %s' % e, level=log.WARNING)
+
+    def _import_db_module(self):
+        import leveldb
+        return leveldb
+
+    def _open_db(self, path):
+        return self._leveldb.LevelDB(path)
+
+    def _compress(self, body):
+        start = time.time()
+        data = self.codec.compress(body)
+        if self.stats:
+            self.stats.inc_value('httpcache/compress_time', time.time() - start)
+            self.stats.inc_value('httpcache/uncompressed_bytes', len(body))
+            self.stats.inc_value('httpcache/compressed_bytes', len(data))
+        return data
+
+    def _get_codec(self, name):
+        if name not in self.codecs:
+            try:
+                codec = CODECS[name]()
+            except (KeyError, ImportError):
+                codec = None
+            if isinstance(codec, ZstdCodec) and self.dict_path and os.path.exists(self.dict_path):
+                with open(self.dict_path, 'rb') as f:
+                    codec.set_dict(f.read())
+            self.codecs[name] = codec
+        return self.codecs[name]
+
+    def _decompress(self, codec, data, dict_id):
+        start = time.time()
+        body = codec.decompress(data, dict_id)
+        if self.stats:
+            self.stats.inc_value('httpcache/decompress_time', time.time() - start)
+        return body
+
+    def _add_dict_sample(self, body):
+        self.dict_samples.append(body[:self.SAMPLE_SIZE])
+        if len(self.dict_samples) < self.num_dict_samples:
+            return
+
+        samples = self.dict_samples
+        self.dict_samples = None
+        try:
+            dict_data = self.codec.train_dictionary(samples, self.dict_size)
+        except self.codec._zstd.ZstdError as e:
+            log.msg('Cannot train compression dictionary: %s' % e, level=log.WARNING)
+            return
+
+        # Another process sharing the cache may have saved one first
+        try:
+            fd = os.open(self.dict_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0644)
+        except OSError:
+            with open(self.dict_path, 'rb') as f:
+                self.codec.set_dict(f.read())
+            return
+
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dict_data)
+        self.codec.set_dict(dict_data)
+        log.msg('Saved compression dictionary to %s' % self.dict_path, level=log.INFO)
+
+
+class CompressedSqliteCacheStorage(CompressedLeveldbCacheStorage):
+    '''
+    CompressedLeveldbCacheStorage in SQLite databases, e.g., edgar.sqlite,
+    that many processes can use at the same time (see sqlitekv). A process
+    waits up to HTTPCACHE_SQLITE_TIMEOUT seconds (default: 60) for another
+    one to finish writing.
+
+    `pystock-crawler cache migrate` converts the LevelDB databases.
+
+    '''
+    DB_EXT = '.sqlite'
+
+    def __init__(self, settings):
+        super(CompressedSqliteCacheStorage, self).__init__(settings)
+        self.timeout = settings.getfloat('HTTPCACHE_SQLITE_TIMEOUT', 60)
+
+    def close_spider(self, spider):
+        db = self.db
+        super(CompressedSqliteCacheStorage, self).close_spider(spider)
+        db.close()
+
+    def _import_db_module(self):
+        from pystock_crawler import sqlitekv
+        return sqlitekv
+
+    def _open_db(self, path):
+        return self._leveldb.SqliteDB(path, timeout=self.timeout)
+
+
+class ArchivePolicy(RFC2616Policy):
+    '''
+    Cache policy that serves the documents under /Archives/edgar/data/ from
+    the cache forever without revalidating them. Browse pages of SEC EDGAR
+    and pages of NASDAQ and Yahoo Finance are fresh for HTTPCACHE_BROWSE_TTL,
+    HTTPCACHE_NASDAQ_TTL and HTTPCACHE_YAHOO_TTL seconds (default: one day)
+    after their Date header. Other URLs follow RFC2616Policy.
+
+    Only the responses with status 200 of these URLs are cached, regardless of
+    the Cache-Control headers of the server.
+
+    '''
+    DEFAULT_TTL = 86400
+
+    # TTL of the URLs that never change
+    IMMUTABLE = -1
+
+    # URL classes of the pages that change -> settings of their TTLs
+    TTL_SETTINGS = {
+        'browse': 'HTTPCACHE_BROWSE_TTL',
+        'nasdaq': 'HTTPCACHE_NASDAQ_TTL',
+        'yahoo': 'HTTPCACHE_YAHOO_TTL'
+    }
+
+    def __init__(self, settings):
+        super(ArchivePolicy, self).__init__(settings)
+        self.ttls = dict((url_class, settings.getint(name, self.DEFAULT_TTL))
+                         for url_class, name in self.TTL_SETTINGS.iteritems())
+        self.ttls['archive'] = self.IMMUTABLE
+
+    def get_ttl(self, url):
+        '''TTL of `url` in seconds, IMMUTABLE, or None if it's up to RFC2616Policy.'''
+        return self.ttls.get(get_url_class(url))
+
+    def should_cache_response(self, response, request):
+        if self.get_ttl(request.url) is None:
+            return super(ArchivePolicy, self).should_cache_response(response, request)
+        return response.status == 200
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        ttl = self.get_ttl(request.url)
+        if ttl is None:
+            return super(ArchivePolicy, self).is_cached_response_fresh(cachedresponse, request)
+
+        if 'no-cache' in self._parse_cachecontrol(request):
+            return False
+        if ttl == self.IMMUTABLE:
+            return True
+
+        # A response without a Date header is always stale
+        date = rfc1123_to_epoch(cachedresponse.headers.get('Date'))
+        if date and time.time() - date < ttl:
+            return True
+        self._set_conditional_validators(request, cachedresponse)
+        return False
@@ -43,6 +43,12 @@ class ReportItem(Item):
     cash_flow_inv = Field()
     cash_flow_fin = Field()
 
+    # Accession number of the filing the values come from, and whether they
+    # come from its prior-period (comparative) contexts. Only set when
+    # comparative periods are extracted.
+    accession = Field()
+    comparative = Field()
+
 
 class PriceItem(Item):
     # Trading symbol
@@ -0,0 +1,140 @@
+'''
+Link extractors for the pages of SEC EDGAR that EdgarSpider goes through.
+
+SgmlLinkExtractor parses a whole page and tests every link on it. Browse
+pages list up to 300 filings and index pages list all the exhibits of a
+filing, but only the links in the tables of filings and documents matter.
+EdgarLinkExtractor parses a page with lxml once for all rules and only
+looks at these tables. Pages without them, e.g., a page of an older layout,
+fall back to all links on the page.
+
+'''
+import re
+import urlparse
+
+from lxml import etree, html
+from scrapy.link import Link
+from scrapy.utils.response import get_base_url
+from scrapy.utils.url import canonicalize_url
+
+
+# Browse pages have a "tableFile2" of filings, and index pages have
+# "tableFile"s of documents
+TABLES_XPATH = etree.XPath('//table[contains(concat(" ", normalize-space(@class), " "), " tableFile ") or '
+                           'contains(concat(" ", normalize-space(@class), " "), " tableFile2 ")]')
+
+ROWS_XPATH = etree.XPath('.//tr')
+
+ALL_LINKS_XPATH = etree.XPath('//a[@href]')
+
+# URLs that canonicalize_url() doesn't change, i.e., without query, fragment
+# or characters to escape
+RE_CANONICAL_URL = re.compile(r'^https?://[A-Za-z0-9./_~\-]+$')
+
+
+class PageLink(object):
+
+    __slots__ = ('url', 'text', 'types')
+
+    def __init__(self, url, text, types=()):
+        self.url = url
+        self.text = text
+
+        # Texts in the other cells of the row, e.g., "EX-101.INS" of an instance document
+        self.types = types
+
+
+class URLJoiner(object):
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        parts = urlparse.urlsplit(base_url)
+        self.origin = '%s://%s' % (parts.scheme, parts.netloc)
+
+    def join(self, href):
+        # Most links on SEC EDGAR are like "/Archives/...", which urljoin() would
+        # only append to the scheme and host
+        if href.startswith('/') and not href.startswith('//'):
+            return self.origin + href
+        return urlparse.urljoin(self.base_url, href)
+
+
+def parse_page_links(response):
+    '''Return the PageLinks in the tables of filings and documents of a page.'''
+    try:
+        root = html.fromstring(response.body_as_unicode())
+    except (etree.ParserError, ValueError):
+        return []
+
+    joiner = URLJoiner(get_base_url(response))
+    links = []
+
+    tables = TABLES_XPATH(root)
+    if tables:
+        for table in tables:
+            for row in ROWS_XPATH(table):
+                cells = row.findall('td')
+                types = frozenset((cell.text or '').strip() for cell in cells)
+                for cell in cells:
+                    for a in cell.iterfind('.//a[@href]'):
+                        links.append(PageLink(joiner.join(a.get('href').strip()),
+                                              a.text_content().strip(), types))
+    else:
+        for a in ALL_LINKS_XPATH(root):
+            links.append(PageLink(joiner.join(a.get('href').strip()), a.text_content().strip()))
+
+    return links
+
+
+class PageLinkCache(object):
+    '''
+    Keep the links of the last page, so a page is only parsed once for all
+    the rules of a spider. Each spider has its own.
+
+    '''
+    def __init__(self):
+        self.response = None
+        self.links = None
+
+    def get_links(self, response):
+        if response is not self.response:
+            self.links = parse_page_links(response)
+            self.response = response
+        return self.links
+
+
+class EdgarLinkExtractor(object):
+    '''
+    Extract the links that match `allow` (a regex) in the tables of a page.
+    If some of the links are in rows of `doc_type`, e.g., "EX-101.INS", only
+    these links are extracted. Extractors that share a PageLinkCache parse a
+    page once.
+
+    '''
+    def __init__(self, allow, doc_type=None, cache=None):
+        self.allow = re.compile(allow)
+        self.doc_type = doc_type
+        self.cache = cache or PageLinkCache()
+
+    def extract_links(self, response):
+        page_links = self.cache.get_links(response)
+
+        if self.doc_type:
+            typed_links = [link for link in page_links if self.doc_type in link.types]
+            if typed_links:
+                page_links = typed_links
+
+        seen = set()
+        links = []
+        for page_link in page_links:
+            if not self.allow.search(page_link.url):
+                continue
+            url = page_link.url
+            if not RE_CANONICAL_URL.match(url):
+                url = canonicalize_url(url)
+            if url in seen:
+                continue
+            seen.add(url)
+            links.append(Link(url.encode(response.encoding) if isinstance(url, unicode) else url,
+                              page_link.text))
+        return links
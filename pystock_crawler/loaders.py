@@ -1,9 +1,15 @@
+import copy
+import cStringIO
 import re
+import time
 
+from collections import defaultdict
 from datetime import datetime, timedelta
+from lxml import etree
 from scrapy import log
 from scrapy.contrib.loader import ItemLoader
 from scrapy.contrib.loader.processor import Compose, MapCompose, TakeFirst
+from scrapy.selector import Selector, SelectorList
 from scrapy.utils.misc import arg_to_iter
 from scrapy.utils.python import flatten
 
@@ -14,12 +20,34 @@ DATE_FORMAT = '%Y-%m-%d'
 
 MAX_PER_SHARE_VALUE = 1000.0
 
-# If number of characters of response body exceeds this value,
-# remove some useless text defined by RE_XML_GARBAGE to reduce memory usage
-THRESHOLD_TO_CLEAN = 20000000
+# If number of characters of response body exceeds this value, parse it with
+# StreamingXbrlParser to reduce memory usage
+THRESHOLD_TO_STREAM = 20000000
 
-# Used to get rid of "<tag>LONG STRING...</tag>"
-RE_XML_GARBAGE = re.compile(r'>([^<]{100,})<')
+# Marks an argument that isn't passed
+NO_DEFAULT = object()
+
+# Accession number in the URL of a filing, with or without dashes
+RE_ACCESSION = re.compile(r'/Archives/edgar/data/\d+/(\d{10})-?(\d{2})-?(\d{6})/')
+
+# Namespace of elements such as dei:DocumentType
+RE_DEI_NAMESPACE = re.compile(r'/dei/')
+
+RE_LEADING_SPACE = re.compile(r'\s*')
+
+# Namespace URIs of the prefixes used in loader rules, e.g.,
+# "http://fasb.org/us-gaap/2011-01-31" or "http://xbrl.us/us-gaap/2009-01-31"
+NAMESPACE_PATTERNS = {
+    'xbrli': re.compile(r'^http://www\.xbrl\.org/\d{4}/instance$'),
+    'dei': RE_DEI_NAMESPACE,
+    'us-gaap': re.compile(r'/us-gaap/')
+}
+
+# XPath forms that FactIndex can answer without scanning the document:
+# "//prefix:LocalName" and "//*[<predicate on local-name()>]"
+RE_QNAME_XPATH = re.compile(r'^//([\w\-\.]+):([\w\-\.]+)$')
+RE_PREDICATE_XPATH = re.compile(r'^//\*\[(.+)\]$')
+RE_PREDICATE_TOKEN = re.compile(r'\s*(local-name\(\)|starts-with|contains|not|and|or|[(),=]|"[^"]*"|\'[^\']*\')')
 
 
 class IntermediateValue(object):
@@ -27,33 +55,36 @@ class IntermediateValue(object):
     Intermediate data that serves as output of input processors, i.e., input
     of output processors. "Intermediate" is shorten as "imd" in later naming.
 
+    Only plain values are kept, so the collected values don't hold on to
+    selectors and the lxml tree behind them.
+
     '''
-    def __init__(self, local_name, value, text, context, node=None, start_date=None,
-                 end_date=None, instant=None):
+    __slots__ = ('local_name', 'value', 'decimals', 'element_id', 'context_id', 'start_date',
+                 'end_date', 'instant', 'memberness', 'is_member')
+
+    def __init__(self, local_name, value, decimals=None, element_id=None, context_id=None,
+                 start_date=None, end_date=None, instant=None, memberness=3, is_member=True):
         self.local_name = local_name
         self.value = value
-        self.text = text
-        self.context = context
-        self.node = node
+        self.decimals = decimals
+        self.element_id = element_id
+        self.context_id = context_id
         self.start_date = start_date
         self.end_date = end_date
         self.instant = instant
 
-    def __cmp__(self, other):
-        if self.value < other.value:
-            return -1
-        elif self.value > other.value:
-            return 1
-        return 0
+        # The likelihood that the context is a "member", see compute_memberness()
+        self.memberness = memberness
+        self.is_member = is_member
 
     def __repr__(self):
-        context_id = None
-        if self.context:
-            context_id = self.context.xpath('@id')[0].extract()
-        return '(%s, %s, %s)' % (self.local_name, self.value, context_id)
+        return '(%s, %s, %s)' % (self.local_name, self.value, self.context_id)
 
-    def is_member(self):
-        return is_member(self.context)
+    def copy(self, **kwargs):
+        '''Return a copy with the attributes in `kwargs` replaced.'''
+        attrs = dict((name, getattr(self, name)) for name in self.__slots__)
+        attrs.update(kwargs)
+        return IntermediateValue(**attrs)
 
 
 class ExtractText(object):
@@ -61,7 +92,7 @@ class ExtractText(object):
     def __call__(self, value):
         if hasattr(value, 'select'):
             try:
-                return value.xpath('./text()')[0].extract()
+                return node_text(value)
             except IndexError:
                 return ''
         return unicode(value)
@@ -75,16 +106,31 @@ class MatchEndDate(object):
 
     def __call__(self, value, loader_context):
         if not hasattr(value, 'select'):
-            return IntermediateValue('', 0.0, '0', None)
+            return IntermediateValue('', 0.0)
+
+        # The same fact is often matched by the XPaths of several fields,
+        # so the result is cached per document
+        cache = loader_context.get('match_cache')
+        if cache is None:
+            return self._match(value, loader_context)
 
+        key = (value._root, self.data_type, self.ignore_date_range,
+               loader_context['end_date'], loader_context['doc_type'])
+        try:
+            return cache[key]
+        except KeyError:
+            result = cache[key] = self._match(value, loader_context)
+            return result
+
+    def _match(self, value, loader_context):
         doc_end_date_str = loader_context['end_date']
         doc_type = loader_context['doc_type']
-        selector = loader_context['selector']
+        context_table = loader_context['context_table']
 
-        context_id = value.xpath('@contextRef')[0].extract()
+        context_id = node_attribute(value, 'contextRef')
         try:
-            context = selector.xpath('//*[@id="%s"]' % context_id)[0]
-        except IndexError:
+            context = context_table[context_id]
+        except KeyError:
             try:
                 url = loader_context['response'].url
             except KeyError:
@@ -93,42 +139,31 @@ class MatchEndDate(object):
             return None
 
         date = instant = start_date = end_date = None
-        try:
-            instant = context.xpath('.//*[local-name()="instant"]/text()')[0].extract().strip()
-        except (IndexError, ValueError):
-            try:
-                end_date_str = context.xpath('.//*[local-name()="endDate"]/text()')[0].extract().strip()
-                end_date = datetime.strptime(end_date_str, DATE_FORMAT)
-
-                start_date_str = context.xpath('.//*[local-name()="startDate"]/text()')[0].extract().strip()
-                start_date = datetime.strptime(start_date_str, DATE_FORMAT)
-
-                if self.ignore_date_range or date_range_matches_doc_type(doc_type, start_date, end_date):
-                    date = end_date
-            except (IndexError, ValueError):
-                pass
-        else:
-            try:
-                instant = datetime.strptime(instant, DATE_FORMAT)
-            except ValueError:
-                pass
-            else:
-                date = instant
+        if context.instant:
+            date = instant = context.instant
+        elif context.start_date and context.end_date:
+            start_date = context.start_date
+            end_date = context.end_date
+            if self.ignore_date_range or date_range_matches_doc_type(doc_type, start_date, end_date):
+                date = end_date
 
         if date:
             doc_end_date = datetime.strptime(doc_end_date_str, DATE_FORMAT)
             delta_days = (doc_end_date - date).days
             if abs(delta_days) < 30:
                 try:
-                    text = value.xpath('./text()')[0].extract()
+                    text = node_text(value)
                     val = self.data_type(text)
                 except (IndexError, ValueError):
                     pass
                 else:
-                    local_name = value.xpath('local-name()')[0].extract()
                     return IntermediateValue(
-                        local_name, val, text, context, value,
-                        start_date=start_date, end_date=end_date, instant=instant)
+                        node_local_name(value), val,
+                        decimals=node_attribute(value, 'decimals', None),
+                        element_id=node_attribute(value, 'id', None),
+                        context_id=context.id, start_date=start_date, end_date=end_date,
+                        instant=instant, memberness=context.memberness,
+                        is_member=context.is_member)
 
         return None
 
@@ -142,7 +177,7 @@ class ImdSumMembersOr(object):
         members = []
         non_members = []
         for imd_value in imd_values:
-            if imd_value.is_member():
+            if imd_value.is_member:
                 members.append(imd_value)
             else:
                 non_members.append(imd_value)
@@ -161,6 +196,14 @@ def date_range_matches_doc_type(doc_type, start_date, end_date):
             (doc_type == '10-K' and delta_days < 380 and delta_days > 350))
 
 
+def get_accession(url):
+    '''Accession number in `url` formatted like "0001193125-14-123456", or None.'''
+    match = RE_ACCESSION.search(url)
+    if match:
+        return '-'.join(match.groups())
+    return None
+
+
 def get_amend(values):
     if values:
         return values[0]
@@ -176,18 +219,22 @@ def get_symbol(values):
 
 def imd_max(imd_values):
     if imd_values:
-        imd_value = max(imd_values)
+        imd_value = max(imd_values, key=imd_value_key)
         return imd_value.value
     return None
 
 
 def imd_min(imd_values):
     if imd_values:
-        imd_value = min(imd_values)
+        imd_value = min(imd_values, key=imd_value_key)
         return imd_value.value
     return None
 
 
+def imd_value_key(imd_value):
+    return imd_value.value
+
+
 def imd_sum(imd_values):
     return sum([v.value for v in imd_values])
 
@@ -207,7 +254,7 @@ def imd_get_net_income(imd_values):
 
 
 def imd_get_op_income(imd_values):
-    imd_values = filter(lambda v: memberness(v.context) < 2, imd_values)
+    imd_values = filter(lambda v: v.memberness < 2, imd_values)
     return imd_min(imd_values)
 
 
@@ -237,8 +284,8 @@ def imd_get_per_share_value(imd_values):
     value = v.value
     if abs(value) > MAX_PER_SHARE_VALUE:
         try:
-            decimals = int(v.node.xpath('@decimals')[0].extract())
-        except (AttributeError, IndexError, ValueError):
+            decimals = int(v.decimals)
+        except (TypeError, ValueError):
             return None
         else:
             # HACK: some of LTD's reports have unreasonablely large per share value, such as
@@ -265,66 +312,52 @@ def imd_get_equity(imd_values):
 
 def imd_filter_member(imd_values):
     if imd_values:
-        with_memberness = [(v, memberness(v.context)) for v in imd_values]
-        with_memberness = sorted(with_memberness, cmp=lambda a, b: a[1] - b[1])
-
-        m0 = with_memberness[0][1]
-        non_members = []
-
-        for v in with_memberness:
-            if v[1] == m0:
-                non_members.append(v[0])
-
-        return non_members
+        m0 = min(v.memberness for v in imd_values)
+        return [v for v in imd_values if v.memberness == m0]
 
     return imd_values
 
 
 def imd_mult(imd_values):
+    results = []
     for v in imd_values:
-        try:
-            node_id = v.node.xpath('@id')[0].extract().lower()
-        except (AttributeError, IndexError):
-            pass
-        else:
+        if v.element_id is not None:
+            node_id = v.element_id.lower()
             # HACK: some of LUV's reports have unreasonablely small numbers such as
             # 4136 in revenues which should be 4136 millions, this hack uses id attribute
-            # to determine if it should be scaled up
+            # to determine if it should be scaled up. The values may be shared by
+            # other fields, so they are copied rather than changed in place.
             if 'inmillions' in node_id and abs(v.value) < 100000.0:
-                v.value *= 1000000.0
+                v = v.copy(value=v.value * 1000000.0)
             elif 'inthousands' in node_id and abs(v.value) < 100000000.0:
-                v.value *= 1000.0
-    return imd_values
+                v = v.copy(value=v.value * 1000.0)
+        results.append(v)
+    return results
 
 
-def memberness(context):
-    '''The likelihood that the context is a "member".'''
-    if context:
-        texts = context.xpath('.//*[local-name()="explicitMember"]/text()').extract()
-        text = str(texts).lower()
+def compute_memberness(member_texts):
+    text = str(member_texts).lower()
 
-        if len(texts) > 1:
-            return 2
-        elif 'country' in text:
-            return 2
-        elif 'member' not in text:
-            return 0
-        elif 'successor' in text:
-            # 'SuccessorMember' is a rare case that shouldn't be treated as member
-            return 1
-        elif 'parent' in text:
-            return 2
+    if len(member_texts) > 1:
+        return 2
+    elif 'country' in text:
+        return 2
+    elif 'member' not in text:
+        return 0
+    elif 'successor' in text:
+        # 'SuccessorMember' is a rare case that shouldn't be treated as member
+        return 1
+    elif 'parent' in text:
+        return 2
     return 3
 
 
-def is_member(context):
-    if context:
-        texts = context.xpath('.//*[local-name()="explicitMember"]/text()').extract()
-        text = str(texts).lower()
+def compute_is_member(member_texts):
+    text = str(member_texts).lower()
 
-        # 'SuccessorMember' is a rare case that shouldn't be treated as member
-        if 'member' not in text or 'successor' in text or 'parent' in text:
-            return False
+    # 'SuccessorMember' is a rare case that shouldn't be treated as member
+    if 'member' not in text or 'successor' in text or 'parent' in text:
+        return False
     return True
 
 
@@ -335,32 +368,561 @@ def str_to_bool(value):
     return bool(value)
 
 
-def find_namespace(xxs, name):
-    name_re = name.replace('-', '\-')
-    if not name_re.startswith('xmlns'):
-        name_re = 'xmlns:' + name_re
-    return xxs.re('%s=\"([^\"]+)\"' % name_re)[0]
+def find_namespace(root, name, uris=()):
+    '''
+    Find the namespace URI of prefix `name` ('xmlns' for the default
+    namespace) from the declarations on `root`. If the document uses another
+    prefix for it, look for a URI that matches NAMESPACE_PATTERNS among the
+    declarations and then among `uris`, the namespaces of the elements.
+    Return None if it's not found.
+
+    '''
+    nsmap = root.nsmap
+    ns = nsmap.get(None if name == 'xmlns' else name)
+    if ns:
+        return ns
+
+    pattern = NAMESPACE_PATTERNS.get(name)
+    if pattern:
+        for candidates in (nsmap.itervalues(), uris):
+            matches = sorted(uri for uri in candidates if uri and pattern.search(uri))
+            if matches:
+                return matches[0]
+    return None
+
+
+def register_namespaces(xxs, uris=()):
+    root = getattr(xxs, '_root', None)
+    if root is None or not hasattr(root, 'nsmap'):
+        return
+
+    for name in ('xmlns', 'xbrli', 'dei', 'us-gaap'):
+        ns = find_namespace(root, name, uris)
+        if ns:
+            xxs.register_namespace(name, ns)
+
+
+def split_tag(tag):
+    '''Split an lxml tag like "{uri}LocalName" into (uri, local_name).'''
+    if tag[0] == '{':
+        ns, local_name = tag[1:].split('}', 1)
+        return ns, local_name
+    return None, tag
+
+
+def text_nodes(element):
+    '''Same as element.xpath('./text()') but without going through XPath.'''
+    texts = [element.text]
+    texts.extend(child.tail for child in element)
+    return [text for text in texts if text is not None]
+
+
+def node_attribute(node, name, default=NO_DEFAULT):
+    '''
+    Same as node.xpath('@name')[0].extract() but reads the attribute of the
+    underlying element directly. If there's no such attribute, return
+    `default` or raise IndexError.
+
+    '''
+    element = node._root
+    if isinstance(element, etree._Element):
+        value = element.get(name)
+        if value is not None:
+            return unicode(value)
+    else:
+        values = node.xpath('@%s' % name).extract()
+        if values:
+            return values[0]
+
+    if default is NO_DEFAULT:
+        raise IndexError(name)
+    return default
+
+
+def node_text(node):
+    '''Same as node.xpath('./text()')[0].extract(). Raise IndexError if there's no text.'''
+    return node_texts(node)[0]
+
+
+def node_texts(node):
+    '''Same as node.xpath('./text()').extract().'''
+    element = node._root
+    if not isinstance(element, etree._Element):
+        return node.xpath('./text()').extract()
+    return [unicode(text) for text in text_nodes(element)]
+
+
+def node_local_name(node):
+    '''Same as node.xpath('local-name()')[0].extract().'''
+    element = node._root
+    if not isinstance(element, etree._Element):
+        return node.xpath('local-name()')[0].extract()
+    return unicode(split_tag(element.tag)[1])
+
+
+def parse_date(date_str):
+    '''Parse a YYYY-MM-DD string. Return None if it's not a valid date.'''
+    try:
+        return datetime.strptime(date_str.strip(), DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+def tokenize_predicate(predicate):
+    tokens = []
+    pos = 0
+    predicate = predicate.rstrip()
+    while pos < len(predicate):
+        match = RE_PREDICATE_TOKEN.match(predicate, pos)
+        if not match:
+            raise ValueError('Unsupported predicate: %s' % predicate)
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+class LocalNamePredicateParser(object):
+    '''
+    Compiles XPath predicates that only test local-name(), such as
+    'contains(local-name(), "Revenue") and not(contains(local-name(), "Per"))',
+    into Python functions that take a local name and return a bool.
+
+    Raises ValueError on anything else, so that the caller can fall back to
+    a real XPath evaluation.
+
+    '''
+    def __init__(self, predicate):
+        self.tokens = tokenize_predicate(predicate)
+        self.pos = 0
+
+    def parse(self):
+        func = self._parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError('Unexpected token: %s' % self.tokens[self.pos])
+        return func
+
+    def _peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def _take(self, expected=None):
+        token = self._peek()
+        if token is None or (expected is not None and token != expected):
+            raise ValueError('Expected %s, got %s' % (expected, token))
+        self.pos += 1
+        return token
+
+    def _take_string(self):
+        token = self._take()
+        if token[0] not in '"\'':
+            raise ValueError('Expected string literal, got %s' % token)
+        return token[1:-1]
+
+    def _parse_or(self):
+        funcs = [self._parse_and()]
+        while self._peek() == 'or':
+            self._take()
+            funcs.append(self._parse_and())
+        if len(funcs) == 1:
+            return funcs[0]
+        return lambda name: any(f(name) for f in funcs)
+
+    def _parse_and(self):
+        funcs = [self._parse_unary()]
+        while self._peek() == 'and':
+            self._take()
+            funcs.append(self._parse_unary())
+        if len(funcs) == 1:
+            return funcs[0]
+        return lambda name: all(f(name) for f in funcs)
+
+    def _parse_unary(self):
+        token = self._take()
+        if token == 'not':
+            self._take('(')
+            func = self._parse_or()
+            self._take(')')
+            return lambda name: not func(name)
+        elif token == '(':
+            func = self._parse_or()
+            self._take(')')
+            return func
+        elif token == 'local-name()':
+            self._take('=')
+            text = self._take_string()
+            return lambda name: name == text
+        elif token in ('contains', 'starts-with'):
+            self._take('(')
+            self._take('local-name()')
+            self._take(',')
+            text = self._take_string()
+            self._take(')')
+            if token == 'contains':
+                return lambda name: text in name
+            return lambda name: name.startswith(text)
+        raise ValueError('Unexpected token: %s' % token)
+
+
+# Compiled form of the XPath expressions seen so far, shared across documents
+_compiled_xpaths = {}
+
+# (expression, namespaces) -> etree.XPath, for the expressions FactIndex
+# passes through to lxml
+_xpath_evaluators = {}
+
+
+def get_xpath_evaluator(xpath, namespaces):
+    '''Return a compiled etree.XPath of `xpath` with `namespaces` bound, cached across documents.'''
+    key = (xpath, tuple(sorted(namespaces.iteritems())))
+    try:
+        return _xpath_evaluators[key]
+    except KeyError:
+        pass
+
+    try:
+        evaluator = etree.XPath(xpath, namespaces=namespaces, smart_strings=False)
+    except etree.XPathError:
+        # Same error as Selector.xpath()
+        raise ValueError('Invalid XPath: %s' % xpath)
+
+    _xpath_evaluators[key] = evaluator
+    return evaluator
+
+
+def compile_xpath(xpath):
+    '''
+    Translate an XPath expression into a form FactIndex understands:
+    ('qname', prefix, local_name), ('predicate', func), or None if the
+    expression has to be evaluated by lxml.
+
+    '''
+    try:
+        return _compiled_xpaths[xpath]
+    except KeyError:
+        pass
+
+    compiled = None
+    match = RE_QNAME_XPATH.match(xpath)
+    if match:
+        compiled = ('qname', match.group(1), match.group(2))
+    else:
+        match = RE_PREDICATE_XPATH.match(xpath)
+        if match:
+            try:
+                compiled = ('predicate', LocalNamePredicateParser(match.group(1)).parse())
+            except ValueError:
+                pass
+
+    _compiled_xpaths[xpath] = compiled
+    return compiled
+
+
+class FactIndex(object):
+    '''
+    Walks an XBRL document once and buckets every element by namespace and
+    local name, so that the rule expressions used by the loaders can be
+    answered without a full-document XPath scan per expression.
+
+    Expressions that cannot be answered from the index are passed through to
+    the selector. Results are always in document order, just like XPath.
+    Without a selector, nothing is selected.
+
+    '''
+    def __init__(self, selector):
+        self.selector = selector
 
+        # (namespace, local_name) -> [(position, element), ...]
+        self.elements = defaultdict(list)
 
-def register_namespace(xxs, name):
-    ns = find_namespace(xxs, name)
-    xxs.register_namespace(name, ns)
+        # local_name -> [(namespace, local_name), ...]
+        self.keys_by_local_name = defaultdict(list)
 
+        # query -> SelectorList
+        self._results = {}
+
+        root = getattr(selector, '_root', None)
+        if root is None or not hasattr(root, 'iter'):
+            return
+
+        for position, element in enumerate(root.iter(etree.Element)):
+            key = split_tag(element.tag)
+            bucket = self.elements.get(key)
+            if bucket is None:
+                bucket = self.elements[key] = []
+                self.keys_by_local_name[key[1]].append(key)
+            bucket.append((position, element))
+
+    @property
+    def namespaces(self):
+        '''Namespace URIs of all elements in the document.'''
+        return set(ns for ns, __ in self.elements if ns)
+
+    def iter_local_name(self, local_name):
+        '''Elements with the given local name in any namespace, in document order.'''
+        entries = []
+        for key in self.keys_by_local_name.get(local_name, ()):
+            entries.extend(self.elements[key])
+        entries.sort()
+        return [element for __, element in entries]
+
+    def has_match(self, query):
+        '''Check if `query` selects anything, without building the selectors if possible.'''
+        if self.selector is None:
+            return False
 
-def register_namespaces(xxs):
-    names = ('xmlns', 'xbrli', 'dei', 'us-gaap')
-    for name in names:
         try:
-            register_namespace(xxs, name)
-        except IndexError:
+            return bool(self._results[query])
+        except KeyError:
             pass
 
+        compiled = compile_xpath(query)
+        if compiled is not None:
+            if compiled[0] == 'qname':
+                __, prefix, local_name = compiled
+                ns = self.selector.namespaces.get(prefix)
+                if ns is not None:
+                    return (ns, local_name) in self.elements
+            else:
+                predicate = compiled[1]
+                return any(predicate(local_name) for local_name in self.keys_by_local_name)
+
+        return bool(self.xpath(query))
+
+    def xpath(self, query):
+        '''
+        Elements matched by `query` as a SelectorList. Results are cached, so
+        the same list is returned for the same query and must not be changed.
+        Namespaces must be registered before the first query.
+
+        '''
+        try:
+            return self._results[query]
+        except KeyError:
+            result = self._results[query] = self._xpath(query)
+            return result
+
+    def _xpath(self, query):
+        if self.selector is None:
+            return SelectorList()
+
+        compiled = compile_xpath(query)
+        if compiled is None:
+            return self._evaluate(query)
+
+        if compiled[0] == 'qname':
+            __, prefix, local_name = compiled
+            try:
+                ns = self.selector.namespaces[prefix]
+            except KeyError:
+                # Let lxml complain about the undefined prefix
+                return self._evaluate(query)
+            entries = self.elements.get((ns, local_name), [])
+        else:
+            predicate = compiled[1]
+            entries = []
+            for local_name, keys in self.keys_by_local_name.iteritems():
+                if predicate(local_name):
+                    for key in keys:
+                        entries.extend(self.elements[key])
+            entries.sort()
+
+        return SelectorList([self._make_selector(element, query) for __, element in entries])
+
+    def _evaluate(self, query):
+        '''Evaluate `query` with lxml, like Selector.xpath() but with a precompiled XPath.'''
+        root = getattr(self.selector, '_root', None)
+        if root is None or not hasattr(root, 'iter'):
+            return self.selector.xpath(query)
+
+        evaluator = get_xpath_evaluator(query, self.selector.namespaces)
+        try:
+            result = evaluator(root)
+        except etree.XPathError:
+            raise ValueError('Invalid XPath: %s' % query)
+
+        if not isinstance(result, list):
+            result = [result]
+        return SelectorList([self._make_selector(x, query) for x in result])
+
+    def _make_selector(self, element, query):
+        return self.selector.__class__(_root=element, _expr=query,
+                                       namespaces=self.selector.namespaces,
+                                       type=self.selector.type)
+
+
+class XbrlContext(object):
+    '''
+    Period and explicit dimension members of an XBRL context element.
+
+    Either `instant` or `start_date`/`end_date` is set, depending on the kind
+    of period. A period that can't be parsed leaves all of them as None.
+
+    '''
+    __slots__ = ('id', 'instant', 'start_date', 'end_date', 'members',
+                 'memberness', 'is_member', 'end_date_texts')
+
+    def __init__(self, element):
+        self.id = element.get('id')
+        self.instant = self.start_date = self.end_date = None
+
+        texts = defaultdict(list)
+        for child in element.iterdescendants(etree.Element):
+            local_name = split_tag(child.tag)[1]
+            if local_name in ('instant', 'startDate', 'endDate', 'explicitMember'):
+                texts[local_name].extend(text_nodes(child))
+
+        if texts['instant']:
+            self.instant = parse_date(texts['instant'][0])
+        elif texts['endDate'] and texts['startDate']:
+            end_date = parse_date(texts['endDate'][0])
+            start_date = parse_date(texts['startDate'][0])
+            if start_date and end_date:
+                self.start_date = start_date
+                self.end_date = end_date
+
+        self.members = texts['explicitMember']
+        self.memberness = compute_memberness(self.members)
+        self.is_member = compute_is_member(self.members)
+
+        # Raw endDate texts, which are used to verify document end date
+        self.end_date_texts = texts['endDate']
+
+    def __repr__(self):
+        return '<XbrlContext %s>' % self.id
+
+
+class ContextTable(object):
+    '''
+    Maps context id to XbrlContext. It is built once per document so that
+    facts can be matched to their periods without looking up and parsing the
+    context element over and over.
+
+    '''
+    def __init__(self, fact_index):
+        self.contexts = {}
+
+        # All endDate texts in all contexts
+        self.end_date_texts = set()
+
+        for element in fact_index.iter_local_name('context'):
+            context = XbrlContext(element)
+            self.end_date_texts.update(context.end_date_texts)
+            if context.id is not None and context.id not in self.contexts:
+                self.contexts[context.id] = context
+
+    def __getitem__(self, context_id):
+        return self.contexts[context_id]
+
+
+class StreamingXbrlParser(object):
+    '''
+    Parses an XBRL instance document incrementally and builds a tree that
+    only contains contexts, dei elements, and the facts that any of the given
+    XPath expressions could match. Everything else, e.g., huge text blocks,
+    is dropped as soon as it's parsed, so memory usage grows with the number
+    of facts kept instead of the size of the document.
+
+    Text blocks, e.g., RevenueRecognitionPolicyTextBlock, are dropped even if
+    a substring predicate matches them, unless an expression names them. If
+    any of the expressions can't be decided by local name, nothing else is
+    dropped.
+
+    '''
+    def __init__(self, xpaths):
+        self.local_names = set()
+        self.predicates = []
+        self.keep_all = False
+
+        for xpath in xpaths:
+            compiled = compile_xpath(xpath)
+            if compiled is None:
+                self.keep_all = True
+            elif compiled[0] == 'qname':
+                self.local_names.add(compiled[2])
+            else:
+                self.predicates.append(compiled[1])
+
+        # local_name -> bool
+        self._wanted = {'context': True}
+
+    def parse(self, file_like):
+        '''Return the root element of the pruned tree.'''
+        root = None
+        depth = 0
+
+        # Unwanted elements that have been cleared but not yet removed. The
+        # parser may still hold the last element it ended, so an element is
+        # only removed after one of its next siblings ends.
+        unwanted = []
+
+        events = etree.iterparse(file_like, events=('start', 'end'), recover=True,
+                                 resolve_entities=False, huge_tree=True)
+        try:
+            for event, element in events:
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    depth += 1
+                    continue
+
+                depth -= 1
+                if depth == 1:
+                    for e in unwanted:
+                        root.remove(e)
+                    del unwanted[:]
+
+                    if not self._is_wanted_tree(element):
+                        element.clear()
+                        unwanted.append(element)
+        except etree.XMLSyntaxError as err:
+            log.msg(u'Error while parsing XBRL: %s' % err, log.WARNING)
+
+        for e in unwanted:
+            root.remove(e)
+
+        return root
+
+    def is_wanted(self, element):
+        ns, local_name = split_tag(element.tag)
+        if element.prefix == 'dei' or (ns and RE_DEI_NAMESPACE.search(ns)):
+            return True
+
+        try:
+            return self._wanted[local_name]
+        except KeyError:
+            if local_name in self.local_names:
+                wanted = True
+            elif local_name.endswith('TextBlock'):
+                # The largest elements of a document, and never numbers
+                wanted = False
+            else:
+                wanted = self.keep_all or any(predicate(local_name) for predicate in self.predicates)
+            self._wanted[local_name] = wanted
+            return wanted
+
+    def _is_wanted_tree(self, element):
+        if self.is_wanted(element):
+            return True
+        return any(self.is_wanted(e) for e in element.iterdescendants(etree.Element))
+
 
 class XmlXPathItemLoader(ItemLoader):
 
     def __init__(self, *args, **kwargs):
+        # Field name -> dict of counters, see _get_field_stats()
+        self.field_stats = {}
+
+        # Field name -> XPath that yielded values for a previous document of
+        # the same company. It's updated as the fields are added.
+        self.concept_hints = kwargs.pop('concept_hints', None)
+
+        # Check that concept_hints don't change the result
+        self.verify_concepts = kwargs.pop('verify_concepts', False)
+
         super(XmlXPathItemLoader, self).__init__(*args, **kwargs)
-        register_namespaces(self.selector)
+        self.fact_index = FactIndex(self.selector)
+        register_namespaces(self.selector, self.fact_index.namespaces)
 
     def add_xpath(self, field_name, xpath, *processors, **kw):
         values = self._get_values(xpath, **kw)
@@ -368,16 +930,111 @@ class XmlXPathItemLoader(ItemLoader):
         return len(self._values[field_name])
 
     def add_xpaths(self, name, paths):
-        for path in paths:
-            match_count = self.add_xpath(name, path)
+        '''
+        Add the values of the first XPath in `paths` that yields any value.
+        Multiple calls for the same field are numbered as one list of XPaths
+        in field_stats.
+
+        If concept_hints has an XPath of the field, it's tried first as long
+        as none of the XPaths before it selects anything, so the result is
+        the same as trying them in order.
+
+        '''
+        stats = self._get_field_stats(name)
+        start = time.time()
+        prev_count = len(self._values[name])
+        match_count = 0
+        match_index = None
+
+        # XPaths before the hint are known to select nothing
+        hint = self._get_hint_index(name, paths) if prev_count == 0 else 0
+        if hint:
+            stats['learned'] += 1
+
+        for i in xrange(hint, len(paths)):
+            values = self._get_values(paths[i])
+            stats['evaluated'] += 1
+            stats['candidates'] += len(values)
+
+            self.add_value(name, values)
+            match_count = len(self._values[name])
             if match_count > 0:
-                return match_count
+                if match_count > prev_count:
+                    stats['matched'].append(stats['offset'] + i)
+                    match_index = i
+                break
 
-        return 0
+        if self.concept_hints is not None and match_index is not None and len(paths) > 1:
+            self.concept_hints[name] = paths[match_index]
+
+        if self.verify_concepts and hint:
+            self._verify_hint(name, paths, match_index)
+
+        stats['offset'] += len(paths)
+        stats['time'] += time.time() - start
+        return match_count
+
+    def get_output_value(self, field_name):
+        start = time.time()
+        try:
+            return super(XmlXPathItemLoader, self).get_output_value(field_name)
+        finally:
+            self._get_field_stats(field_name)['output_time'] += time.time() - start
+
+    def _get_hint_index(self, name, paths):
+        '''Index of the hinted XPath of the field if the XPaths before it select nothing, otherwise 0.'''
+        if not self.concept_hints:
+            return 0
+
+        try:
+            index = list(paths).index(self.concept_hints[name])
+        except (KeyError, ValueError):
+            return 0
+
+        for path in paths[:index]:
+            if self.fact_index.has_match(path):
+                return 0
+        return index
+
+    def _verify_hint(self, name, paths, match_index):
+        expected = None
+        for i, path in enumerate(paths):
+            if self._process_input_value(name, self._get_values(path)):
+                expected = i
+                break
+
+        if expected != match_index:
+            self._get_field_stats(name)['mismatches'] += 1
+            try:
+                url = self.context['response'].url
+            except KeyError:
+                url = None
+            log.msg(u'Concept hint of %s changed the result in %s: %s instead of %s' %
+                    (name, url, match_index, expected), log.WARNING)
+
+    def _get_field_stats(self, field_name):
+        try:
+            return self.field_stats[field_name]
+        except KeyError:
+            stats = self.field_stats[field_name] = {
+                'evaluated': 0,     # number of XPaths evaluated by add_xpaths()
+                'candidates': 0,    # number of facts matched by these XPaths
+                'matched': [],      # indexes of the XPaths that yield values
+                'offset': 0,        # index of the next XPath passed to add_xpaths()
+                'learned': 0,       # number of add_xpaths() calls that start with a hint
+                'mismatches': 0,    # number of hints that changed the result, see verify_concepts
+                'time': 0.0,        # seconds spent in add_xpaths() and input processors
+                'output_time': 0.0  # seconds spent in output processors
+            }
+            return stats
 
     def _get_values(self, xpaths, **kw):
         xpaths = arg_to_iter(xpaths)
-        return flatten([self.selector.xpath(xpath) for xpath in xpaths])
+        return flatten([self.fact_index.xpath(xpath) for xpath in xpaths])
+
+    def _get_texts(self, xpath):
+        '''Text nodes of the elements matched by `xpath`, in document order.'''
+        return flatten([node_texts(value) for value in self.fact_index.xpath(xpath)])
 
 
 class ReportItemLoader(XmlXPathItemLoader):
@@ -436,59 +1093,14 @@ class ReportItemLoader(XmlXPathItemLoader):
     cash_flow_fin_in = MapCompose(MatchEndDate(float, True))
     cash_flow_fin_out = Compose(imd_filter_member, imd_mult, imd_get_cash_flow)
 
-    def __init__(self, *args, **kwargs):
-        response = kwargs.get('response')
-        if len(response.body) > THRESHOLD_TO_CLEAN:
-            # Remove some useless text to reduce memory usage
-            body, __ = RE_XML_GARBAGE.subn(lambda m: '><', response.body)
-            response = response.replace(body=body)
-            kwargs['response'] = response
-
-        super(ReportItemLoader, self).__init__(*args, **kwargs)
+    # A comparative period is only loaded if it has all of these fields that
+    # the report has, see load_comparative_items()
+    comparative_fields = ('revenues', 'net_income', 'eps_basic', 'eps_diluted')
 
-        symbol = self._get_symbol()
-        end_date = self._get_doc_end_date()
-        fiscal_year = self._get_doc_fiscal_year()
-        doc_type = self._get_doc_type()
-
-        # ignore document that is not 10-Q or 10-K
-        if not (doc_type and doc_type.split('/')[0] in ('10-Q', '10-K')):
-            return
-
-        # some documents set their amendment flag in DocumentType, e.g., '10-Q/A',
-        # instead of setting it in AmendmentFlag
-        amend = None
-        if doc_type.endswith('/A'):
-            amend = True
-            doc_type = doc_type[0:-2]
-
-        self.context.update({
-            'end_date': end_date,
-            'doc_type': doc_type
-        })
-
-        self.add_xpath('symbol', '//dei:TradingSymbol')
-        self.add_value('symbol', symbol)
-
-        if amend:
-            self.add_value('amend', True)
-        else:
-            self.add_xpath('amend', '//dei:AmendmentFlag')
-
-        if doc_type == '10-K':
-            period_focus = 'FY'
-        else:
-            period_focus = self._get_period_focus(end_date)
-
-        if not fiscal_year and period_focus:
-            fiscal_year = self._guess_fiscal_year(end_date, period_focus)
-
-        self.add_value('period_focus', period_focus)
-        self.add_value('fiscal_year', fiscal_year)
-        self.add_value('end_date', end_date)
-        self.add_value('doc_type', doc_type)
-
-        self.add_xpaths('revenues', [
+    # Rules of the fields that come from XBRL facts. Every entry is passed to
+    # add_xpaths(), i.e., only the first expression that matches counts.
+    fact_xpaths = (
+        ('revenues', (
             '//us-gaap:SalesRevenueNet',
             '//us-gaap:Revenues',
             '//us-gaap:SalesRevenueGoodsNet',
@@ -499,10 +1111,11 @@ class ReportItemLoader(XmlXPathItemLoader):
             '//*[contains(local-name(), "TotalRevenues")]',
             '//*[local-name()="InterestAndDividendIncomeOperating" or local-name()="NoninterestIncome"]',
             '//*[contains(local-name(), "Revenue")]'
-        ])
-        self.add_xpath('revenues', '//us-gaap:FinancialServicesRevenue')
-
-        self.add_xpaths('net_income', [
+        )),
+        ('revenues', (
+            '//us-gaap:FinancialServicesRevenue',
+        )),
+        ('net_income', (
             '//*[contains(local-name(), "NetLossIncome") and contains(local-name(), "Corporation")]',
             '//*[local-name()="NetIncomeLossAvailableToCommonStockholdersBasic" or local-name()="NetIncomeLoss"]',
             '//us-gaap:ProfitLoss',
@@ -510,13 +1123,11 @@ class ReportItemLoader(XmlXPathItemLoader):
             '//*[contains(local-name(), "IncomeLossFromContinuingOperations") and not(contains(local-name(), "Per"))]',
             '//*[contains(local-name(), "NetIncomeLoss")]',
             '//*[starts-with(local-name(), "NetIncomeAttributableTo")]'
-        ])
-
-        self.add_xpaths('op_income', [
-            '//us-gaap:OperatingIncomeLoss'
-        ])
-
-        self.add_xpaths('eps_basic', [
+        )),
+        ('op_income', (
+            '//us-gaap:OperatingIncomeLoss',
+        )),
+        ('eps_basic', (
             '//us-gaap:EarningsPerShareBasic',
             '//us-gaap:IncomeLossFromContinuingOperationsPerBasicShare',
             '//us-gaap:IncomeLossFromContinuingOperationsPerBasicAndDilutedShare',
@@ -532,9 +1143,8 @@ class ReportItemLoader(XmlXPathItemLoader):
             '//us-gaap:NetIncomeLossAvailableToCommonStockholdersBasic',
             '//*[local-name()="NetIncomeLossEPS"]',
             '//*[local-name()="NetLoss"]'
-        ])
-
-        self.add_xpaths('eps_diluted', [
+        )),
+        ('eps_diluted', (
             '//us-gaap:EarningsPerShareDiluted',
             '//us-gaap:IncomeLossFromContinuingOperationsPerDilutedShare',
             '//us-gaap:IncomeLossFromContinuingOperationsPerBasicAndDilutedShare',
@@ -549,31 +1159,23 @@ class ReportItemLoader(XmlXPathItemLoader):
             '//us-gaap:EarningsPerShareBasic',
             '//*[local-name()="NetIncomeLossEPS"]',
             '//*[local-name()="NetLoss"]'
-        ])
-
-        self.add_xpaths('dividend', [
+        )),
+        ('dividend', (
             '//us-gaap:CommonStockDividendsPerShareDeclared',
             '//us-gaap:CommonStockDividendsPerShareCashPaid'
-        ])
-
-        # if dividend isn't found in doc, assume it's 0
-        self.add_value('dividend', 0.0)
-
-        self.add_xpaths('assets', [
+        )),
+        ('assets', (
             '//us-gaap:Assets',
             '//us-gaap:AssetsNet',
             '//us-gaap:LiabilitiesAndStockholdersEquity'
-        ])
-
-        self.add_xpaths('cur_assets', [
-            '//us-gaap:AssetsCurrent'
-        ])
-
-        self.add_xpaths('cur_liab', [
-            '//us-gaap:LiabilitiesCurrent'
-        ])
-
-        self.add_xpaths('equity', [
+        )),
+        ('cur_assets', (
+            '//us-gaap:AssetsCurrent',
+        )),
+        ('cur_liab', (
+            '//us-gaap:LiabilitiesCurrent',
+        )),
+        ('equity', (
             '//*[local-name()="StockholdersEquityIncludingPortionAttributableToNoncontrollingInterest" or local-name()="StockholdersEquity"]',
             '//*[local-name()="TotalCommonShareholdersEquity"]',
             '//*[local-name()="CommonShareholdersEquity"]',
@@ -583,9 +1185,8 @@ class ReportItemLoader(XmlXPathItemLoader):
             '//*[contains(local-name(), "MembersEquityIncludingPortionAttributableToNoncontrollingInterest")]',
             '//us-gaap:CapitalizationLongtermDebtAndEquity',
             '//*[local-name()="TotalCapitalization"]'
-        ])
-
-        self.add_xpaths('cash', [
+        )),
+        ('cash', (
             '//us-gaap:CashCashEquivalentsAndFederalFundsSold',
             '//us-gaap:CashAndDueFromBanks',
             '//us-gaap:CashAndCashEquivalentsAtCarryingValue',
@@ -594,22 +1195,189 @@ class ReportItemLoader(XmlXPathItemLoader):
             '//*[contains(local-name(), "CarryingValueOfCashAndCashEquivalents")]',
             '//*[contains(local-name(), "CashCashEquivalents")]',
             '//*[contains(local-name(), "CashAndCashEquivalents")]'
-        ])
-
-        self.add_xpaths('cash_flow_op', [
+        )),
+        ('cash_flow_op', (
             '//us-gaap:NetCashProvidedByUsedInOperatingActivities',
             '//us-gaap:NetCashProvidedByUsedInOperatingActivitiesContinuingOperations'
-        ])
-
-        self.add_xpaths('cash_flow_inv', [
+        )),
+        ('cash_flow_inv', (
             '//us-gaap:NetCashProvidedByUsedInInvestingActivities',
             '//us-gaap:NetCashProvidedByUsedInInvestingActivitiesContinuingOperations'
-        ])
-
-        self.add_xpaths('cash_flow_fin', [
+        )),
+        ('cash_flow_fin', (
             '//us-gaap:NetCashProvidedByUsedInFinancingActivities',
             '//us-gaap:NetCashProvidedByUsedInFinancingActivitiesContinuingOperations'
-        ])
+        ))
+    )
+
+    def __init__(self, *args, **kwargs):
+        '''
+        Pass streaming=True to parse the response with StreamingXbrlParser.
+        Responses larger than THRESHOLD_TO_STREAM are always streamed.
+
+        Pass a list of field names as `fields` to only extract these fields
+        (and the ones that identify the report, e.g., symbol and end_date).
+
+        Pass comparatives=True to tag the item with accession and comparative
+        fields, see load_comparative_items().
+
+        Without a response or a selector, the loader has no document to
+        extract from, and the caller adds the values, e.g., FsdsItemLoader.
+
+        '''
+        response = kwargs.get('response')
+        streaming = kwargs.pop('streaming', False)
+        fields = kwargs.pop('fields', None)
+        self.fields = set(fields) if fields is not None else None
+        self.comparatives = kwargs.pop('comparatives', False)
+        if response is not None and kwargs.get('selector') is None:
+            if streaming or len(response.body) > THRESHOLD_TO_STREAM:
+                kwargs['selector'] = self.parse_streaming(response.body, self.fields)
+
+        super(ReportItemLoader, self).__init__(*args, **kwargs)
+
+        self.context_table = self.context['context_table'] = ContextTable(self.fact_index)
+        self.context['match_cache'] = {}
+
+        if self.selector is None:
+            return
+
+        symbol = self._get_symbol()
+        end_date = self._get_doc_end_date()
+        fiscal_year = self._get_doc_fiscal_year()
+        doc_type = self._get_doc_type()
+
+        # ignore document that is not 10-Q or 10-K
+        if not (doc_type and doc_type.split('/')[0] in ('10-Q', '10-K')):
+            return
+
+        # some documents set their amendment flag in DocumentType, e.g., '10-Q/A',
+        # instead of setting it in AmendmentFlag
+        amend = None
+        if doc_type.endswith('/A'):
+            amend = True
+            doc_type = doc_type[0:-2]
+
+        self.context.update({
+            'end_date': end_date,
+            'doc_type': doc_type
+        })
+
+        self.add_xpath('symbol', '//dei:TradingSymbol')
+        self.add_value('symbol', symbol)
+
+        if amend:
+            self.add_value('amend', True)
+        else:
+            self.add_xpath('amend', '//dei:AmendmentFlag')
+
+        if doc_type == '10-K':
+            period_focus = 'FY'
+        else:
+            period_focus = self._get_period_focus(end_date)
+
+        if not fiscal_year and period_focus:
+            fiscal_year = self._guess_fiscal_year(end_date, period_focus)
+
+        self.add_value('period_focus', period_focus)
+        self.add_value('fiscal_year', fiscal_year)
+        self.add_value('end_date', end_date)
+        self.add_value('doc_type', doc_type)
+
+        if self.comparatives:
+            self.add_value('accession', get_accession(self.context['response'].url))
+            self.add_value('comparative', False)
+
+        self._add_fact_fields()
+
+    def _add_fact_fields(self):
+        for field_name, xpaths in self.fact_xpaths:
+            if self.fields is None or field_name in self.fields:
+                self.add_xpaths(field_name, xpaths)
+
+        # if dividend isn't found in doc, assume it's 0
+        if self.fields is None or 'dividend' in self.fields:
+            self.add_value('dividend', 0.0)
+
+    def load_comparative_items(self):
+        '''
+        Load the prior periods that the report compares with, e.g., the same
+        quarter of last year in a 10-Q, as ReportItems with comparative=True.
+        Call it after load_item().
+
+        A period is loaded if its duration matches the document type, it
+        ends a whole number of years before the report, and it has all
+        comparative_fields that the report has.
+
+        '''
+        report = self.item
+        required = [field_name for field_name in self.comparative_fields
+                    if report.get(field_name) is not None]
+        fiscal_year = report.get('fiscal_year')
+        if not (required and fiscal_year and report.get('period_focus')):
+            return []
+
+        items = []
+        for end_date, years in self._get_comparative_periods():
+            loader = copy.copy(self)
+            loader.item = self.default_item_class()
+            loader.context = dict(self.context, item=loader.item, end_date=end_date)
+            loader.field_stats = {}
+            loader.concept_hints = None
+            loader.verify_concepts = False
+
+            loader._values = defaultdict(list)
+            for field_name in ('symbol', 'amend', 'period_focus', 'doc_type'):
+                loader._values[field_name] = list(self._values[field_name])
+            loader._values['end_date'] = [end_date]
+            loader._values['fiscal_year'] = [fiscal_year - years]
+            loader._values['accession'] = [get_accession(self.context['response'].url)]
+            loader._values['comparative'] = [True]
+            loader._add_fact_fields()
+
+            item = loader.load_item()
+            if all(item.get(field_name) is not None for field_name in required):
+                items.append(item)
+
+        return items
+
+    def _get_comparative_periods(self):
+        '''Return a sorted list of (end_date, years before the report) of comparative periods.'''
+        doc_type = self.context['doc_type']
+        doc_end_date = datetime.strptime(self.context['end_date'], DATE_FORMAT)
+
+        periods = set()
+        for context in self.context_table.contexts.itervalues():
+            if context.members or not context.end_date:
+                continue
+            if not date_range_matches_doc_type(doc_type, context.start_date, context.end_date):
+                continue
+
+            days = (doc_end_date - context.end_date).days
+            years = int(round(days / 365.25))
+            if years > 0 and abs(days - years * 365.25) < 30:
+                periods.add((context.end_date.strftime(DATE_FORMAT), years))
+
+        return sorted(periods, reverse=True)
+
+    @classmethod
+    def parse_streaming(cls, body, fields=None):
+        '''
+        Parse `body` with StreamingXbrlParser and return a Selector of the
+        result. Only the facts of `fields` are kept if it's given.
+
+        '''
+        xpaths = []
+        for field_name, field_xpaths in cls.fact_xpaths:
+            if fields is None or field_name in fields:
+                xpaths.extend(field_xpaths)
+
+        # cStringIO doesn't copy the string it reads from. Leading whitespace
+        # is skipped, an XML declaration must come first.
+        file_like = cStringIO.StringIO(body)
+        file_like.seek(RE_LEADING_SPACE.match(body).end())
+        root = StreamingXbrlParser(xpaths).parse(file_like)
+        return Selector(_root=root, type='xml')
 
     def _get_symbol(self):
         try:
@@ -620,7 +1388,7 @@ class ReportItemLoader(XmlXPathItemLoader):
 
     def _get_doc_fiscal_year(self):
         try:
-            fiscal_year = self.selector.xpath('//dei:DocumentFiscalYearFocus/text()')[0].extract()
+            fiscal_year = self._get_texts('//dei:DocumentFiscalYearFocus')[0]
             return int(fiscal_year)
         except (IndexError, ValueError):
             return None
@@ -668,12 +1436,12 @@ class ReportItemLoader(XmlXPathItemLoader):
         url_date_str = url_date.strftime(DATE_FORMAT)
 
         try:
-            doc_date_str = self.selector.xpath('//dei:DocumentPeriodEndDate/text()')[0].extract()
+            doc_date_str = self._get_texts('//dei:DocumentPeriodEndDate')[0]
             doc_date = datetime.strptime(doc_date_str, DATE_FORMAT)
         except (IndexError, ValueError):
             return url_date.strftime(DATE_FORMAT)
 
-        context_date_strs = set(self.selector.xpath('//*[local-name()="context"]//*[local-name()="endDate"]/text()').extract())
+        context_date_strs = self.context_table.end_date_texts
 
         date = url_date
         if doc_date_str in context_date_strs:
@@ -683,19 +1451,19 @@ class ReportItemLoader(XmlXPathItemLoader):
 
     def _get_doc_type(self):
         try:
-            return self.selector.xpath('//dei:DocumentType/text()')[0].extract().upper()
+            return self._get_texts('//dei:DocumentType')[0].upper()
         except (IndexError, ValueError):
             return None
 
     def _get_period_focus(self, doc_end_date):
         try:
-            return self.selector.xpath('//dei:DocumentFiscalPeriodFocus/text()')[0].extract().strip().upper()
+            return self._get_texts('//dei:DocumentFiscalPeriodFocus')[0].strip().upper()
         except IndexError:
             pass
 
         try:
             doc_yr = doc_end_date.split('-')[0]
-            yr_end_date = self.selector.xpath('//dei:CurrentFiscalYearEndDate/text()')[0].extract()
+            yr_end_date = self._get_texts('//dei:CurrentFiscalYearEndDate')[0]
             yr_end_date = yr_end_date.replace('--', doc_yr + '-')
         except IndexError:
             return None
@@ -0,0 +1,110 @@
+'''
+Aggregate the field_stats of ReportItemLoader into Scrapy stats, so we can
+see which of the XPaths of each field actually match and how much they cost.
+
+The stats are named like:
+
+    loader/documents                    number of documents
+    loader/<field>/evaluated            number of XPaths evaluated
+    loader/<field>/candidates           number of facts matched by the XPaths
+    loader/<field>/matched/<index>      number of documents matched by the
+                                        <index>th XPath of the field
+    loader/<field>/unmatched            number of documents without the field
+    loader/<field>/learned              number of times a concept hint was used
+    loader/<field>/mismatches           number of concept hints that changed
+                                        the result (EDGAR_CONCEPT_CACHE_VERIFY)
+    loader/<field>/time                 seconds spent on finding values
+    loader/<field>/output_time          seconds spent in output processors
+
+'''
+import json
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from pystock_crawler.loaders import ReportItemLoader
+
+
+PREFIX = 'loader/'
+
+
+def record_field_stats(stats, field_stats, spider=None):
+    '''Add the `field_stats` of a loader to Scrapy `stats`.'''
+    stats.inc_value(PREFIX + 'documents', spider=spider)
+
+    for field_name, field in field_stats.iteritems():
+        prefix = '%s%s/' % (PREFIX, field_name)
+        if field['evaluated']:
+            stats.inc_value(prefix + 'evaluated', field['evaluated'], spider=spider)
+            stats.inc_value(prefix + 'candidates', field['candidates'], spider=spider)
+            stats.inc_value(prefix + 'time', field['time'], spider=spider)
+            for index in field['matched']:
+                stats.inc_value('%smatched/%d' % (prefix, index), spider=spider)
+            if not field['matched']:
+                stats.inc_value(prefix + 'unmatched', spider=spider)
+            for name in ('learned', 'mismatches'):
+                if field[name]:
+                    stats.inc_value(prefix + name, field[name], spider=spider)
+        stats.inc_value(prefix + 'output_time', field['output_time'], spider=spider)
+
+
+def get_field_xpaths(loader_cls=ReportItemLoader):
+    '''Return a dict of field name -> all XPaths of the field, as they are numbered in field_stats.'''
+    field_xpaths = {}
+    for field_name, xpaths in loader_cls.fact_xpaths:
+        field_xpaths.setdefault(field_name, []).extend(xpaths)
+    return field_xpaths
+
+
+def summarize(stats):
+    '''Turn the loader/* values of Scrapy `stats` into a dict per field.'''
+    field_xpaths = get_field_xpaths()
+    summary = {'documents': stats.get(PREFIX + 'documents', 0), 'fields': {}}
+
+    for key, value in stats.iteritems():
+        if not key.startswith(PREFIX) or key.count('/') < 2:
+            continue
+
+        __, field_name, name = key.split('/', 2)
+        field = summary['fields'].setdefault(field_name, {'matched': []})
+
+        if name.startswith('matched/'):
+            index = int(name.split('/')[1])
+            xpaths = field_xpaths.get(field_name, [])
+            field['matched'].append({
+                'index': index,
+                'xpath': xpaths[index] if index < len(xpaths) else None,
+                'count': value
+            })
+        else:
+            field[name] = value
+
+    for field in summary['fields'].itervalues():
+        field['matched'].sort(key=lambda a: a['index'])
+
+    return summary
+
+
+class LoaderStatsDump(object):
+    '''
+    Dump the loader/* stats to the JSON file specified in LOADERSTATS_FILE
+    when the spider is closed.
+
+    '''
+    def __init__(self, crawler):
+        self.filename = crawler.settings.get('LOADERSTATS_FILE')
+        if not (crawler.settings.getbool('LOADERSTATS_ENABLED') and self.filename):
+            raise NotConfigured
+
+        self.stats = crawler.stats
+        crawler.signals.connect(self._spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _spider_closed(self, spider):
+        summary = summarize(self.stats.get_stats(spider))
+        with open(self.filename, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        spider.log('Dumped loader stats to %s' % self.filename)
@@ -0,0 +1,72 @@
+'''
+Run spiders purely from the HTTP cache, e.g., on a host without internet
+access that has a copy of .scrapy/httpcache.
+
+OfflineMiddleware sits right after HttpCacheMiddleware, so only the requests
+that aren't in the cache get to it. They're ignored instead of downloaded,
+counted in offline/miss stats and listed when the spider is closed.
+
+'''
+from scrapy import log, signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+
+
+# Settings of an offline crawl. `pystock-crawler --offline` passes them to
+# Scrapy. Every cached response is fresh, and there's nothing to throttle.
+SETTINGS = (
+    ('OFFLINE_ENABLED', 1),
+    ('HTTPCACHE_ENABLED', 1),
+    ('HTTPCACHE_POLICY', 'scrapy.contrib.httpcache.DummyPolicy'),
+    ('HTTPCACHE_EXPIRATION_SECS', 0),
+    ('CONCURRENT_REQUESTS', 1000),
+    ('CONCURRENT_REQUESTS_PER_DOMAIN', 1000),
+    ('DOWNLOAD_DELAY', 0),
+    ('PASSIVETHROTTLE_ENABLED', 0),
+    ('AUTOTHROTTLE_ENABLED', 0),
+    ('RETRY_ENABLED', 0)
+)
+
+
+class OfflineMiddleware(object):
+    '''
+    Ignore the requests that HttpCacheMiddleware doesn't have a response for
+    when OFFLINE_ENABLED is set. At most OFFLINE_MAX_LISTED of the URLs are
+    listed in the log.
+
+    '''
+    def __init__(self, crawler):
+        if not crawler.settings.getbool('OFFLINE_ENABLED'):
+            raise NotConfigured
+        if not crawler.settings.getbool('HTTPCACHE_ENABLED'):
+            raise NotConfigured('OFFLINE_ENABLED requires HTTPCACHE_ENABLED')
+
+        self.stats = crawler.stats
+        self.max_listed = crawler.settings.getint('OFFLINE_MAX_LISTED', 20)
+        self.missing_urls = []
+        crawler.signals.connect(self._spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_request(self, request, spider):
+        if urlparse_cached(request).scheme not in ('http', 'https'):
+            return None
+
+        self.stats.inc_value('offline/miss', spider=spider)
+        if len(self.missing_urls) < self.max_listed:
+            self.missing_urls.append(request.url)
+        raise IgnoreRequest('Not in the HTTP cache: %s' % request.url)
+
+    def _spider_closed(self, spider):
+        num_missing = self.stats.get_value('offline/miss', 0, spider=spider)
+        if not num_missing:
+            spider.log('Offline: all requests were in the HTTP cache', level=log.INFO)
+            return
+
+        lines = ['Offline: %d requests were not in the HTTP cache:' % num_missing]
+        lines.extend('  %s' % url for url in self.missing_urls)
+        if num_missing > len(self.missing_urls):
+            lines.append('  ... and %d more' % (num_missing - len(self.missing_urls)))
+        spider.log('\n'.join(lines), level=log.WARNING)
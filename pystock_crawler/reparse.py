@@ -0,0 +1,177 @@
+'''
+Re-extract fundamentals from XBRL reports that are already on disk, so that a
+change in loaders.py doesn't require crawling EDGAR all over again.
+
+The source is either a directory of XML reports (e.g. tests/sample_data) or
+the LevelDB or SQLite HTTP cache of the edgar spider (e.g. .scrapy/httpcache).
+
+'''
+import cPickle as pickle
+import multiprocessing
+import os
+import re
+import traceback
+
+from scrapy import log
+
+from pystock_crawler import settings, utils
+from pystock_crawler.cachetool import DB_EXTS, get_db_path, open_db
+from pystock_crawler.concepts import ConceptCache
+from pystock_crawler.exporters import CsvItemExporter2
+from pystock_crawler.httpcache import get_body, get_dict_path
+from pystock_crawler.items import ReportItem
+from pystock_crawler.workers import _init_worker, _parse_report_safely
+
+
+# Same as the URL pattern that EdgarSpider follows to parse_10qk()
+RE_REPORT_URL = re.compile(r'/Archives/edgar/data/[^\"]+/[A-Za-z]+\-\d{8}\.xml$')
+
+RE_REPORT_FILENAME = re.compile(r'[A-Za-z]+\-\d{8}\.xml$')
+
+
+def is_cache_dir(path):
+    '''Check if `path` is a cache database or a directory that contains one.'''
+    if os.path.splitext(path.rstrip('/\\'))[1] in DB_EXTS:
+        return True
+    return any(os.path.exists(os.path.join(path, 'edgar' + ext)) for ext in DB_EXTS)
+
+
+def iter_report_files(dir_path):
+    '''Generate (url, file_path) of all XML reports under `dir_path`.'''
+    for root, dirnames, filenames in os.walk(dir_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if RE_REPORT_FILENAME.search(filename):
+                file_path = os.path.abspath(os.path.join(root, filename))
+                yield 'file://%s' % file_path.replace('\\', '/'), file_path
+
+
+def get_cache_db_path(cache_path):
+    if os.path.splitext(cache_path.rstrip('/\\'))[1] not in DB_EXTS:
+        cache_path = get_db_path(cache_path, 'edgar')
+    return cache_path
+
+
+def iter_cached_reports(cache_path):
+    '''
+    Generate (url, entry) of all XML reports in the HTTP cache. The body of an
+    entry may be compressed, see httpcache.get_body().
+
+    '''
+    db = open_db(get_cache_db_path(cache_path))
+    for key, value in db.RangeIter():
+        if not key.endswith('_data'):
+            continue
+        data = pickle.loads(value)
+        if data['status'] == 200 and RE_REPORT_URL.search(data['url']):
+            yield data['url'], data
+
+
+def iter_jobs(source, streaming=False, concept_cache=None, verify_concepts=False, fields=None,
+              comparatives=False):
+    if is_cache_dir(source):
+        # Bodies are decompressed by the workers
+        dict_path = get_dict_path(get_cache_db_path(source))
+        if not os.path.exists(dict_path):
+            dict_path = None
+        reports = ((url, None, (entry, dict_path)) for url, entry in iter_cached_reports(source))
+    else:
+        reports = ((url, file_path, None) for url, file_path in iter_report_files(source))
+
+    for url, file_path, entry in reports:
+        kwargs = {'streaming': streaming, 'fields': fields, 'comparatives': comparatives}
+        if concept_cache:
+            kwargs['concept_hints'] = dict(concept_cache.get_hints(url))
+            kwargs['verify_concepts'] = verify_concepts
+        yield url, file_path, entry, kwargs
+
+
+def _reparse_job(job):
+    url, file_path, entry, kwargs = job
+    try:
+        if entry is None:
+            with open(file_path, 'rb') as f:
+                body = f.read()
+        else:
+            body = get_body(*entry)
+    except Exception:
+        return url, (False, traceback.format_exc())
+    return url, _parse_report_safely(url, body, kwargs)
+
+
+def reparse(source, output, processes=None, streaming=False, concept_cache_path=None,
+            verify_concepts=False, fields=None, comparatives=False):
+    '''
+    Parse all XML reports in `source` with `processes` processes (default: all
+    CPUs) and write the 10-Q and 10-K reports to `output` as CSV. Return the
+    number of reports written.
+
+    If `fields` is given, only these fields of the reports are extracted and
+    written.
+
+    If `comparatives` is True, the prior periods in the reports are also
+    written unless there's a report of the same period in `source`. They
+    aren't counted in the return value.
+
+    If `concept_cache_path` is given, the XPaths that matched in each company
+    are saved there and tried first in its reports. Jobs are queued ahead of
+    the results, so the hints learned in a run only help the next run.
+
+    '''
+    processes = processes or multiprocessing.cpu_count()
+    log.msg(u'Reparsing %s in %d processes' % (source, processes))
+
+    concept_cache = ConceptCache(concept_cache_path) if concept_cache_path else None
+
+    # Jobs are generated in a thread of the pool, so they read a copy of the
+    # cache as it was before the run while the results update the cache
+    job_concept_cache = ConceptCache(concept_cache_path) if concept_cache_path else None
+
+    num_docs = num_reports = num_comparatives = num_errors = num_mismatches = 0
+
+    pool = multiprocessing.Pool(processes, _init_worker)
+    try:
+        with open(output, 'wb') as f:
+            export_fields = utils.get_export_fields(settings.EXPORT_FIELDS, fields, comparatives)
+            exporter = CsvItemExporter2(f, fields_to_export=export_fields)
+            exporter.start_exporting()
+
+            jobs = iter_jobs(source, streaming, job_concept_cache, verify_concepts, fields, comparatives)
+            results = pool.imap_unordered(_reparse_job, jobs)
+            for url, (ok, value) in results:
+                num_docs += 1
+                if not ok:
+                    num_errors += 1
+                    log.msg(u'Error while parsing %s\n%s' % (url, value), level=log.ERROR)
+                    continue
+
+                item_fields, field_stats, concept_hints, comparative_fields = value
+                if concept_cache:
+                    concept_cache.update(url, concept_hints)
+                    num_mismatches += sum(s['mismatches'] for s in field_stats.itervalues())
+
+                if item_fields.get('doc_type') in ('10-Q', '10-K'):
+                    exporter.export_item(ReportItem(item_fields))
+                    num_reports += 1
+                    for comparative in comparative_fields:
+                        exporter.export_item(ReportItem(comparative))
+                        num_comparatives += 1
+
+            exporter.finish_exporting()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    log.msg(u'Reparsed %d documents: %d reports, %d errors' % (num_docs, num_reports, num_errors))
+    if comparatives:
+        log.msg(u'Found %d comparative periods' % num_comparatives)
+
+    if concept_cache:
+        concept_cache.save()
+        if verify_concepts:
+            log.msg(u'Concept hints changed %d fields' % num_mismatches,
+                    level=log.WARNING if num_mismatches else log.INFO)
+    return num_reports
@@ -25,9 +25,30 @@ FEED_EXPORTERS = {
 
 HTTPCACHE_ENABLED = True
 
-HTTPCACHE_POLICY = 'scrapy.contrib.httpcache.RFC2616Policy'
-
-HTTPCACHE_STORAGE = 'scrapy.contrib.httpcache.LeveldbCacheStorage'
+HTTPCACHE_POLICY = 'pystock_crawler.httpcache.ArchivePolicy'
+
+# Documents under /Archives/edgar/data/ never expire in the HTTP cache. These
+# pages are fresh for the given number of seconds (default: one day).
+#HTTPCACHE_BROWSE_TTL = 86400
+#HTTPCACHE_NASDAQ_TTL = 86400
+#HTTPCACHE_YAHOO_TTL = 86400
+
+HTTPCACHE_STORAGE = 'pystock_crawler.httpcache.CompressedLeveldbCacheStorage'
+
+# Only one crawl at a time can use a LevelDB cache. Crawls in the same working
+# directory can run at the same time with a SQLite cache instead. Convert the
+# existing cache with `pystock-crawler cache migrate` first.
+#HTTPCACHE_STORAGE = 'pystock_crawler.httpcache.CompressedSqliteCacheStorage'
+#HTTPCACHE_SQLITE_TIMEOUT = 60
+
+# Response bodies in the HTTP cache are compressed with zlib by default. Set
+# it to 'zstd' to use the zstandard package instead, which is faster and
+# compresses better. With HTTPCACHE_COMPRESSION_DICT, zstd also uses a
+# dictionary trained on the first XML reports that are cached and saved next to
+# the cache, e.g., .scrapy/httpcache/edgar.dict.
+#HTTPCACHE_COMPRESSION = 'zstd'
+#HTTPCACHE_COMPRESSION_LEVEL = 3
+#HTTPCACHE_COMPRESSION_DICT = True
 
 LOG_LEVEL = 'INFO'
 
@@ -48,10 +69,78 @@ RETRY_TIMES = 4
 
 EXTENSIONS = {
     'scrapy.contrib.throttle.AutoThrottle': None,
-    'pystock_crawler.throttle.PassiveThrottle': 0
+    'pystock_crawler.throttle.PassiveThrottle': 0,
+    'pystock_crawler.loaderstats.LoaderStatsDump': 0
 }
 
 PASSIVETHROTTLE_ENABLED = True
 #PASSIVETHROTTLE_DEBUG = True
 
+DOWNLOADER_MIDDLEWARES = {
+    'pystock_crawler.offline.OfflineMiddleware': 950
+}
+
+# Only use the responses in the HTTP cache and ignore the other requests, see
+# offline.SETTINGS for the rest of the settings of `pystock-crawler --offline`.
+# The URLs of the ignored requests are logged when the spider is closed.
+#OFFLINE_ENABLED = True
+#OFFLINE_MAX_LISTED = 20
+
+# Parse every XBRL document with a streaming parser to reduce memory usage.
+# Documents larger than loaders.THRESHOLD_TO_STREAM are always streamed.
+#EDGAR_STREAMING_PARSER = True
+
+# Parse XBRL documents in a pool of worker processes instead of the reactor
+# thread. Set it to the number of processes, or -1 to use all CPUs. At most
+# EDGAR_PARSE_MAX_PENDING (default: 2 x processes) documents are queued in the
+# pool. Downloading pauses when the responses waiting to be parsed exceed
+# SCRAPER_SLOT_MAX_ACTIVE_SIZE bytes, so raise it along with this setting.
+# A document that isn't parsed in EDGAR_PARSE_TIMEOUT seconds, e.g., because
+# its worker ran out of memory and died, is logged as an error and skipped.
+#EDGAR_PARSE_PROCESSES = -1
+#EDGAR_PARSE_MAX_PENDING = 16
+#EDGAR_PARSE_TIMEOUT = 600
+#SCRAPER_SLOT_MAX_ACTIVE_SIZE = 100000000
+
+# Collect per-field statistics of XBRL parsing (XPaths evaluated, which XPath
+# matches, number of facts and time spent) in loader/* stats, and dump them
+# to LOADERSTATS_FILE as JSON when the spider is closed.
+#LOADERSTATS_ENABLED = True
+#LOADERSTATS_FILE = 'loaderstats.json'
+
+# Remember which XPath of each field matched in the last report of a company
+# and try it first in the next one, as long as the XPaths before it match
+# nothing. Set EDGAR_CONCEPT_CACHE_VERIFY to also parse every field the slow
+# way and log a warning if a hint changes the result.
+#EDGAR_CONCEPT_CACHE = 'concepts.json'
+#EDGAR_CONCEPT_CACHE_VERIFY = True
+
+# Also extract the prior periods that 10-Q and 10-K reports compare with, e.g.,
+# the same quarter of last year. They're tagged with the accession number of
+# the report and comparative=True, and CsvItemExporter2 drops them if the
+# report of the same period is also exported (`pystock-crawler reports` also
+# drops them across batches, see dedupe_comparatives()). With --comparatives,
+# `pystock-crawler reports` and `reparse` add the 'accession' and 'comparative'
+# columns to the output (see utils.get_export_fields()). They're left out of
+# EXPORT_FIELDS when this is only set here.
+#EDGAR_COMPARATIVE_PERIODS = True
+
+# Find the 10-Q and 10-K filings of symbols that are CIKs in a local mirror of
+# the quarterly full index files (master.idx, xbrl.idx or form.idx) under
+# https://www.sec.gov/Archives/edgar/full-index/ and download the XBRL zips of
+# the filings directly. Other symbols still go through the browse pages. Only
+# xbrl.idx is read in a quarter that has it, and filings before XBRL are skipped.
+#EDGAR_FULL_INDEX_DIR = 'full-index'
+
+# Remember the latest report exported for each symbol in this JSON file, and
+# only crawl the filings of a symbol filed after it next time. Filings that
+# have been exported are skipped.
+#EDGAR_STATE_FILE = 'state.json'
+
+# Crawl ticker symbols by their CIKs in this file, which is in the same format
+# as https://www.sec.gov/include/ticker.txt. Symbols that share a CIK, such as
+# dual-class shares, are crawled once and each of them gets the reports. The
+# CIKs of the other symbols are added to the file when they're crawled.
+#EDGAR_CIK_MAP = 'ticker.txt'
+
 DEPTH_STATS_VERBOSE = True
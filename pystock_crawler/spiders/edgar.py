@@ -1,24 +1,65 @@
 import os
+import urlparse
+import zipfile
 
-from scrapy.contrib.linkextractors.sgml import SgmlLinkExtractor
+from collections import OrderedDict
+from cStringIO import StringIO
+from scrapy import log, signals
 from scrapy.contrib.spiders import CrawlSpider, Rule
+from scrapy.http import Request, XmlResponse
 
-from pystock_crawler import utils
-from pystock_crawler.loaders import ReportItemLoader
+from pystock_crawler import loaderstats, utils
+from pystock_crawler.ciks import CikMap, find_cik
+from pystock_crawler.concepts import RE_CIK, ConceptCache
+from pystock_crawler.crawlstate import CrawlState
+from pystock_crawler.fullindex import RE_INSTANCE_FILENAME, FullIndex, get_xbrl_zip_url
+from pystock_crawler.linkextractors import EdgarLinkExtractor, PageLinkCache
+from pystock_crawler.loaders import ReportItemLoader, get_accession
+from pystock_crawler.workers import ReportParserPool
 
 
 class URLGenerator(object):
 
+    # Start crawling each symbol after its last exported report, see CrawlState
+    crawl_state = None
+
+    # Crawl symbols by their CIKs, see CikMap
+    cik_map = None
+
     def __init__(self, symbols, start_date='', end_date='', start=0, count=None):
         end = start + count if count is not None else None
         self.symbols = symbols[start:end]
         self.start_date = start_date
         self.end_date = end_date
+        self._groups = None
 
     def __iter__(self):
+        for key in self.get_groups():
+            yield self.get_url(key)
+
+    def get_groups(self):
+        '''
+        Return an OrderedDict of what to crawl, i.e., a CIK or a symbol, ->
+        the symbols it's for. Symbols that share a CIK are crawled once.
+
+        '''
+        if self._groups is None:
+            self._groups = OrderedDict()
+            for symbol in self.symbols:
+                key = (self.cik_map and self.cik_map.get_cik(symbol)) or symbol
+                self._groups.setdefault(key, []).append(symbol)
+        return self._groups
+
+    def get_url(self, key):
         url = 'http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=%s&type=10-&dateb=%s&datea=%s&owner=exclude&count=300'
-        for symbol in self.symbols:
-            yield (url % (symbol, self.end_date, self.start_date))
+        return url % (key, self.end_date, self.get_start_date(key))
+
+    def get_start_date(self, key):
+        if self.crawl_state:
+            # As early as any of the symbols needs
+            symbols = self.get_groups().get(key, [key])
+            return min(self.crawl_state.get_start_date(symbol, self.start_date) for symbol in symbols)
+        return self.start_date
 
 
 class EdgarSpider(CrawlSpider):
@@ -26,12 +67,41 @@ class EdgarSpider(CrawlSpider):
     name = 'edgar'
     allowed_domains = ['sec.gov']
 
-    rules = (
-        Rule(SgmlLinkExtractor(allow=('/Archives/edgar/data/[^\"]+\-index\.htm',))),
-        Rule(SgmlLinkExtractor(allow=('/Archives/edgar/data/[^\"]+/[A-Za-z]+\-\d{8}\.xml',)), callback='parse_10qk'),
-    )
+    # Parse all XML reports with StreamingXbrlParser, not only the huge ones
+    streaming = False
+
+    # Also extract the prior periods in reports, see EDGAR_COMPARATIVE_PERIODS
+    comparatives = False
+
+    # Worker processes that parse XML reports, see EDGAR_PARSE_PROCESSES
+    parser_pool = None
+
+    # Record the field_stats of loaders in crawler stats, see LOADERSTATS_ENABLED
+    loader_stats = False
+
+    # XPaths that matched in previous reports of each company, see EDGAR_CONCEPT_CACHE
+    concept_cache = None
+    verify_concepts = False
+
+    # Filings of the CIKs in a local mirror of the full index, see EDGAR_FULL_INDEX_DIR
+    full_index = None
+
+    # Reports exported by previous crawls, see EDGAR_STATE_FILE
+    crawl_state = None
+
+    # Ticker symbol -> CIK, see EDGAR_CIK_MAP
+    cik_map = None
 
     def __init__(self, **kwargs):
+        # The rules parse each page once, see PageLinkCache
+        cache = PageLinkCache()
+        self.rules = (
+            Rule(EdgarLinkExtractor(allow='/Archives/edgar/data/[^\"]+\-index\.htm', cache=cache),
+                 process_links='_skip_exported_filings'),
+            Rule(EdgarLinkExtractor(allow='/Archives/edgar/data/[^\"]+/[A-Za-z]+\-\d{8}\.xml', doc_type='EX-101.INS',
+                                    cache=cache),
+                 callback='parse_10qk'),
+        )
         super(EdgarSpider, self).__init__(**kwargs)
 
         symbols_arg = kwargs.get('symbols')
@@ -39,6 +109,9 @@ class EdgarSpider(CrawlSpider):
         end_date = kwargs.get('enddate', '')
         limit_arg = kwargs.get('limit', '')
 
+        # Only extract these fields of the reports
+        self.fields = utils.parse_fields_arg(kwargs.get('fields'))
+
         utils.check_date_arg(start_date, 'startdate')
         utils.check_date_arg(end_date, 'enddate')
         start, count = utils.parse_limit_arg(limit_arg)
@@ -54,11 +127,240 @@ class EdgarSpider(CrawlSpider):
         else:
             self.start_urls = []
 
+    def set_crawler(self, crawler):
+        super(EdgarSpider, self).set_crawler(crawler)
+        self.streaming = crawler.settings.getbool('EDGAR_STREAMING_PARSER')
+        self.loader_stats = crawler.settings.getbool('LOADERSTATS_ENABLED')
+        self.comparatives = crawler.settings.getbool('EDGAR_COMPARATIVE_PERIODS')
+
+        concept_cache_path = crawler.settings.get('EDGAR_CONCEPT_CACHE')
+        if concept_cache_path:
+            self.concept_cache = ConceptCache(concept_cache_path)
+            self.verify_concepts = crawler.settings.getbool('EDGAR_CONCEPT_CACHE_VERIFY')
+            crawler.signals.connect(self._save_concept_cache, signal=signals.spider_closed)
+
+        state_path = crawler.settings.get('EDGAR_STATE_FILE')
+        if state_path:
+            self.crawl_state = CrawlState(state_path)
+            if isinstance(self.start_urls, URLGenerator):
+                self.start_urls.crawl_state = self.crawl_state
+            crawler.signals.connect(self._record_report, signal=signals.item_scraped)
+            crawler.signals.connect(self._save_crawl_state, signal=signals.spider_closed)
+
+        cik_map_path = crawler.settings.get('EDGAR_CIK_MAP')
+        if cik_map_path:
+            self.cik_map = CikMap(cik_map_path)
+            if isinstance(self.start_urls, URLGenerator):
+                self.start_urls.cik_map = self.cik_map
+            crawler.signals.connect(self._save_cik_map, signal=signals.spider_closed)
+
+        full_index_dir = crawler.settings.get('EDGAR_FULL_INDEX_DIR')
+        if full_index_dir and isinstance(self.start_urls, URLGenerator):
+            ciks = [key for key in self.start_urls.get_groups() if key.isdigit()]
+            self.full_index = FullIndex(full_index_dir, ciks)
+            self.log('Found %d of %d CIKs in full index %s' % (
+                len(self.full_index), len(ciks), full_index_dir), level=log.INFO)
+
+        if crawler.settings.getint('EDGAR_PARSE_PROCESSES'):
+            crawler.signals.connect(self._open_parser_pool, signal=signals.spider_opened)
+            crawler.signals.connect(self._close_parser_pool, signal=signals.spider_closed)
+
+    def _open_parser_pool(self, spider):
+        settings = self.crawler.settings
+        processes = settings.getint('EDGAR_PARSE_PROCESSES')
+        max_pending = settings.getint('EDGAR_PARSE_MAX_PENDING')
+        timeout = settings.getint('EDGAR_PARSE_TIMEOUT')
+        self.parser_pool = ReportParserPool(processes if processes > 0 else None, max_pending or None,
+                                            timeout or None)
+        self.log('Parsing XML reports in %d processes' % self.parser_pool.processes, level=log.INFO)
+
+    def _close_parser_pool(self, spider):
+        if self.parser_pool:
+            self.parser_pool.close()
+            self.parser_pool = None
+
+    def _save_concept_cache(self, spider):
+        self.concept_cache.save()
+        self.log('Saved concept cache to %s' % self.concept_cache.path, level=log.INFO)
+
+    def _record_report(self, item, response, spider):
+        '''
+        Record an exported report in the crawl state. Reports are recorded
+        only once they are scraped, so the dropped ones are crawled again.
+
+        '''
+        if item.get('comparative'):
+            return
+
+        # Keyed by the symbols that were requested, a report's own symbol may
+        # differ from them, e.g., "BRK-A" vs "BRK.A"
+        accession = get_accession(response.url)
+        symbols = [symbol.upper() for symbol in self._get_requested_symbols(response) or []]
+        symbol = (item.get('symbol') or '').upper()
+        if symbol in symbols or not symbols:
+            symbols = [symbol]
+        for symbol in symbols:
+            self.crawl_state.add_report(item, accession, symbol)
+
+    def _save_crawl_state(self, spider):
+        self.crawl_state.save()
+        self.log('Saved crawl state to %s' % self.crawl_state.path, level=log.INFO)
+
+    def _save_cik_map(self, spider):
+        self.cik_map.save()
+        self.log('Saved CIK map to %s' % self.cik_map.path, level=log.INFO)
+
+    def _skip_exported_filings(self, links):
+        if not self.crawl_state:
+            return links
+        return [link for link in links if not self.crawl_state.is_exported(get_accession(link.url))]
+
+    def start_requests(self):
+        if not isinstance(self.start_urls, URLGenerator):
+            return super(EdgarSpider, self).start_requests()
+        if self.full_index is None:
+            return self._iter_browse_requests()
+        return self._iter_full_index_requests()
+
+    def _iter_browse_requests(self):
+        for key in self.start_urls.get_groups():
+            yield self._make_browse_request(key)
+
+    def _make_browse_request(self, key):
+        # The requested symbols are passed on to the reports, see _requests_to_follow()
+        request = self.make_requests_from_url(self.start_urls.get_url(key))
+        request.meta['symbols'] = self.start_urls.get_groups()[key]
+        return request
+
+    def _iter_full_index_requests(self):
+        urls = self.start_urls
+        for key, symbols in urls.get_groups().iteritems():
+            filings = self.full_index.get_filings(key, urls.get_start_date(key), urls.end_date)
+            if filings is None:
+                # Not a CIK in the index, find its reports on the browse page
+                yield self._make_browse_request(key)
+                continue
+
+            for filing in filings:
+                url = get_xbrl_zip_url(filing.filename)
+                if url and not (self.crawl_state and self.crawl_state.is_exported(get_accession(url))):
+                    yield Request(url, callback=self.parse_xbrl_zip, meta={'symbols': symbols})
+
+    def _requests_to_follow(self, response):
+        symbols = self._get_requested_symbols(response)
+        for request in super(EdgarSpider, self)._requests_to_follow(response):
+            if symbols is not None:
+                request.meta['symbols'] = symbols
+            yield request
+
+    def parse_xbrl_zip(self, response):
+        '''Parse the XML report in a zip of the XBRL documents of a filing.'''
+        try:
+            zip_file = zipfile.ZipFile(StringIO(response.body))
+            names = [name for name in zip_file.namelist() if RE_INSTANCE_FILENAME.match(name)]
+        except zipfile.BadZipfile:
+            names = []
+        if len(names) != 1:
+            self.log('Cannot find XML report in %s' % response.url, level=log.WARNING)
+            return None
+
+        # As if the report were downloaded from the directory of the filing
+        url = '%s/%s' % (response.url.rsplit('/', 1)[0], names[0])
+        return self.parse_10qk(XmlResponse(url, body=zip_file.read(names[0])))
+
+    def parse_start_url(self, response):
+        '''Remember the CIK of the symbol on a browse page.'''
+        if self.cik_map:
+            query = urlparse.parse_qs(urlparse.urlparse(response.url).query)
+            symbol = query.get('CIK', [''])[0]
+            if symbol and self.cik_map.get_cik(symbol) is None:
+                cik = find_cik(response.body)
+                if cik:
+                    self.cik_map.add(symbol, cik)
+        return []
+
+    def _response_downloaded(self, response):
+        # HACK: CrawlSpider iterates over the output of rule callbacks, so the
+        # Deferred returned by parse_10qk() has to bypass it
+        rule = self._rules[response.meta['rule']]
+        if self.parser_pool and rule.callback == self.parse_10qk:
+            return self.parse_10qk(response)
+        return super(EdgarSpider, self)._response_downloaded(response)
+
     def parse_10qk(self, response):
-        '''Parse 10-Q or 10-K XML report.'''
-        loader = ReportItemLoader(response=response)
+        '''
+        Parse 10-Q or 10-K XML report. Return a Deferred instead of the item if
+        it's parsed by the process pool. Return a list of items if comparative
+        periods are extracted.
+
+        '''
+        concept_hints = None
+        if self.concept_cache:
+            concept_hints = self.concept_cache.get_hints(response.url)
+
+        if self.parser_pool:
+            # Workers can't update the cache, so they get a copy of the hints
+            # and the updated ones are merged back
+            if concept_hints is not None:
+                concept_hints = dict(concept_hints)
+            d = self.parser_pool.parse(response, streaming=self.streaming, fields=self.fields,
+                                       comparatives=self.comparatives, concept_hints=concept_hints,
+                                       verify_concepts=self.verify_concepts)
+            d.addCallback(lambda result: self._process_report(*result, url=response.url))
+            return d
+
+        loader = ReportItemLoader(response=response, streaming=self.streaming, fields=self.fields,
+                                  comparatives=self.comparatives, concept_hints=concept_hints,
+                                  verify_concepts=self.verify_concepts)
         item = loader.load_item()
+        comparatives = loader.load_comparative_items() if self.comparatives else []
+        return self._process_report(item, loader.field_stats, comparatives=comparatives,
+                                    url=response.url)
+
+    def _process_report(self, item, field_stats, concept_hints=None, comparatives=(), url=None):
+        if self.concept_cache and concept_hints:
+            self.concept_cache.update(url, concept_hints)
+        if self.loader_stats:
+            loaderstats.record_field_stats(self.crawler.stats, field_stats, self)
+
+        item = self._filter_report(item)
+        if not item:
+            return None
+
+        items = [item]
+        symbols = self._get_symbols(url)
+        if symbols:
+            # All the symbols of the company get the reports
+            items = [self._copy_item(item, symbol) for symbol in symbols]
+            comparatives = [self._copy_item(comparative, symbol)
+                            for symbol in symbols for comparative in comparatives]
+
+        if comparatives:
+            return items + list(comparatives)
+        return items[0] if len(items) == 1 else items
+
+    def _get_requested_symbols(self, response):
+        '''Symbols in the start request that `response` was crawled from, or None.'''
+        if response.request is None:
+            return None
+        return response.meta.get('symbols')
+
+    def _get_symbols(self, url):
+        '''Ticker symbols that are crawled by the CIK of the report at `url`.'''
+        if not (self.cik_map and url and isinstance(self.start_urls, URLGenerator)):
+            return None
+        match = RE_CIK.search(url)
+        if not match:
+            return None
+        symbols = self.start_urls.get_groups().get(match.group(1), [])
+        return [symbol.upper() for symbol in symbols if not symbol.isdigit()]
+
+    def _copy_item(self, item, symbol):
+        item = item.copy()
+        item['symbol'] = symbol
+        return item
 
+    def _filter_report(self, item):
         if 'doc_type' in item:
             doc_type = item['doc_type']
             if doc_type in ('10-Q', '10-K'):
@@ -0,0 +1,102 @@
+'''
+Key-value store in SQLite with the part of py-leveldb's API that the HTTP
+cache uses, so CompressedSqliteCacheStorage and `pystock-crawler cache` work
+on it the same way as on LevelDB.
+
+LevelDB locks a database for one process. A SQLite database in WAL mode can
+be read by many processes while another one writes to it, e.g.,
+`pystock-crawler prices` and `reports` in the same working directory.
+Writes are serialized, a writer waits up to `timeout` seconds for the lock.
+
+'''
+import os
+import sqlite3
+
+
+# Number of rows RangeIter() reads at a time. Rows are read in pages so that
+# no statement is left open while the caller writes.
+PAGE_SIZE = 1000
+
+
+class WriteBatch(object):
+
+    def __init__(self):
+        # (key, value), value is None to delete the key
+        self.ops = []
+
+    def Put(self, key, value):
+        self.ops.append((key, value))
+
+    def Delete(self, key):
+        self.ops.append((key, None))
+
+
+class SqliteDB(object):
+
+    def __init__(self, path, create_if_missing=True, timeout=60):
+        if not create_if_missing and not os.path.exists(path):
+            raise IOError('No such database: %s' % path)
+
+        # Transactions are started explicitly, see Write()
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.text_factory = str
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB) WITHOUT ROWID')
+
+    def close(self):
+        self.conn.close()
+
+    def Get(self, key, default=KeyError):
+        row = self.conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            if default is KeyError:
+                raise KeyError(key)
+            return default
+        return str(row[0])
+
+    def Put(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO kv VALUES (?, ?)', (key, buffer(value)))
+
+    def Delete(self, key):
+        self.conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def Write(self, batch):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for key, value in batch.ops:
+                if value is None:
+                    self.Delete(key)
+                else:
+                    self.Put(key, value)
+        except:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def RangeIter(self, key_from=None, key_to=None, include_value=True):
+        '''Generate the keys (and values) from `key_from` to `key_to` inclusive in order.'''
+        columns = 'key, value' if include_value else 'key'
+        where = 'key >= ?'
+        last_key = key_from or ''
+        while True:
+            args = [last_key]
+            sql = 'SELECT %s FROM kv WHERE %s' % (columns, where)
+            if key_to is not None:
+                sql += ' AND key <= ?'
+                args.append(key_to)
+            rows = self.conn.execute(sql + ' ORDER BY key LIMIT %d' % PAGE_SIZE, args).fetchall()
+            for row in rows:
+                if include_value:
+                    yield row[0], str(row[1])
+                else:
+                    yield row[0]
+            if len(rows) < PAGE_SIZE:
+                return
+            last_key = rows[-1][0]
+            where = 'key > ?'
+
+    def CompactRange(self):
+        '''Give the space of deleted entries back to the disk.'''
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.conn.execute('VACUUM')
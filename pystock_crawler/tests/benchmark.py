@@ -0,0 +1,194 @@
+'''
+Benchmark ReportItemLoader over the XML reports in tests/sample_data (run
+py.test once to download them) or any other directory. Run it with
+`python -m pystock_crawler.tests.benchmark`.
+
+Usage:
+  benchmark [<dir>] [-b BASELINE] [--save] [-n REPEAT] [-t TOLERANCE]
+            [--top N] [--streaming]
+  benchmark (-h | --help)
+
+Options:
+  -h --help     Show this screen
+  -b BASELINE   Baseline file [default: benchmark_baseline.json]
+  --save        Save the result as the new baseline
+  -n REPEAT     Parse each document REPEAT times and keep the fastest [default: 1]
+  -t TOLERANCE  Allowed slowdown before it's reported as a regression [default: 0.2]
+  --top N       Number of documents and fields to list [default: 10]
+  --streaming   Parse all documents with the streaming parser
+
+Exit status is 1 if the total time or the peak memory regressed by more than
+TOLERANCE, or if any document produced a different item, compared with the
+baseline.
+
+'''
+import json
+import os
+import resource
+import sys
+
+from collections import defaultdict
+from docopt import docopt
+from scrapy.http import XmlResponse
+from timeit import default_timer
+
+from pystock_crawler.loaders import ReportItemLoader
+from pystock_crawler.reparse import iter_report_files
+from pystock_crawler.tests.base import SAMPLE_DATA_DIR
+
+
+OTHER_FIELD = '(other)'
+
+
+def get_peak_rss():
+    '''Peak resident set size of this process in KB.'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024  # Bytes on OS X
+    return peak
+
+
+def benchmark_document(url, body, repeat=1, streaming=False):
+    '''Parse a document `repeat` times. Return (seconds, field_times, item) of the fastest run.'''
+    best = None
+    for __ in xrange(repeat):
+        response = XmlResponse(url, body=body)
+        start = default_timer()
+        loader = ReportItemLoader(response=response, streaming=streaming)
+        item = loader.load_item()
+        seconds = default_timer() - start
+        if best is None or seconds < best[0]:
+            field_times = {}
+            for field_name, stats in loader.field_stats.iteritems():
+                field_times[field_name] = stats['time'] + stats['output_time']
+            field_times[OTHER_FIELD] = seconds - sum(field_times.itervalues())
+            best = (seconds, field_times, dict(item))
+    return best
+
+
+def run(dir_path, repeat=1, streaming=False):
+    documents = {}
+    fields = defaultdict(float)
+    num_bytes = 0
+    total_time = 0.0
+
+    for url, file_path in iter_report_files(dir_path):
+        with open(file_path, 'rb') as f:
+            body = f.read()
+        if not body:
+            continue  # Failed download
+
+        seconds, field_times, item = benchmark_document(url, body, repeat, streaming)
+        documents[os.path.relpath(file_path, dir_path)] = {
+            'bytes': len(body),
+            'time': seconds,
+            'item': item
+        }
+        for field_name, field_time in field_times.iteritems():
+            fields[field_name] += field_time
+        num_bytes += len(body)
+        total_time += seconds
+
+    return {
+        'documents': documents,
+        'fields': fields,
+        'num_docs': len(documents),
+        'bytes': num_bytes,
+        'time': total_time,
+        'docs_per_sec': len(documents) / total_time if total_time else 0.0,
+        'mb_per_sec': num_bytes / 1048576.0 / total_time if total_time else 0.0,
+        'peak_rss': get_peak_rss()
+    }
+
+
+def change(value, base_value):
+    if not base_value:
+        return None
+    return (value - base_value) / float(base_value)
+
+
+def format_change(value, base_value):
+    ratio = change(value, base_value)
+    if ratio is None:
+        return ''
+    return '%+.1f%%' % (ratio * 100)
+
+
+def compare(result, baseline, tolerance):
+    '''Return a list of regressions in `result` compared with `baseline`.'''
+    regressions = []
+
+    for key in ('time', 'peak_rss'):
+        ratio = change(result[key], baseline.get(key))
+        if ratio is not None and ratio > tolerance:
+            regressions.append('%s: %s -> %s (%+.1f%%)' % (key, baseline[key], result[key], ratio * 100))
+
+    base_docs = baseline.get('documents', {})
+    for name, doc in sorted(result['documents'].iteritems()):
+        base_doc = base_docs.get(name)
+        if base_doc and base_doc['item'] != doc['item']:
+            regressions.append('%s: item changed' % name)
+
+    return regressions
+
+
+def print_report(result, baseline, top):
+    base_docs = baseline.get('documents', {})
+    base_fields = baseline.get('fields', {})
+
+    print 'Documents:   %d (%.1f MB)' % (result['num_docs'], result['bytes'] / 1048576.0)
+    print 'Total time:  %.3f s %s' % (result['time'], format_change(result['time'], baseline.get('time')))
+    print 'Throughput:  %.2f docs/s, %.2f MB/s' % (result['docs_per_sec'], result['mb_per_sec'])
+    print 'Peak memory: %d KB %s' % (result['peak_rss'], format_change(result['peak_rss'], baseline.get('peak_rss')))
+
+    print
+    print 'Slowest documents:'
+    docs = sorted(result['documents'].iteritems(), key=lambda a: a[1]['time'], reverse=True)
+    for name, doc in docs[:top]:
+        base_time = base_docs.get(name, {}).get('time')
+        print '  %8.3f s %8s  %s' % (doc['time'], format_change(doc['time'], base_time), name)
+
+    print
+    print 'Slowest fields:'
+    fields = sorted(result['fields'].iteritems(), key=lambda a: a[1], reverse=True)
+    for name, seconds in fields[:top]:
+        print '  %8.3f s %8s  %s' % (seconds, format_change(seconds, base_fields.get(name)), name)
+
+
+def main():
+    args = docopt(__doc__)
+    dir_path = args['<dir>'] or SAMPLE_DATA_DIR
+    baseline_path = args['-b']
+    tolerance = float(args['-t'])
+
+    result = run(dir_path, int(args['-n']), args['--streaming'])
+    if not result['num_docs']:
+        sys.stderr.write('No XML reports in %s\n' % dir_path)
+        return 1
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    print_report(result, baseline, int(args['--top']))
+
+    if args['--save']:
+        with open(baseline_path, 'w') as f:
+            json.dump(result, f, indent=1, sort_keys=True)
+        print
+        print 'Saved baseline to %s' % baseline_path
+        return 0
+
+    regressions = compare(result, baseline, tolerance)
+    if regressions:
+        print
+        print 'Regressions:'
+        for regression in regressions:
+            print '  %s' % regression
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
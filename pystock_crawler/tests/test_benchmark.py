@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+
+from pystock_crawler.tests import benchmark
+from pystock_crawler.tests.base import TestCaseBase
+from pystock_crawler.tests.test_workers import BODY
+
+
+class BenchmarkTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        for filename, body in (('abc-20130630.xml', BODY), ('empty-20130630.xml', '')):
+            with open(os.path.join(self.dir_path, filename), 'w') as f:
+                f.write(body)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_run(self):
+        result = benchmark.run(self.dir_path, repeat=2)
+        self.assertEqual(result['num_docs'], 1)
+        self.assertEqual(result['bytes'], len(BODY))
+        self.assertGreater(result['time'], 0)
+        self.assertGreater(result['docs_per_sec'], 0)
+        self.assertGreater(result['peak_rss'], 0)
+
+        doc = result['documents']['abc-20130630.xml']
+        self.assertEqual(doc['item']['revenues'], 100.0)
+        self.assertIn('revenues', result['fields'])
+        self.assertIn(benchmark.OTHER_FIELD, result['fields'])
+        self.assertAlmostEqual(sum(result['fields'].values()), result['time'])
+
+    def test_compare(self):
+        result = benchmark.run(self.dir_path)
+        self.assertEqual(benchmark.compare(result, {}, 0.2), [])
+        self.assertEqual(benchmark.compare(result, result, 0.2), [])
+
+        baseline = dict(result, time=result['time'] / 2, peak_rss=result['peak_rss'])
+        regressions = benchmark.compare(result, baseline, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('time:'))
+
+        doc = result['documents']['abc-20130630.xml']
+        baseline['documents'] = {
+            'abc-20130630.xml': dict(doc, item=dict(doc['item'], revenues=200.0))
+        }
+        regressions = benchmark.compare(result, baseline, 1.5)
+        self.assertEqual(regressions, ['abc-20130630.xml: item changed'])
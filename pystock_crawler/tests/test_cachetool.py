@@ -0,0 +1,201 @@
+import os
+import shutil
+import tempfile
+import time
+
+from scrapy.contrib.httpcache import LeveldbCacheStorage
+from scrapy.http import HtmlResponse, Request, TextResponse, XmlResponse
+from scrapy.spider import Spider
+from scrapy.utils.test import get_crawler
+
+from pystock_crawler import cachetool
+from pystock_crawler.ciks import CikMap
+from pystock_crawler.httpcache import CompressedLeveldbCacheStorage, CompressedSqliteCacheStorage, get_body
+from pystock_crawler.tests.base import TestCaseBase
+
+
+BROWSE_URL = 'http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=%s&type=10-&dateb=&datea=&owner=exclude&count=300'
+
+BROWSE_BODY = '<a href="/cgi-bin/browse-edgar?action=getcompany&amp;CIK=%010d&amp;type=10-Q">10-Q</a>'
+
+REPORT_URL = 'http://www.sec.gov/Archives/edgar/data/%d/0001/%s-20130630.xml'
+
+PRICES_URL = 'http://ichart.finance.yahoo.com/table.csv?s=%s&a=0&b=1&c=2013'
+
+
+class CacheToolTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dir_path, 'httpcache')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def store(self, responses, spider_name='edgar', storage_cls=CompressedLeveldbCacheStorage, cache_dir=None):
+        crawler = get_crawler({'HTTPCACHE_DIR': cache_dir or self.cache_dir})
+        spider = Spider(spider_name)
+        spider.set_crawler(crawler)
+        crawler.stats.open_spider(spider)
+        storage = storage_cls(crawler.settings)
+        storage.open_spider(spider)
+        try:
+            for response in responses:
+                storage.store_response(spider, Request(response.url), response)
+        finally:
+            storage.close_spider(spider)
+
+    def store_companies(self):
+        self.store([
+            HtmlResponse(BROWSE_URL % 'FB', body=BROWSE_BODY % 1326801),
+            HtmlResponse(BROWSE_URL % 'AAPL', body=BROWSE_BODY % 320193),
+            HtmlResponse(BROWSE_URL % 'XYZ', status=404, body='Not found'),
+            XmlResponse(REPORT_URL % (1326801, 'fb'), body='<xbrl>fb</xbrl>'),
+            XmlResponse(REPORT_URL % (320193, 'aapl'), body='<xbrl>aapl</xbrl>')
+        ])
+        self.store([
+            TextResponse(PRICES_URL % 'FB', body='Date,Open'),
+            TextResponse(PRICES_URL % 'AAPL', body='Date,Open')
+        ], spider_name='yahoo')
+
+    def get_urls(self, cache_dir=None):
+        urls = []
+        for spider, db in cachetool.open_indexed_dbs(cache_dir or self.cache_dir):
+            urls.extend(entry.url for entry in cachetool.iter_entries(db))
+        return sorted(urls)
+
+    def test_parse_size(self):
+        self.assertEqual(cachetool.parse_size('100'), 100)
+        self.assertEqual(cachetool.parse_size('1.5K'), 1536)
+        self.assertEqual(cachetool.parse_size('20G'), 20 * 1024 ** 3)
+        self.assertEqual(cachetool.parse_size('20gb'), 20 * 1024 ** 3)
+        self.assertRaises(ValueError, cachetool.parse_size, '20 apples')
+        self.assertEqual(cachetool.format_size(100), '100B')
+        self.assertEqual(cachetool.format_size(1536), '1.5K')
+
+    def test_parse_statuses(self):
+        statuses = cachetool.parse_statuses('404, 5XX')
+        self.assertTrue(cachetool.match_status(404, statuses))
+        self.assertTrue(cachetool.match_status(503, statuses))
+        self.assertFalse(cachetool.match_status(403, statuses))
+        self.assertRaises(ValueError, cachetool.parse_statuses, '4')
+
+    def test_stats(self):
+        self.store_companies()
+        classes, statuses = cachetool.get_stats(self.cache_dir)
+        self.assertEqual(sorted(classes['edgar']), ['archive', 'browse'])
+        self.assertEqual(classes['edgar']['browse'][0], 3)
+        self.assertEqual(classes['edgar']['archive'][0], 2)
+        self.assertEqual(classes['yahoo']['yahoo'][0], 2)
+        self.assertGreater(classes['edgar']['archive'][1], 0)
+        self.assertEqual(statuses, {'2xx': 6, '4xx': 1})
+        self.assertIn('Total', cachetool.format_stats(self.cache_dir))
+
+    def test_index(self):
+        # Stored without metadata
+        self.store([HtmlResponse(BROWSE_URL % 'FB', body=BROWSE_BODY % 1326801)], storage_cls=LeveldbCacheStorage)
+        db = cachetool.open_db(os.path.join(self.cache_dir, 'edgar.leveldb'))
+        self.assertEqual(list(cachetool.iter_entries(db)), [])
+
+        self.assertEqual(cachetool.index(db), 1)
+        entries = list(cachetool.iter_entries(db))
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].url, BROWSE_URL % 'FB')
+        self.assertEqual(entries[0].status, 200)
+        self.assertAlmostEqual(entries[0].time, time.time(), delta=60)
+        self.assertEqual(cachetool.index(db), 0)
+
+    def test_evict(self):
+        self.store_companies()
+        self.assertEqual(cachetool.evict(self.cache_dir, statuses=set(['4xx']))[0], 1)
+        self.assertNotIn(BROWSE_URL % 'XYZ', self.get_urls())
+
+        # Only the browse pages are old enough to go
+        self.assertEqual(cachetool.evict(self.cache_dir, max_age=0, url_classes=['browse'])[0], 2)
+        self.assertEqual(self.get_urls(), sorted([
+            REPORT_URL % (320193, 'aapl'),
+            REPORT_URL % (1326801, 'fb'),
+            PRICES_URL % 'AAPL',
+            PRICES_URL % 'FB'
+        ]))
+
+    def test_evict_budget(self):
+        self.store_companies()
+
+        # Retrieving a response makes it the most recently used one
+        crawler = get_crawler({'HTTPCACHE_DIR': self.cache_dir})
+        spider = Spider('yahoo')
+        spider.set_crawler(crawler)
+        crawler.stats.open_spider(spider)
+        storage = CompressedLeveldbCacheStorage(crawler.settings)
+        storage.open_spider(spider)
+        time.sleep(0.01)
+        self.assertIsNotNone(storage.retrieve_response(spider, Request(PRICES_URL % 'FB')))
+        storage.close_spider(spider)
+
+        # Everything else goes to fit in its size
+        sizes = dict((entry.url, entry.size) for spider, db in cachetool.open_indexed_dbs(self.cache_dir)
+                     for entry in cachetool.iter_entries(db))
+        budget = sizes[PRICES_URL % 'FB']
+        count, size = cachetool.evict(self.cache_dir, budget=budget)
+        self.assertEqual(count, 6)
+        self.assertEqual(size, sum(sizes.values()) - budget)
+        self.assertEqual(self.get_urls(), [PRICES_URL % 'FB'])
+
+    def test_migrate(self):
+        self.store_companies()
+        self.store([HtmlResponse('http://www.sec.gov/index.htm', body='<html></html>')], spider_name='other',
+                   storage_cls=LeveldbCacheStorage)
+        self.assertEqual(cachetool.migrate(self.cache_dir), 8)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), [
+            'edgar.leveldb.bak', 'edgar.sqlite',
+            'other.leveldb.bak', 'other.sqlite',
+            'yahoo.leveldb.bak', 'yahoo.sqlite'
+        ])
+        self.assertEqual(len(self.get_urls()), 8)
+
+        crawler = get_crawler({'HTTPCACHE_DIR': self.cache_dir})
+        spider = Spider('edgar')
+        spider.set_crawler(crawler)
+        crawler.stats.open_spider(spider)
+        storage = CompressedSqliteCacheStorage(crawler.settings)
+        storage.open_spider(spider)
+        response = storage.retrieve_response(spider, Request(REPORT_URL % (1326801, 'fb')))
+        storage.close_spider(spider)
+        self.assertEqual(response.body, '<xbrl>fb</xbrl>')
+
+        # The cache tool works the same on SQLite
+        self.assertEqual(cachetool.evict(self.cache_dir, statuses=set(['4xx']))[0], 1)
+        self.assertEqual(cachetool.copy_entries(self.cache_dir, os.path.join(self.dir_path, 'shard'), ['fb']), 3)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dir_path, 'shard'))),
+                         ['edgar.sqlite', 'other.sqlite', 'yahoo.sqlite'])
+
+        # Migrated only once
+        self.assertEqual(cachetool.migrate(self.cache_dir), 0)
+
+    def test_export_import(self):
+        self.store_companies()
+        target = os.path.join(self.dir_path, 'shard')
+
+        # FB's CIK is found on its browse page, AAPL's is in the CIK map
+        cik_map = CikMap()
+        cik_map.add('AAPL', '320193')
+        self.assertEqual(cachetool.copy_entries(self.cache_dir, target, ['fb'], CikMap()), 3)
+        self.assertEqual(self.get_urls(target), sorted([
+            BROWSE_URL % 'FB',
+            REPORT_URL % (1326801, 'fb'),
+            PRICES_URL % 'FB'
+        ]))
+        self.assertEqual(cachetool.copy_entries(self.cache_dir, target, ['aapl'], cik_map), 3)
+        self.assertEqual(len(self.get_urls(target)), 6)
+
+        # Newer entries aren't overwritten by an import
+        other = os.path.join(self.dir_path, 'other')
+        self.store([XmlResponse(REPORT_URL % (1326801, 'fb'), body='<xbrl>new</xbrl>')], cache_dir=other)
+        self.assertEqual(cachetool.copy_entries(target, other, skip_newer=True), 5)
+        self.assertEqual(cachetool.copy_entries(other, target, skip_newer=True), 1)
+
+        db = cachetool.open_db(os.path.join(target, 'edgar.leveldb'))
+        entry = [entry for entry in cachetool.iter_entries(db) if entry.url == REPORT_URL % (1326801, 'fb')][0]
+        data = cachetool.pickle.loads(db.Get('%s_data' % entry.key))
+        self.assertEqual(get_body(data), '<xbrl>new</xbrl>')
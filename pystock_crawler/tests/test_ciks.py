@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+
+from pystock_crawler.ciks import CikMap, find_cik
+from pystock_crawler.tests.base import TestCaseBase
+
+
+class CikMapTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir_path, 'ticker.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_get_cik(self):
+        with open(self.path, 'w') as f:
+            f.write('aapl\t320193\ngoog\t1652044\ngoogl\t1652044\nbrk-b\t1067983\nbad line\n')
+
+        cik_map = CikMap(self.path)
+        self.assertEqual(cik_map.get_cik('AAPL'), '320193')
+        self.assertEqual(cik_map.get_cik('googl'), '1652044')
+        self.assertEqual(cik_map.get_cik('BRK-B'), '1067983')
+        self.assertEqual(cik_map.get_cik('0000320193'), '320193')
+        self.assertIsNone(cik_map.get_cik('FB'))
+        self.assertIsNone(cik_map.get_cik('BAD'))
+
+    def test_save_and_load(self):
+        cik_map = CikMap(self.path)
+        self.assertEqual(cik_map.ciks, {})
+
+        cik_map.add('FB', '0001326801')
+        cik_map.add('aapl', '320193')
+        cik_map.save()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'aapl\t320193\nfb\t1326801\n')
+
+        cik_map = CikMap(self.path)
+        self.assertEqual(cik_map.get_cik('FB'), '1326801')
+
+    def test_find_cik(self):
+        body = '''
+            <span class="companyName">FACEBOOK INC <acronym title="Central Index Key">CIK</acronym>#:
+            <a href="/cgi-bin/browse-edgar?action=getcompany&amp;CIK=0001326801&amp;owner=exclude&amp;count=40">
+            0001326801 (see all company filings)</a></span>
+        '''
+        self.assertEqual(find_cik(body), '1326801')
+        self.assertIsNone(find_cik('<h1>No matching Ticker Symbol.</h1>'))
@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from cStringIO import StringIO
+
+from pystock_crawler import companyfacts
+from pystock_crawler.tests.base import TestCaseBase
+
+
+def fact(start, end, val, accn, fy, fp, form, filed):
+    value = {'end': end, 'val': val, 'accn': accn, 'fy': fy, 'fp': fp, 'form': form,
+             'filed': filed}
+    if start:
+        value['start'] = start
+    return value
+
+
+Q1 = ('0000000001-14-000001', 2014, 'Q1', '10-Q', '2014-05-05')
+FY = ('0000000001-14-000002', 2013, 'FY', '10-K', '2014-02-20')
+FY_AMEND = ('0000000001-14-000003', 2013, 'FY', '10-K/A', '2014-03-20')
+
+COMPANY = {
+    'cik': 1,
+    'entityName': u'ABC \xe9 Inc.',
+    'facts': {
+        'dei': {
+            'EntityCommonStockSharesOutstanding': {'label': 'Shares', 'units': {'shares': [
+                fact(None, '2014-04-30', 100, *Q1)
+            ]}}
+        },
+        'us-gaap': {
+            'Revenues': {'label': 'Revenues', 'description': 'Revenues', 'units': {'USD': [
+                fact('2014-01-01', '2014-03-31', 90, *Q1),
+                fact('2013-01-01', '2013-03-31', 80, *Q1),
+                fact('2013-01-01', '2013-12-31', 400, *FY),
+                fact('2013-10-01', '2013-12-31', 110, *FY),
+                fact('2013-01-01', '2013-12-31', 410, *FY_AMEND)
+            ]}},
+            'SalesRevenueNet': {'label': 'Sales', 'units': {'USD': [
+                fact('2014-01-01', '2014-03-31', 100, *Q1)
+            ]}},
+            'NetIncomeLoss': {'label': 'Net Income', 'units': {'USD': [
+                fact('2014-01-01', '2014-03-31', 10, *Q1),
+                fact('2013-01-01', '2013-12-31', 40, *FY),
+                fact('2013-01-01', '2013-12-31', 41, *FY_AMEND)
+            ]}},
+            'EarningsPerShareBasic': {'label': 'EPS', 'units': {'USD/shares': [
+                fact('2014-01-01', '2014-03-31', 0.1, *Q1),
+                fact('2014-01-01', '2014-03-31', 0.1, '0000000001-14-000004', 2014, 'Q1', '8-K', '2014-04-01')
+            ]}},
+            'Assets': {'label': 'Assets', 'units': {'USD': [
+                fact(None, '2014-03-31', 1000, *Q1),
+                fact(None, '2013-12-31', 900, *Q1),
+                fact(None, '2013-12-31', 900, *FY),
+                fact(None, '2013-12-31', 900, *FY_AMEND)
+            ]}}
+        }
+    }
+}
+
+
+class JsonStreamTest(TestCaseBase):
+
+    def test_iter_keys(self):
+        # Tiny chunks so that values and UTF-8 characters are split across them
+        data = json.dumps(COMPANY, indent=1, ensure_ascii=False).encode('utf-8')
+        stream = companyfacts.JsonStream(StringIO(data), chunk_size=3)
+        keys = []
+        taxonomies = {}
+        for key in stream.iter_keys():
+            keys.append(key)
+            if key == 'facts':
+                for taxonomy in stream.iter_keys():
+                    taxonomies[taxonomy] = stream.read_value()
+            else:
+                stream.read_value()
+        self.assertEqual(sorted(keys), ['cik', 'entityName', 'facts'])
+        self.assertEqual(taxonomies, COMPANY['facts'])
+        self.assertEqual(stream.peek(), '')
+
+    def test_iter_concepts(self):
+        data = json.dumps(COMPANY)
+        concepts = list(companyfacts.iter_concepts(StringIO(data)))
+        self.assertEqual(len(concepts), 6)
+
+        cik, taxonomy, name, concept = [c for c in concepts if c[2] == 'Revenues'][0]
+        self.assertEqual(cik, '1')
+        self.assertEqual(taxonomy, 'us-gaap')
+        self.assertEqual(concept, COMPANY['facts']['us-gaap']['Revenues'])
+
+    def test_numbers_across_chunks(self):
+        for chunk_size in xrange(1, 12):
+            stream = companyfacts.JsonStream(StringIO('{"a": 1234567, "b": [1.5, "x\\u00e9"]}'),
+                                             chunk_size=chunk_size)
+            values = [(key, stream.read_value()) for key in stream.iter_keys()]
+            self.assertEqual(values, [('a', 1234567), ('b', [1.5, u'x\xe9'])])
+
+    def test_invalid(self):
+        stream = companyfacts.JsonStream(StringIO('{"a": 1 "b": 2}'))
+        keys = stream.iter_keys()
+        keys.next()
+        stream.read_value()
+        self.assertRaises(ValueError, keys.next)
+
+        stream = companyfacts.JsonStream(StringIO('{"a": [1, 2'))
+        keys = stream.iter_keys()
+        keys.next()
+        self.assertRaises(ValueError, stream.read_value)
+
+
+class CompanyFactsTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        with open(os.path.join(self.dir_path, 'CIK0000000001.json'), 'w') as f:
+            json.dump(COMPANY, f)
+
+        other = dict(COMPANY, cik=2)
+        with open(os.path.join(self.dir_path, 'CIK0000000002.json'), 'w') as f:
+            json.dump(other, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_iter_reports(self):
+        items = list(companyfacts.iter_reports(self.dir_path, ciks=['0000000001']))
+        self.assertEqual(len(items), 2)
+
+        # The amendment is filed later than the original 10-K
+        self.assert_item(items[0], {
+            'symbol': '1',
+            'amend': True,
+            'doc_type': '10-K',
+            'period_focus': 'FY',
+            'fiscal_year': 2013,
+            'end_date': '2013-12-31',
+            'revenues': 410.0,
+            'net_income': 41.0,
+            'dividend': 0.0,
+            'assets': 900.0
+        })
+
+        # SalesRevenueNet comes before Revenues in the fallbacks
+        self.assert_item(items[1], {
+            'symbol': '1',
+            'amend': False,
+            'doc_type': '10-Q',
+            'period_focus': 'Q1',
+            'fiscal_year': 2014,
+            'end_date': '2014-03-31',
+            'revenues': 100.0,
+            'net_income': 10.0,
+            'eps_basic': 0.1,
+            'eps_diluted': 0.1,
+            'dividend': 0.0,
+            'assets': 1000.0
+        })
+
+    def test_filters(self):
+        items = list(companyfacts.iter_reports(self.dir_path))
+        self.assertEqual([item['symbol'] for item in items], ['1', '1', '2', '2'])
+
+        items = list(companyfacts.iter_reports(self.dir_path, ciks=['2'], end_date='20140301'))
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]['symbol'], '2')
+        self.assertFalse(items[0]['amend'])
+        self.assertEqual(items[0]['revenues'], 400.0)
+
+        items = list(companyfacts.iter_reports(self.dir_path, ciks=['1'], start_date='20140401',
+                                               fields=['net_income']))
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]['net_income'], 10.0)
+        self.assertNotIn('revenues', items[0])
+
+    def test_later_facts(self):
+        # A dividend declared after the end of the quarter
+        company = json.loads(json.dumps(dict(COMPANY, cik=3)))
+        company['facts']['us-gaap']['CommonStockDividendsPerShareDeclared'] = {
+            'label': 'Dividends', 'units': {'USD/shares': [
+                fact('2014-04-25', '2014-05-01', 0.5, *Q1)
+            ]}}
+        path = os.path.join(self.dir_path, 'CIK0000000003.json')
+        with open(path, 'w') as f:
+            json.dump(company, f)
+
+        items = list(companyfacts.iter_reports(path))
+        self.assertEqual(len(items), 2)
+        self.assert_item(items[1], {
+            'symbol': '3',
+            'amend': False,
+            'doc_type': '10-Q',
+            'period_focus': 'Q1',
+            'fiscal_year': 2014,
+            'end_date': '2014-03-31',
+            'revenues': 100.0,
+            'net_income': 10.0,
+            'eps_basic': 0.1,
+            'eps_diluted': 0.1,
+            'dividend': 0.0,
+            'assets': 1000.0
+        })
+
+    def test_zip(self):
+        zip_path = os.path.join(self.dir_path, 'companyfacts.zip')
+        zip_file = zipfile.ZipFile(zip_path, 'w')
+        zip_file.write(os.path.join(self.dir_path, 'CIK0000000002.json'), 'CIK0000000002.json')
+        zip_file.close()
+
+        output = os.path.join(self.dir_path, 'out.csv')
+        self.assertEqual(companyfacts.ingest(zip_path, output, fields=['revenues']), 2)
+        with open(output) as f:
+            self.assertEqual(f.read().splitlines(), [
+                'symbol,end_date,amend,period_focus,fiscal_year,doc_type,revenues',
+                '2,2013-12-31,True,FY,2013,10-K,410.0',
+                '2,2014-03-31,False,Q1,2014,10-Q,100.0'
+            ])
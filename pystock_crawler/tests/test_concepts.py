@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+
+from pystock_crawler.concepts import ConceptCache, get_company_key
+from pystock_crawler.tests.base import TestCaseBase
+
+
+class ConceptCacheTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir_path, 'concepts.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_get_company_key(self):
+        self.assertEqual(get_company_key('http://www.sec.gov/Archives/edgar/data/1288776/000128877614000020/goog-20131231.xml'), '1288776')
+        self.assertEqual(get_company_key('file:///tmp/reports/brk-b-20131231.xml'), 'BRK')
+
+    def test_save_and_load(self):
+        url = 'http://www.sec.gov/Archives/edgar/data/123/0001/abc-20130630.xml'
+        cache = ConceptCache(self.path)
+        self.assertEqual(cache.get_hints(url), {})
+
+        cache.get_hints(url)['revenues'] = '//us-gaap:Revenues'
+        cache.update(url.replace('20130630', '20130930'), {'net_income': '//us-gaap:ProfitLoss'})
+        cache.save()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+        cache = ConceptCache(self.path)
+        self.assertEqual(cache.get_hints(url), {
+            'revenues': '//us-gaap:Revenues',
+            'net_income': '//us-gaap:ProfitLoss'
+        })
+        self.assertEqual(cache.get_hints('http://www.sec.gov/Archives/edgar/data/456/0001/xyz-20130630.xml'), {})
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+
+from pystock_crawler.crawlstate import CrawlState
+from pystock_crawler.items import ReportItem
+from pystock_crawler.tests.base import TestCaseBase
+
+
+class CrawlStateTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir_path, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_get_start_date(self):
+        state = CrawlState(self.path)
+        self.assertEqual(state.get_start_date('GOOG'), '')
+        self.assertEqual(state.get_start_date('GOOG', '20120101'), '20120101')
+
+        state.add_report(ReportItem(symbol='GOOG', end_date='2013-12-31'), '0001288776-14-000020')
+        self.assertEqual(state.get_start_date('GOOG'), '20140101')
+        self.assertEqual(state.get_start_date('goog', '20120101'), '20140101')
+        self.assertEqual(state.get_start_date('GOOG', '20140301'), '20140301')
+
+    def test_add_report(self):
+        state = CrawlState(self.path)
+        state.add_report(ReportItem(symbol='GOOG', end_date='2013-12-31'), '0001288776-14-000020')
+
+        # An amendment of an earlier report
+        state.add_report(ReportItem(symbol='GOOG', end_date='2013-09-30'), '0001288776-14-000030')
+
+        self.assertEqual(state.symbols['GOOG'], {'end_date': '2013-12-31', 'accession': '0001288776-14-000020'})
+        self.assertTrue(state.is_exported('0001288776-14-000020'))
+        self.assertTrue(state.is_exported('0001288776-14-000030'))
+        self.assertFalse(state.is_exported('0001288776-14-000040'))
+        self.assertFalse(state.is_exported(None))
+
+    def test_save_and_load(self):
+        state = CrawlState(self.path)
+        state.add_report(ReportItem(symbol='GOOG', end_date='2013-12-31'), '0001288776-14-000020')
+        state.save()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+        state = CrawlState(self.path)
+        self.assertEqual(state.symbols, {'GOOG': {'end_date': '2013-12-31', 'accession': '0001288776-14-000020'}})
+        self.assertEqual(state.accessions, set(['0001288776-14-000020']))
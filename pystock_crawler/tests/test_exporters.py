@@ -0,0 +1,73 @@
+import csv
+import os
+import shutil
+import tempfile
+
+from pystock_crawler.exporters import CsvItemExporter2, dedupe_comparatives
+from pystock_crawler.items import ReportItem
+from pystock_crawler.tests.base import TestCaseBase
+
+
+FIELDS = ['symbol', 'end_date', 'doc_type', 'revenues', 'accession', 'comparative']
+
+
+def make_report(end_date, revenues, accession, comparative=False):
+    item = ReportItem(symbol='ABC', end_date=end_date, doc_type='10-Q', revenues=revenues, accession=accession)
+    if comparative:
+        item['comparative'] = True
+    return item
+
+
+class DedupeComparativesTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.output = os.path.join(self.dir_path, 'out.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def export(self, items, append=False):
+        # Like a batch of `pystock-crawler reports` merged into the output
+        with open(self.output, 'ab' if append else 'wb') as f:
+            exporter = CsvItemExporter2(f, include_headers_line=not append, fields_to_export=list(FIELDS))
+            exporter.start_exporting()
+            for item in items:
+                exporter.export_item(item)
+            exporter.finish_exporting()
+
+    def read_rows(self):
+        with open(self.output, 'rb') as f:
+            return [(row['end_date'], row['revenues'], row['accession'], row['comparative'])
+                    for row in csv.DictReader(f)]
+
+    def test_two_batches(self):
+        # The 2014 report compares with 2013, which is reported in the next batch
+        self.export([
+            make_report('2014-06-30', 110, '0002'),
+            make_report('2013-06-30', 99, '0002', comparative=True)
+        ])
+        self.export([
+            make_report('2013-06-30', 100, '0001'),
+            make_report('2012-06-30', 80, '0003', comparative=True),
+            make_report('2012-06-30', 90, '0001', comparative=True)
+        ], append=True)
+        self.assertEqual(len(self.read_rows()), 4)
+
+        self.assertEqual(dedupe_comparatives(self.output), 1)
+        self.assertEqual(self.read_rows(), [
+            ('2014-06-30', '110', '0002', ''),
+            ('2013-06-30', '100', '0001', ''),
+            ('2012-06-30', '90', '0001', 'True')
+        ])
+
+        # Only the comparative period of the smallest accession is kept
+        self.export([make_report('2012-06-30', 85, '0000', comparative=True)], append=True)
+        self.assertEqual(dedupe_comparatives(self.output), 1)
+        self.assertEqual(self.read_rows()[-1], ('2012-06-30', '85', '0000', 'True'))
+        self.assertEqual(dedupe_comparatives(self.output), 0)
+
+    def test_no_comparatives(self):
+        with open(self.output, 'wb') as f:
+            f.write('symbol,date,close\r\nABC,2013-06-28,10\r\n')
+        self.assertEqual(dedupe_comparatives(self.output), 0)
@@ -0,0 +1,156 @@
+import csv
+import os
+import shutil
+import tempfile
+import zipfile
+
+from pystock_crawler import fsds
+from pystock_crawler.tests.base import TestCaseBase
+
+
+SUB_HEADER = ['adsh', 'cik', 'name', 'form', 'period', 'fy', 'fp', 'filed', 'instance']
+
+SUBMISSIONS = [
+    ['0000000001-14-000001', '1', 'ABC INC', '10-Q', '20140331', '2014', 'Q1', '20140505', 'abc-20140331.xml'],
+    ['0000000002-14-000001', '2', 'XYZ CORP', '10-K/A', '20131231', '2013', 'FY', '20140220', 'xyz-20131231.xml'],
+    ['0000000003-14-000001', '3', 'DEF CO', '8-K', '20140331', '', '', '20140401', 'def-20140331.xml']
+]
+
+NUM_HEADER = ['adsh', 'tag', 'version', 'coreg', 'ddate', 'qtrs', 'uom', 'value', 'footnote']
+
+NUMS = [
+    # ABC: SalesRevenueNet comes before Revenues in the fallbacks
+    ['0000000001-14-000001', 'Revenues', 'us-gaap/2013', '', '20140331', '1', 'USD', '90', ''],
+    ['0000000001-14-000001', 'SalesRevenueNet', 'us-gaap/2013', '', '20140331', '1', 'USD', '100', ''],
+    ['0000000001-14-000001', 'SalesRevenueNet', 'us-gaap/2013', '', '20130331', '1', 'USD', '80', ''],
+    ['0000000001-14-000001', 'SalesRevenueNet', 'us-gaap/2013', 'SubsidiaryMember', '20140331', '1', 'USD', '50', ''],
+    ['0000000001-14-000001', 'NetIncomeLoss', 'us-gaap/2013', '', '20140331', '1', 'USD', '10', ''],
+    ['0000000001-14-000001', 'EarningsPerShareBasic', 'us-gaap/2013', '', '20140331', '1', 'USD/shares', '0.1', ''],
+    ['0000000001-14-000001', 'Assets', 'us-gaap/2013', '', '20140331', '0', 'USD', '1000', ''],
+    ['0000000001-14-000001', 'Assets', 'us-gaap/2013', '', '20131231', '0', 'USD', '900', ''],
+    ['0000000001-14-000001', 'NetCashProvidedByUsedInOperatingActivities', 'us-gaap/2013', '', '20140331', '1', 'USD', '30', ''],
+
+    # XYZ: a company-specific tag that matches a predicate XPath, and a
+    # quarterly value that doesn't match a 10-K
+    ['0000000002-14-000001', 'XyzTotalRevenues', '0000000002-14-000001', '', '20131231', '4', 'USD', '500', ''],
+    ['0000000002-14-000001', 'NetIncomeLoss', 'us-gaap/2013', '', '20131231', '1', 'USD', '20', ''],
+    ['0000000002-14-000001', 'NetIncomeLoss', 'us-gaap/2013', '', '20131231', '4', 'USD', '70', ''],
+    ['0000000002-14-000001', 'CommonStockDividendsPerShareDeclared', 'us-gaap/2013', '', '20131231', '4', 'USD/shares', '0.5', ''],
+
+    ['0000000003-14-000001', 'Revenues', 'us-gaap/2013', '', '20140331', '1', 'USD', '1', '']
+]
+
+
+def write_table(zip_file, name, header, rows):
+    lines = ['\t'.join(row) for row in [header] + rows]
+    zip_file.writestr(name, '\n'.join(lines) + '\n')
+
+
+class FsdsTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        zip_file = zipfile.ZipFile(os.path.join(self.dir_path, '2014q1.zip'), 'w')
+        write_table(zip_file, 'sub.txt', SUB_HEADER, SUBMISSIONS)
+        write_table(zip_file, 'num.txt', NUM_HEADER, NUMS)
+        zip_file.close()
+
+        # Not a quarterly data set
+        with open(os.path.join(self.dir_path, 'notes.zip'), 'w') as f:
+            f.write('')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_tag_rules(self):
+        rules = fsds.TagRules()
+        field_names = [rules.entries[i][0] for i, __ in rules.match('us-gaap', 'SalesRevenueNet')]
+        self.assertIn('revenues', field_names)
+        self.assertEqual(rules.match('abc', 'SalesRevenueNet'), [
+            match for match in rules.match('us-gaap', 'SalesRevenueNet')
+            if rules.entries[match[0]][1][match[1]][0] != 'qname'
+        ])
+        self.assertIs(rules.match('us-gaap', 'Assets'), rules.match('us-gaap', 'Assets'))
+
+        rules = fsds.TagRules(fields=['assets'])
+        self.assertEqual([entry[0] for entry in rules.entries], ['assets'])
+        self.assertEqual(rules.match('us-gaap', 'SalesRevenueNet'), [])
+
+        self.assertTrue(fsds.get_ignore_date_range('cash_flow_op'))
+        self.assertFalse(fsds.get_ignore_date_range('revenues'))
+
+    def test_item_loader(self):
+        # A loader without a document works like one of a document without facts
+        loader = fsds.FsdsItemLoader(end_date='2014-03-31', doc_type='10-Q', fields=['revenues'])
+        self.assertEqual(loader.fields, set(['revenues']))
+        self.assertIsNone(loader.concept_hints)
+        self.assertEqual(loader.context_table.contexts, {})
+        self.assertEqual(loader.add_xpaths('revenues', ['//us-gaap:Revenues', '//*[local-name()="Sales"]']), 0)
+        self.assertEqual(loader.field_stats['revenues']['evaluated'], 2)
+        self.assertFalse(loader.fact_index.has_match('//us-gaap:Revenues'))
+
+        loader.add_value('symbol', 'abc')
+        loader.add_value('end_date', '2014-03-31')
+        item = loader.load_item()
+        self.assertEqual(item['symbol'], 'ABC')
+        self.assertEqual(item['end_date'], '2014-03-31')
+        self.assertNotIn('revenues', item)
+
+    def test_iter_reports(self):
+        items = list(fsds.iter_reports(self.dir_path))
+        self.assertEqual(len(items), 2)
+
+        self.assert_item(items[0], {
+            'symbol': 'ABC',
+            'amend': False,
+            'doc_type': '10-Q',
+            'period_focus': 'Q1',
+            'fiscal_year': 2014,
+            'end_date': '2014-03-31',
+            'revenues': 100.0,
+            'net_income': 10.0,
+            'eps_basic': 0.1,
+            'eps_diluted': 0.1,
+            'dividend': 0.0,
+            'assets': 1000.0,
+            'cash_flow_op': 30.0
+        })
+
+        self.assert_item(items[1], {
+            'symbol': 'XYZ',
+            'amend': True,
+            'doc_type': '10-K',
+            'period_focus': 'FY',
+            'fiscal_year': 2013,
+            'end_date': '2013-12-31',
+            'revenues': 500.0,
+            'net_income': 70.0,
+            'dividend': 0.5
+        })
+
+    def test_filters(self):
+        items = list(fsds.iter_reports(self.dir_path, symbols=['xyz']))
+        self.assertEqual([item['symbol'] for item in items], ['XYZ'])
+
+        items = list(fsds.iter_reports(self.dir_path, start_date='20140301'))
+        self.assertEqual([item['symbol'] for item in items], ['ABC'])
+
+        items = list(fsds.iter_reports(self.dir_path, end_date='20140301'))
+        self.assertEqual([item['symbol'] for item in items], ['XYZ'])
+
+        items = list(fsds.iter_reports(self.dir_path, fields=['assets']))
+        self.assertEqual(items[0]['assets'], 1000.0)
+        self.assertNotIn('revenues', items[0])
+        self.assertNotIn('dividend', items[0])
+
+    def test_ingest(self):
+        output = os.path.join(self.dir_path, 'out.csv')
+        self.assertEqual(fsds.ingest(self.dir_path, output, fields=['revenues']), 2)
+
+        with open(output) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows, [
+            ['symbol', 'end_date', 'amend', 'period_focus', 'fiscal_year', 'doc_type', 'revenues'],
+            ['ABC', '2014-03-31', 'False', 'Q1', '2014', '10-Q', '100.0'],
+            ['XYZ', '2013-12-31', 'True', 'FY', '2013', '10-K', '500.0']
+        ])
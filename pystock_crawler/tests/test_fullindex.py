@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+
+from cStringIO import StringIO
+
+from pystock_crawler import fullindex
+from pystock_crawler.tests.base import TestCaseBase
+
+
+MASTER_IDX = '''Description:           Master Index of EDGAR Dissemination Feed
+Last Data Received:    March 31, 2014
+Comments:              webmaster@sec.gov
+Anonymous FTP:         ftp://ftp.sec.gov/edgar/
+
+
+
+
+CIK|Company Name|Form Type|Date Filed|Filename
+--------------------------------------------------------------------------------
+1000045|NICHOLAS FINANCIAL INC|10-Q|2014-02-14|edgar/data/1000045/0001193125-14-055198.txt
+320193|APPLE INC|10-Q|2014-01-28|edgar/data/320193/0001193125-14-024487.txt
+320193|APPLE INC|SC 13G/A|2014-02-14|edgar/data/320193/0000932471-14-003201.txt
+320193|APPLE INC|10-K/A|2014-03-20|edgar/data/320193/0001193125-14-111111.txt
+'''
+
+FORM_IDX = '''Description:           Daily Index of EDGAR Dissemination Feed by Form Type
+Last Data Received:    December 31, 2013
+Comments:              webmaster@sec.gov
+Anonymous FTP:         ftp://ftp.sec.gov/edgar/
+
+
+
+
+Form Type   Company Name                                                  CIK         Date Filed  File Name
+---------------------------------------------------------------------------------------------------------------------------------------------
+10-K        APPLE INC                                                     320193      2013-10-30  edgar/data/320193/0001193125-13-416534.txt
+10-K        MICROSOFT  CORP                                               789019      2013-07-30  edgar/data/789019/0001193125-13-310206.txt
+SC 13G      APPLE INC                                                     320193      2013-11-12  edgar/data/320193/0000932471-13-009999.txt
+'''
+
+
+# Only the filings with XBRL of the same quarter as MASTER_IDX
+XBRL_IDX = MASTER_IDX.replace('320193|APPLE INC|10-K/A|2014-03-20|edgar/data/320193/0001193125-14-111111.txt\n', '')
+
+# Filed before XBRL
+OLD_MASTER_IDX = MASTER_IDX.replace('2014-', '2008-')
+
+
+class ParseIndexTest(TestCaseBase):
+
+    def test_master_idx(self):
+        filings = list(fullindex.parse_index(StringIO(MASTER_IDX)))
+        self.assertEqual(len(filings), 4)
+        self.assertEqual(filings[1], fullindex.Filing(
+            '320193', '10-Q', '2014-01-28', 'edgar/data/320193/0001193125-14-024487.txt'))
+
+    def test_form_idx(self):
+        filings = list(fullindex.parse_index(StringIO(FORM_IDX)))
+        self.assertEqual(filings, [
+            fullindex.Filing('320193', '10-K', '2013-10-30', 'edgar/data/320193/0001193125-13-416534.txt'),
+            fullindex.Filing('789019', '10-K', '2013-07-30', 'edgar/data/789019/0001193125-13-310206.txt'),
+            fullindex.Filing('320193', 'SC 13G', '2013-11-12', 'edgar/data/320193/0000932471-13-009999.txt')
+        ])
+
+    def test_get_xbrl_zip_url(self):
+        self.assertEqual(
+            fullindex.get_xbrl_zip_url('edgar/data/320193/0001193125-13-416534.txt'),
+            'http://www.sec.gov/Archives/edgar/data/320193/000119312513416534/0001193125-13-416534-xbrl.zip')
+        self.assertIsNone(fullindex.get_xbrl_zip_url('edgar/data/320193/abc.txt'))
+
+
+class FullIndexTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        for year, quarter, filename, content in ((2014, 1, 'master.idx', MASTER_IDX),
+                                                 (2013, 4, 'form.idx', FORM_IDX)):
+            dir_path = os.path.join(self.dir_path, str(year), 'QTR%d' % quarter)
+            os.makedirs(dir_path)
+            with open(os.path.join(dir_path, filename), 'w') as f:
+                f.write(content)
+
+        # Not an index file
+        with open(os.path.join(self.dir_path, 'company.idx'), 'w') as f:
+            f.write(MASTER_IDX)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_get_filings(self):
+        index = fullindex.FullIndex(self.dir_path)
+        self.assertEqual(len(index), 3)
+
+        filings = index.get_filings('0000320193')
+        self.assertEqual([(filing.form, filing.date_filed) for filing in filings], [
+            ('10-K', '2013-10-30'),
+            ('10-Q', '2014-01-28'),
+            ('10-K/A', '2014-03-20')
+        ])
+
+        filings = index.get_filings('320193', start_date='20140101', end_date='20140301')
+        self.assertEqual([filing.form for filing in filings], ['10-Q'])
+        self.assertEqual(index.get_filings('320193', start_date='20150101'), [])
+
+        self.assertIsNone(index.get_filings('123'))
+        self.assertIsNone(index.get_filings('AAPL'))
+
+    def test_xbrl_idx(self):
+        with open(os.path.join(self.dir_path, '2014', 'QTR1', 'xbrl.idx'), 'w') as f:
+            f.write(XBRL_IDX)
+        index = fullindex.FullIndex(self.dir_path)
+        filings = index.get_filings('320193')
+        self.assertEqual([filing.form for filing in filings], ['10-K', '10-Q'])
+
+    def test_before_xbrl(self):
+        dir_path = os.path.join(self.dir_path, '2008', 'QTR1')
+        os.makedirs(dir_path)
+        with open(os.path.join(dir_path, 'master.idx'), 'w') as f:
+            f.write(OLD_MASTER_IDX)
+        index = fullindex.FullIndex(self.dir_path)
+        self.assertEqual(len(index.get_filings('320193')), 3)
+        self.assertEqual(index.get_filings('1000045')[0].date_filed, '2014-02-14')
+
+    def test_ciks(self):
+        index = fullindex.FullIndex(self.dir_path, ciks=['789019', '123'])
+        self.assertEqual(len(index), 1)
+        self.assertEqual(len(index.get_filings('789019')), 1)
+        self.assertIsNone(index.get_filings('320193'))
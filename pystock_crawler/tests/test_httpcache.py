@@ -0,0 +1,323 @@
+import cPickle as pickle
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from scrapy.contrib.downloadermiddleware.stats import DownloaderStats
+from scrapy.contrib.httpcache import LeveldbCacheStorage
+from email.utils import formatdate
+from scrapy.http import HtmlResponse, Request, Response, XmlResponse
+from scrapy.settings import Settings
+from scrapy.spider import Spider
+from scrapy.utils.response import response_httprepr
+from scrapy.utils.test import get_crawler
+
+from pystock_crawler.httpcache import (ArchivePolicy, CompressedLeveldbCacheStorage, CompressedSqliteCacheStorage,
+                                       get_atime_key, get_body, get_meta_key)
+from pystock_crawler.tests.base import TestCaseBase
+from pystock_crawler.tests.test_spiders_edgar import REPORT_BODY
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+URL = 'http://www.sec.gov/Archives/edgar/data/1326801/000132680113000024/fb-20130630.xml'
+
+
+class ReadOnlyDB(object):
+
+    def __init__(self, db):
+        self.db = db
+
+    def Get(self, key, *args, **kwargs):
+        return self.db.Get(key, *args, **kwargs)
+
+    def Put(self, key, value):
+        raise IOError('Read-only file system')
+
+    def Write(self, batch):
+        raise IOError('Read-only file system')
+
+    def close(self):
+        pass
+
+
+class CompressedLeveldbCacheStorageTest(TestCaseBase):
+
+    storage_cls = CompressedLeveldbCacheStorage
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.storages = []
+
+    def tearDown(self):
+        for storage, spider in self.storages:
+            storage.close_spider(spider)
+        shutil.rmtree(self.dir_path)
+
+    def open_storage(self, storage_cls=None, **settings):
+        storage_cls = storage_cls or self.storage_cls
+        settings['HTTPCACHE_DIR'] = self.dir_path
+        crawler = get_crawler(settings)
+        spider = Spider('edgar')
+        spider.set_crawler(crawler)
+        crawler.stats.open_spider(spider)
+
+        # Only one storage can have the database open at a time
+        while self.storages:
+            storage, old_spider = self.storages.pop()
+            storage.close_spider(old_spider)
+
+        storage = storage_cls(crawler.settings)
+        storage.open_spider(spider)
+        self.storages.append((storage, spider))
+        return storage, spider
+
+    def store(self, storage, spider, url=URL, body=REPORT_BODY, response_cls=XmlResponse):
+        request = Request(url)
+        storage.store_response(spider, request, response_cls(url, body=body))
+        return request
+
+    def test_compress(self):
+        storage, spider = self.open_storage()
+        request = self.store(storage, spider)
+
+        data = storage._read_data(spider, request)
+        self.assertEqual(data['codec'], 'zlib')
+        self.assertLess(len(data['body']), len(REPORT_BODY))
+        self.assertEqual(get_body(data), REPORT_BODY)
+
+        response = storage.retrieve_response(spider, request)
+        self.assertIsInstance(response, XmlResponse)
+        self.assertEqual(response.url, URL)
+        self.assertEqual(response.body, REPORT_BODY)
+        self.assertIsNotNone(spider.crawler.stats.get_value('httpcache/decompress_time'))
+        self.assertEqual(response.xpath('//*[local-name()="Revenues"]/text()').extract(), [u'100'])
+        self.assertEqual(response.replace(url=URL + '?a').body, REPORT_BODY)
+
+        stats = spider.crawler.stats
+        self.assertEqual(stats.get_value('httpcache/uncompressed_bytes'), len(REPORT_BODY))
+        self.assertEqual(stats.get_value('httpcache/compressed_bytes'), len(data['body']))
+        storage.close_spider(spider)
+        self.storages = []
+        self.assertGreater(stats.get_value('httpcache/compression_ratio'), 1)
+
+    def test_downloader_stats(self):
+        # DownloaderStats comes after the cache and reads every body, so a
+        # cached body is decompressed whether the spider reads it or not
+        storage, spider = self.open_storage()
+        request = self.store(storage, spider)
+        response = storage.retrieve_response(spider, request)
+
+        stats = spider.crawler.stats
+        DownloaderStats(stats).process_response(request, response, spider)
+        self.assertEqual(stats.get_value('downloader/response_bytes', spider=spider),
+                         len(response_httprepr(response)))
+        self.assertGreater(stats.get_value('downloader/response_bytes', spider=spider), len(REPORT_BODY))
+
+    def test_metadata(self):
+        storage, spider = self.open_storage()
+        request = self.store(storage, spider)
+        key = storage._request_key(request)
+        url, status, size, stored = pickle.loads(storage.db.Get(get_meta_key(key)))
+        self.assertEqual((url, status), (URL, 200))
+        self.assertEqual(size, len(storage.db.Get('%s_data' % key)))
+
+        # Retrieving an entry updates its access time when the spider closes
+        storage.db.Put(get_atime_key(key), '0')
+        storage.retrieve_response(spider, request)
+        self.assertEqual(storage.db.Get(get_atime_key(key)), '0')
+        storage, spider = self.open_storage()
+        self.assertGreaterEqual(float(storage.db.Get(get_atime_key(key))), stored)
+
+    def test_read_only(self):
+        storage, spider = self.open_storage()
+        request = self.store(storage, spider)
+        storage, spider = self.open_storage()
+        db = storage.db
+        storage.db = ReadOnlyDB(db)
+        self.assertEqual(storage.retrieve_response(spider, request).body, REPORT_BODY)
+        storage.close_spider(spider)
+        self.storages = []
+        if hasattr(db, 'close'):
+            db.close()
+
+    def test_uncompressed_entries(self):
+        storage, spider = self.open_storage(storage_cls=LeveldbCacheStorage)
+        request = self.store(storage, spider, url='http://www.sec.gov/index.htm', body='<html></html>',
+                             response_cls=HtmlResponse)
+
+        storage, spider = self.open_storage()
+        response = storage.retrieve_response(spider, request)
+        self.assertIsInstance(response, HtmlResponse)
+        self.assertEqual(response.body, '<html></html>')
+
+    def test_content_encoding(self):
+        storage, spider = self.open_storage()
+        request = Request(URL)
+        response = XmlResponse(URL, headers={'Content-Encoding': 'gzip'}, body='gzip data')
+        storage.store_response(spider, request, response)
+
+        self.assertNotIn('codec', storage._read_data(spider, request))
+        self.assertEqual(get_body(storage._read_data(spider, request)), 'gzip data')
+        self.assertEqual(storage.retrieve_response(spider, request).body, 'gzip data')
+
+    @unittest.skipIf(zstandard is None, 'zstandard is not installed')
+    def test_zstd_dictionary(self):
+        dict_path = os.path.join(self.dir_path, 'edgar.dict')
+        settings = {
+            'HTTPCACHE_COMPRESSION': 'zstd',
+            'HTTPCACHE_COMPRESSION_DICT': True,
+            'HTTPCACHE_COMPRESSION_DICT_SIZE': 4096,
+            'HTTPCACHE_COMPRESSION_DICT_SAMPLES': 50
+        }
+        storage, spider = self.open_storage(**settings)
+        requests = []
+        for i in xrange(50):
+            body = REPORT_BODY.replace('>100<', '>%d<' % (i * 7919))
+            url = URL.replace('fb-', 'fb%d-' % i)
+            requests.append((self.store(storage, spider, url=url, body=body), body))
+        self.assertTrue(os.path.exists(dict_path))
+        self.assertTrue(storage.codec.dict_id)
+
+        # Compressed with the dictionary after it's trained
+        request = self.store(storage, spider)
+        data = storage._read_data(spider, request)
+        self.assertEqual(data['codec'], 'zstd')
+        self.assertEqual(data['dict_id'], storage.codec.dict_id)
+        self.assertEqual(get_body(data, dict_path), REPORT_BODY)
+
+        # The dictionary is loaded next time, and older entries are still read
+        storage, spider = self.open_storage(**settings)
+        self.assertEqual(storage.retrieve_response(spider, request).body, REPORT_BODY)
+        for old_request, body in requests:
+            self.assertEqual(storage.retrieve_response(spider, old_request).body, body)
+
+        # The dictionary is used as long as it's there
+        storage, spider = self.open_storage(HTTPCACHE_COMPRESSION='zstd')
+        self.assertEqual(storage.retrieve_response(spider, request).body, REPORT_BODY)
+        storage, spider = self.open_storage()
+        self.assertEqual(storage.retrieve_response(spider, request).body, REPORT_BODY)
+
+        # Entries compressed with the dictionary can't be read without it
+        os.remove(dict_path)
+        storage, spider = self.open_storage(HTTPCACHE_COMPRESSION='zstd')
+        self.assertIsNone(storage.retrieve_response(spider, request))
+
+        # ... and the entries without the dictionary can be read with zlib
+        storage, spider = self.open_storage()
+        self.assertEqual(storage.retrieve_response(spider, requests[0][0]).body, requests[0][1])
+
+
+def _store_in_process(args):
+    dir_path, start = args
+    crawler = get_crawler({'HTTPCACHE_DIR': dir_path})
+    spider = Spider('edgar')
+    spider.set_crawler(crawler)
+    crawler.stats.open_spider(spider)
+    storage = CompressedSqliteCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    for i in xrange(start, start + 20):
+        url = URL.replace('fb-', 'fb%d-' % i)
+        storage.store_response(spider, Request(url), XmlResponse(url, body=REPORT_BODY))
+    storage.close_spider(spider)
+
+
+class CompressedSqliteCacheStorageTest(CompressedLeveldbCacheStorageTest):
+
+    storage_cls = CompressedSqliteCacheStorage
+
+    def test_uncompressed_entries(self):
+        # E.g., migrated from LeveldbCacheStorage
+        storage, spider = self.open_storage()
+        request = Request('http://www.sec.gov/index.htm')
+        data = {'status': 200, 'url': request.url, 'headers': {}, 'body': '<html></html>'}
+        storage.db.Put('%s_data' % storage._request_key(request), pickle.dumps(data, protocol=2))
+        storage.db.Put('%s_time' % storage._request_key(request), str(time.time()))
+
+        response = storage.retrieve_response(spider, request)
+        self.assertEqual(response.body, '<html></html>')
+
+    def test_shared(self):
+        storage, spider = self.open_storage()
+        request = self.store(storage, spider)
+
+        # Other processes read and write the database while it's open
+        self.storages = []
+        other, other_spider = self.open_storage()
+        self.storages.append((storage, spider))
+        self.assertEqual(other.retrieve_response(other_spider, request).body, REPORT_BODY)
+
+        pool = multiprocessing.Pool(2)
+        try:
+            pool.map(_store_in_process, [(self.dir_path, 0), (self.dir_path, 20)])
+        finally:
+            pool.close()
+            pool.join()
+
+        for i in xrange(40):
+            url = URL.replace('fb-', 'fb%d-' % i)
+            self.assertEqual(storage.retrieve_response(spider, Request(url)).body, REPORT_BODY)
+
+
+class ArchivePolicyTest(TestCaseBase):
+
+    def setUp(self):
+        self.policy = ArchivePolicy(Settings({'HTTPCACHE_BROWSE_TTL': 3600}))
+
+    def make_response(self, url, age, status=200, headers=None):
+        headers = dict(headers or {}, Date=formatdate(time.time() - age, usegmt=True))
+        return Response(url, status=status, headers=headers)
+
+    def test_get_ttl(self):
+        self.assertEqual(self.policy.get_ttl(URL), ArchivePolicy.IMMUTABLE)
+        self.assertEqual(self.policy.get_ttl(
+            'http://www.sec.gov/Archives/edgar/data/1326801/000132680113000024/0001326801-13-000024-index.htm'),
+            ArchivePolicy.IMMUTABLE)
+        self.assertEqual(self.policy.get_ttl(
+            'http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=FB&type=10-'), 3600)
+        self.assertEqual(self.policy.get_ttl(
+            'http://www.nasdaq.com/screening/companies-by-industry.aspx?exchange=NYSE&render=download'), 86400)
+        self.assertEqual(self.policy.get_ttl('http://ichart.finance.yahoo.com/table.csv?s=FB'), 86400)
+
+        # The full index changes every day
+        self.assertIsNone(self.policy.get_ttl('http://www.sec.gov/Archives/edgar/full-index/2014/QTR1/xbrl.idx'))
+
+    def test_archive(self):
+        request = Request(URL)
+
+        # Cached even if the server says otherwise
+        response = self.make_response(URL, 0, headers={'Cache-Control': 'no-cache'})
+        self.assertTrue(self.policy.should_cache_response(response, request))
+        self.assertFalse(self.policy.should_cache_response(self.make_response(URL, 0, status=404), request))
+
+        response = self.make_response(URL, 10 * 365 * 86400, headers={'Last-Modified': 'Sat, 01 Jan 2000 00:00:00 GMT'})
+        self.assertTrue(self.policy.is_cached_response_fresh(response, request))
+        self.assertNotIn('If-Modified-Since', request.headers)
+
+    def test_browse(self):
+        url = 'http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=FB&type=10-'
+        request = Request(url)
+        self.assertTrue(self.policy.should_cache_response(self.make_response(url, 0), request))
+        self.assertTrue(self.policy.is_cached_response_fresh(self.make_response(url, 60), request))
+
+        response = self.make_response(url, 7200, headers={'Last-Modified': 'Sat, 01 Jan 2000 00:00:00 GMT'})
+        self.assertFalse(self.policy.is_cached_response_fresh(response, request))
+        self.assertEqual(request.headers['If-Modified-Since'], 'Sat, 01 Jan 2000 00:00:00 GMT')
+
+        # Without a date, it's unknown how old it is
+        self.assertFalse(self.policy.is_cached_response_fresh(Response(url), Request(url)))
+
+    def test_other_urls(self):
+        url = 'http://www.sec.gov/Archives/edgar/full-index/2014/QTR1/xbrl.idx'
+        request = Request(url)
+        self.assertFalse(self.policy.should_cache_response(self.make_response(url, 0), request))
+
+        response = self.make_response(url, 60, headers={'Cache-Control': 'max-age=3600'})
+        self.assertTrue(self.policy.should_cache_response(response, request))
+        self.assertTrue(self.policy.is_cached_response_fresh(response, request))
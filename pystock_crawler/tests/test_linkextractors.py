@@ -0,0 +1,112 @@
+from scrapy.http import HtmlResponse
+
+from pystock_crawler.linkextractors import EdgarLinkExtractor, PageLinkCache
+from pystock_crawler.tests.base import TestCaseBase
+
+
+BROWSE_BODY = '''
+    <html><body>
+      <div id="headerTop"><a href="/index.htm">Home</a></div>
+      <table class="tableFile2" summary="Results">
+        <tr><th>Filings</th><th>Format</th><th>Description</th></tr>
+        <tr>
+          <td nowrap="nowrap">10-Q</td>
+          <td nowrap="nowrap"><a href="/Archives/edgar/data/1326801/000132680114000020/0001326801-14-000020-index.htm" id="documentsbutton">Documents</a>
+            <a href="/cgi-bin/viewer?action=view&amp;cik=1326801&amp;accession_number=0001326801-14-000020" id="interactiveDataBtn">Interactive Data</a></td>
+          <td>Quarterly report</td>
+        </tr>
+        <tr>
+          <td nowrap="nowrap">10-K</td>
+          <td nowrap="nowrap"><a href="/Archives/edgar/data/1326801/000132680114000007/0001326801-14-000007-index.htm" id="documentsbutton">Documents</a></td>
+          <td>Annual report</td>
+        </tr>
+      </table>
+      <a href="/Archives/edgar/data/1326801/000000000000000000/0000000000-00-000000-index.htm">Somewhere else</a>
+    </body></html>
+'''
+
+INDEX_BODY = '''
+    <html><body>
+      <table class="tableFile" summary="Document Format Files">
+        <tr><th>Seq</th><th>Description</th><th>Document</th><th>Type</th><th>Size</th></tr>
+        <tr><td>1</td><td>10-Q</td><td><a href="/Archives/edgar/data/1326801/000132680114000020/fb-3312014x10q.htm">fb-3312014x10q.htm</a></td><td>10-Q</td><td>1 MB</td></tr>
+      </table>
+      <table class="tableFile" summary="Data Files">
+        <tr><th>Seq</th><th>Description</th><th>Document</th><th>Type</th><th>Size</th></tr>
+        <tr><td>5</td><td>XBRL INSTANCE DOCUMENT</td><td><a href="/Archives/edgar/data/1326801/000132680114000020/fb-20140331.xml">fb-20140331.xml</a></td><td>EX-101.INS</td><td>2 MB</td></tr>
+        <tr><td>6</td><td>XBRL TAXONOMY EXTENSION SCHEMA</td><td><a href="/Archives/edgar/data/1326801/000132680114000020/fb-20140331.xsd">fb-20140331.xsd</a></td><td>EX-101.SCH</td><td>11 KB</td></tr>
+        <tr><td>7</td><td>XBRL TAXONOMY EXTENSION CALCULATION LINKBASE</td><td><a href="/Archives/edgar/data/1326801/000132680114000020/fb-20140331_cal.xml">fb-20140331_cal.xml</a></td><td>EX-101.CAL</td><td>8 KB</td></tr>
+      </table>
+    </body></html>
+'''
+
+INDEX_URL = 'http://www.sec.gov/Archives/edgar/data/1326801/000132680114000020/0001326801-14-000020-index.htm'
+
+
+def make_extractors():
+    cache = PageLinkCache()
+    filings = EdgarLinkExtractor(allow='/Archives/edgar/data/[^\"]+\-index\.htm', cache=cache)
+    instances = EdgarLinkExtractor(allow='/Archives/edgar/data/[^\"]+/[A-Za-z]+\-\d{8}\.xml',
+                                   doc_type='EX-101.INS', cache=cache)
+    return filings, instances
+
+
+class EdgarLinkExtractorTest(TestCaseBase):
+
+    def test_browse_page(self):
+        filings, instances = make_extractors()
+        response = HtmlResponse('http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=FB',
+                                body=BROWSE_BODY)
+
+        # Only the filings in the table, not the other links on the page
+        self.assertEqual([link.url for link in filings.extract_links(response)], [
+            'http://www.sec.gov/Archives/edgar/data/1326801/000132680114000020/0001326801-14-000020-index.htm',
+            'http://www.sec.gov/Archives/edgar/data/1326801/000132680114000007/0001326801-14-000007-index.htm'
+        ])
+        self.assertEqual(instances.extract_links(response), [])
+
+    def test_index_page(self):
+        filings, instances = make_extractors()
+        response = HtmlResponse(INDEX_URL, body=INDEX_BODY)
+
+        links = instances.extract_links(response)
+        self.assertEqual(len(links), 1)
+        self.assertEqual(links[0].url, 'http://www.sec.gov/Archives/edgar/data/1326801/000132680114000020/fb-20140331.xml')
+        self.assertEqual(links[0].text, 'fb-20140331.xml')
+        self.assertEqual(filings.extract_links(response), [])
+
+    def test_no_doc_type(self):
+        filings, instances = make_extractors()
+
+        # An older index page without types, so any instance-like link matches
+        body = INDEX_BODY.replace('EX-101.INS', '').replace('_cal.xml', '.xml')
+        response = HtmlResponse(INDEX_URL, body=body)
+        self.assertEqual([link.url for link in instances.extract_links(response)], [
+            'http://www.sec.gov/Archives/edgar/data/1326801/000132680114000020/fb-20140331.xml'
+        ])
+
+    def test_no_tables(self):
+        filings, instances = make_extractors()
+        body = '''
+            <html><body>
+              <a href="0001326801-14-000020-index.htm">Documents</a>
+              <a href="http://www.sec.gov/Archives/edgar/data/1326801/000132680114000020/0001326801-14-000020-index.htm#top">Again</a>
+              <a href="fb-20140331.xml">Instance</a>
+            </body></html>
+        '''
+        response = HtmlResponse('http://www.sec.gov/Archives/edgar/data/1326801/000132680114000020/', body=body)
+        self.assertEqual([link.url for link in filings.extract_links(response)], [
+            'http://www.sec.gov/Archives/edgar/data/1326801/000132680114000020/0001326801-14-000020-index.htm'
+        ])
+        self.assertEqual([link.url for link in instances.extract_links(response)], [
+            'http://www.sec.gov/Archives/edgar/data/1326801/000132680114000020/fb-20140331.xml'
+        ])
+
+    def test_parse_once(self):
+        cache = PageLinkCache()
+        response = HtmlResponse(INDEX_URL, body=INDEX_BODY)
+        links = cache.get_links(response)
+        self.assertIs(cache.get_links(response), links)
+
+        response = HtmlResponse(INDEX_URL, body=BROWSE_BODY)
+        self.assertIsNot(cache.get_links(response), links)
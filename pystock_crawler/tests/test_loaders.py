@@ -1,10 +1,16 @@
+import cStringIO
 import os
 import requests
 import urlparse
 
+from datetime import datetime
 from scrapy.http.response.xml import XmlResponse
 
-from pystock_crawler.loaders import ReportItemLoader
+from pystock_crawler.loaders import (ContextTable, IntermediateValue, ReportItemLoader,
+                                     StreamingXbrlParser, compile_xpath, get_xpath_evaluator,
+                                     imd_filter_member, imd_get_per_share_value, imd_max,
+                                     imd_min, imd_mult, node_attribute, node_local_name,
+                                     node_text, node_texts, split_tag)
 from pystock_crawler.tests.base import SAMPLE_DATA_DIR, TestCaseBase
 
 
@@ -15,7 +21,8 @@ def create_response(file_path):
 
 
 def download(url, local_path):
-    if not os.path.exists(local_path):
+    # An empty file is left by a failed download
+    if not os.path.exists(local_path) or not os.path.getsize(local_path):
         dir_path = os.path.dirname(local_path)
         if not os.path.exists(dir_path):
             try:
@@ -25,10 +32,13 @@ def download(url, local_path):
 
         assert os.path.exists(dir_path)
 
-        with open(local_path, 'wb') as f:
+        tmp_path = '%s.tmp' % local_path
+        with open(tmp_path, 'wb') as f:
             r = requests.get(url, stream=True)
+            r.raise_for_status()
             for chunk in r.iter_content(chunk_size=4096):
                 f.write(chunk)
+        os.rename(tmp_path, local_path)
 
 
 def parse_xml(url):
@@ -3906,3 +3916,496 @@ class ReportItemLoaderTest(TestCaseBase):
             'cash_flow_inv': -174300000.00000003,
             'cash_flow_fin': -142000000.00000003
         })
+
+
+class FactIndexTest(TestCaseBase):
+
+    def setUp(self):
+        body = '''<?xml version="1.0"?>
+            <xbrl xmlns="http://www.xbrl.org/2003/instance"
+                  xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31"
+                  xmlns:abc="http://abc.com/20130630">
+              <us-gaap:Revenues contextRef="c1">1</us-gaap:Revenues>
+              <abc:TotalRevenues contextRef="c1">2</abc:TotalRevenues>
+              <us-gaap:NetIncomeLoss contextRef="c1">3</us-gaap:NetIncomeLoss>
+              <abc:Revenues contextRef="c1">4</abc:Revenues>
+              <abc:NetIncomeLossPerShare contextRef="c1">5</abc:NetIncomeLossPerShare>
+            </xbrl>
+        '''
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=body)
+        self.loader = ReportItemLoader(response=response)
+        self.index = self.loader.fact_index
+
+    def assert_same_as_xpath(self, xpath):
+        expected = self.loader.selector.xpath(xpath).extract()
+        self.assertEqual(self.index.xpath(xpath).extract(), expected)
+        return expected
+
+    def test_compile_xpath(self):
+        self.assertEqual(compile_xpath('//us-gaap:Revenues'), ('qname', 'us-gaap', 'Revenues'))
+
+        predicate = compile_xpath('//*[contains(local-name(), "NetIncome") and not(contains(local-name(), "Per"))]')[1]
+        self.assertTrue(predicate('NetIncomeLoss'))
+        self.assertFalse(predicate('NetIncomeLossPerShare'))
+
+        predicate = compile_xpath('//*[local-name()="Revenues" or starts-with(local-name(), "Total")]')[1]
+        self.assertTrue(predicate('Revenues'))
+        self.assertTrue(predicate('TotalRevenues'))
+        self.assertFalse(predicate('SalesRevenueNet'))
+
+        # Not answerable from the index
+        self.assertIsNone(compile_xpath('//*[@id="c1"]'))
+        self.assertIsNone(compile_xpath('//us-gaap:Revenues/text()'))
+
+    def test_qname(self):
+        self.assertEqual(len(self.assert_same_as_xpath('//us-gaap:Revenues')), 1)
+        self.assertEqual(self.assert_same_as_xpath('//us-gaap:OperatingIncomeLoss'), [])
+
+    def test_predicate_in_document_order(self):
+        values = self.assert_same_as_xpath('//*[contains(local-name(), "Revenues")]')
+        self.assertEqual(len(values), 3)
+
+        values = self.assert_same_as_xpath('//*[contains(local-name(), "NetIncome") and not(contains(local-name(), "Per"))]')
+        self.assertEqual(len(values), 1)
+
+    def test_fallback_to_xpath(self):
+        self.assertEqual(len(self.assert_same_as_xpath('//*[@contextRef="c1"]')), 5)
+        self.assertEqual(self.assert_same_as_xpath('//us-gaap:Revenues/text()'), [u'1'])
+        self.assertEqual(self.assert_same_as_xpath('count(//*[@contextRef])'), [u'5.0'])
+
+        # Compiled once with the namespaces of the document
+        namespaces = self.loader.selector.namespaces
+        self.assertIs(get_xpath_evaluator('//*[@contextRef="c1"]', namespaces),
+                      get_xpath_evaluator('//*[@contextRef="c1"]', dict(namespaces)))
+
+        self.assertRaises(ValueError, self.index.xpath, '//*[')
+        self.assertRaises(ValueError, self.index.xpath, '//xyz:Revenues')
+
+    def test_cached_results(self):
+        xpath = '//*[contains(local-name(), "Revenues")]'
+        self.assertIs(self.index.xpath(xpath), self.index.xpath(xpath))
+        self.assertIs(self.index.xpath('//*[@contextRef="c1"]'), self.index.xpath('//*[@contextRef="c1"]'))
+
+    def test_node_helpers(self):
+        for node in self.index.xpath('//*[contains(local-name(), "Revenues")]'):
+            self.assertEqual(node_attribute(node, 'contextRef'), node.xpath('@contextRef')[0].extract())
+            self.assertEqual(node_text(node), node.xpath('./text()')[0].extract())
+            self.assertEqual(node_texts(node), node.xpath('./text()').extract())
+            self.assertEqual(node_local_name(node), node.xpath('local-name()')[0].extract())
+            self.assertIsInstance(node_text(node), unicode)
+            self.assertIsInstance(node_local_name(node), unicode)
+            self.assertRaises(IndexError, node_attribute, node, 'decimals')
+
+
+class ConceptHintTest(TestCaseBase):
+
+    url = 'http://sec.gov/Archives/edgar/data/123/abc-20130630.xml'
+
+    body = '''<?xml version="1.0"?>
+        <xbrl xmlns="http://www.xbrl.org/2003/instance"
+              xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+              xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+          <context id="c1">
+            <period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period>
+          </context>
+          <context id="c2">
+            <period><startDate>2012-04-01</startDate><endDate>2012-06-30</endDate></period>
+          </context>
+          <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+          <dei:DocumentFiscalPeriodFocus contextRef="c1">Q2</dei:DocumentFiscalPeriodFocus>
+          <dei:DocumentFiscalYearFocus contextRef="c1">2013</dei:DocumentFiscalYearFocus>
+          %s
+        </xbrl>
+    '''
+
+    def load(self, facts, concept_hints=None, verify_concepts=False):
+        response = XmlResponse(self.url, body=self.body % facts)
+        loader = ReportItemLoader(response=response, concept_hints=concept_hints,
+                                  verify_concepts=verify_concepts)
+        return loader.load_item(), loader
+
+    def test_has_match(self):
+        __, loader = self.load('<us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>')
+        index = loader.fact_index
+        self.assertTrue(index.has_match('//us-gaap:Revenues'))
+        self.assertFalse(index.has_match('//us-gaap:SalesRevenueNet'))
+        self.assertTrue(index.has_match('//*[contains(local-name(), "Revenue")]'))
+        self.assertFalse(index.has_match('//*[contains(local-name(), "TotalRevenues")]'))
+        self.assertTrue(index.has_match('//*[@contextRef="c1"]'))
+        self.assertFalse(index.has_match('//*[@contextRef="c3"]'))
+
+    def test_learn_and_use_hint(self):
+        facts = '<us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>'
+        concept_hints = {}
+        item, loader = self.load(facts, concept_hints)
+        self.assertEqual(item['revenues'], 100.0)
+        self.assertEqual(concept_hints['revenues'], '//us-gaap:Revenues')
+        self.assertEqual(loader.field_stats['revenues']['learned'], 0)
+
+        # Fields without a match aren't remembered
+        self.assertNotIn('net_income', concept_hints)
+
+        hinted_item, loader = self.load(facts, concept_hints, verify_concepts=True)
+        self.assertEqual(hinted_item, item)
+        stats = loader.field_stats['revenues']
+        self.assertEqual(stats['learned'], 1)
+
+        # Only the hint and the 2nd add_xpaths() call of revenues
+        self.assertEqual(stats['evaluated'], 2)
+        self.assertEqual(stats['matched'], [1])
+        self.assertEqual(stats['mismatches'], 0)
+
+    def test_earlier_xpath_has_candidates(self):
+        # SalesRevenueNet only has a value of the previous year, so it's
+        # evaluated but yields nothing
+        facts = '''
+            <us-gaap:SalesRevenueNet contextRef="c2">90</us-gaap:SalesRevenueNet>
+            <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+        '''
+        concept_hints = {'revenues': '//us-gaap:Revenues'}
+        item, loader = self.load(facts, concept_hints)
+        self.assertEqual(item['revenues'], 100.0)
+        self.assertEqual(loader.field_stats['revenues']['learned'], 0)
+        self.assertEqual(loader.field_stats['revenues']['evaluated'], 2 + 1)
+
+    def test_stale_hint(self):
+        facts = '<us-gaap:SalesRevenueNet contextRef="c1">100</us-gaap:SalesRevenueNet>'
+        concept_hints = {'revenues': '//us-gaap:Revenues', 'net_income': '//us-gaap:Unknown'}
+        item, loader = self.load(facts, concept_hints, verify_concepts=True)
+        self.assertEqual(item['revenues'], 100.0)
+        self.assertEqual(concept_hints['revenues'], '//us-gaap:SalesRevenueNet')
+        self.assertEqual(loader.field_stats['revenues']['learned'], 0)
+        self.assertEqual(loader.field_stats['revenues']['mismatches'], 0)
+
+
+class ComparativeTest(TestCaseBase):
+
+    url = 'http://sec.gov/Archives/edgar/data/123/000012345614000010/abc-20140630.xml'
+
+    body = '''<?xml version="1.0"?>
+        <xbrl xmlns="http://www.xbrl.org/2003/instance"
+              xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+              xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+              xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+          <context id="q2_2014"><period><startDate>2014-04-01</startDate><endDate>2014-06-30</endDate></period></context>
+          <context id="q2_2013"><period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period></context>
+          <context id="q1_2014"><period><startDate>2014-01-01</startDate><endDate>2014-03-31</endDate></period></context>
+          <context id="ytd_2014"><period><startDate>2014-01-01</startDate><endDate>2014-06-30</endDate></period></context>
+          <context id="ytd_2013"><period><startDate>2013-01-01</startDate><endDate>2013-06-30</endDate></period></context>
+          <context id="i_2014"><period><instant>2014-06-30</instant></period></context>
+          <context id="i_2013"><period><instant>2013-12-31</instant></period></context>
+          <context id="q2_2012_member">
+            <entity><segment><xbrldi:explicitMember dimension="us-gaap:StatementBusinessSegmentsAxis">abc:XyzMember</xbrldi:explicitMember></segment></entity>
+            <period><startDate>2012-04-01</startDate><endDate>2012-06-30</endDate></period>
+          </context>
+          <dei:DocumentType contextRef="q2_2014">10-Q</dei:DocumentType>
+          <dei:DocumentFiscalPeriodFocus contextRef="q2_2014">Q2</dei:DocumentFiscalPeriodFocus>
+          <dei:DocumentFiscalYearFocus contextRef="q2_2014">2014</dei:DocumentFiscalYearFocus>
+          <us-gaap:Revenues contextRef="q2_2014">100</us-gaap:Revenues>
+          <us-gaap:Revenues contextRef="q2_2013">90</us-gaap:Revenues>
+          <us-gaap:Revenues contextRef="q1_2014">95</us-gaap:Revenues>
+          <us-gaap:Revenues contextRef="q2_2012_member">80</us-gaap:Revenues>
+          <us-gaap:NetIncomeLoss contextRef="q2_2014">10</us-gaap:NetIncomeLoss>
+          %s
+          <us-gaap:Assets contextRef="i_2014">1000</us-gaap:Assets>
+          <us-gaap:Assets contextRef="i_2013">900</us-gaap:Assets>
+          <us-gaap:NetCashProvidedByUsedInOperatingActivities contextRef="ytd_2014">50</us-gaap:NetCashProvidedByUsedInOperatingActivities>
+          <us-gaap:NetCashProvidedByUsedInOperatingActivities contextRef="ytd_2013">40</us-gaap:NetCashProvidedByUsedInOperatingActivities>
+        </xbrl>
+    '''
+
+    def load(self, facts='<us-gaap:NetIncomeLoss contextRef="q2_2013">9</us-gaap:NetIncomeLoss>', **kwargs):
+        response = XmlResponse(self.url, body=self.body % facts)
+        loader = ReportItemLoader(response=response, **kwargs)
+        return loader.load_item(), loader
+
+    def test_comparative_items(self):
+        item, loader = self.load(comparatives=True)
+        self.assertEqual(item['accession'], '0000123456-14-000010')
+        self.assertIs(item['comparative'], False)
+        self.assertEqual(item['revenues'], 100.0)
+
+        items = loader.load_comparative_items()
+        self.assertEqual(len(items), 1)
+        self.assertEqual(dict(items[0]), {
+            'symbol': 'ABC',
+            'amend': False,
+            'doc_type': '10-Q',
+            'period_focus': 'Q2',
+            'fiscal_year': 2013,
+            'end_date': '2013-06-30',
+            'revenues': 90.0,
+            'net_income': 9.0,
+            'dividend': 0.0,
+            'cash_flow_op': 40.0,
+            'accession': '0000123456-14-000010',
+            'comparative': True
+        })
+
+        # The report itself isn't changed
+        self.assertEqual(loader.load_item(), item)
+
+    def test_incomplete_period(self):
+        # No net_income of 2013 Q2
+        item, loader = self.load('')
+        self.assertEqual(item['net_income'], 10.0)
+        self.assertNotIn('accession', item)
+        self.assertEqual(loader.load_comparative_items(), [])
+
+    def test_fields(self):
+        __, loader = self.load(fields=['revenues'])
+        items = loader.load_comparative_items()
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]['revenues'], 90.0)
+        self.assertNotIn('net_income', items[0])
+        self.assertNotIn('cash_flow_op', items[0])
+
+
+class NamespaceTest(TestCaseBase):
+
+    def make_loader(self, body):
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=body)
+        return ReportItemLoader(response=response)
+
+    def test_standard_prefixes(self):
+        loader = self.make_loader('''<?xml version="1.0"?>
+            <xbrl xmlns="http://www.xbrl.org/2003/instance"
+                  xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+                  xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+              <dei:DocumentType>10-Q</dei:DocumentType>
+            </xbrl>
+        ''')
+        namespaces = loader.selector.namespaces
+        self.assertEqual(namespaces['xmlns'], 'http://www.xbrl.org/2003/instance')
+        self.assertEqual(namespaces['xbrli'], 'http://www.xbrl.org/2003/instance')
+        self.assertEqual(namespaces['dei'], 'http://xbrl.sec.gov/dei/2011-01-31')
+        self.assertEqual(namespaces['us-gaap'], 'http://fasb.org/us-gaap/2011-01-31')
+
+    def test_non_standard_prefixes(self):
+        loader = self.make_loader('''<?xml version="1.0"?>
+            <xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+                        xmlns:gaap="http://xbrl.us/us-gaap/2009-01-31">
+              <xbrli:context id="c1">
+                <xbrli:period>
+                  <xbrli:startDate>2013-04-01</xbrli:startDate>
+                  <xbrli:endDate>2013-06-30</xbrli:endDate>
+                </xbrli:period>
+              </xbrli:context>
+              <document xmlns="http://xbrl.sec.gov/dei/2011-01-31">
+                <DocumentType contextRef="c1">10-Q</DocumentType>
+              </document>
+              <gaap:Revenues contextRef="c1">100</gaap:Revenues>
+            </xbrli:xbrl>
+        ''')
+        namespaces = loader.selector.namespaces
+        self.assertNotIn('xmlns', namespaces)
+        self.assertEqual(namespaces['xbrli'], 'http://www.xbrl.org/2003/instance')
+        self.assertEqual(namespaces['dei'], 'http://xbrl.sec.gov/dei/2011-01-31')
+        self.assertEqual(namespaces['us-gaap'], 'http://xbrl.us/us-gaap/2009-01-31')
+
+        item = loader.load_item()
+        self.assertEqual(item['doc_type'], '10-Q')
+        self.assertEqual(item['revenues'], 100.0)
+
+
+class IntermediateValueTest(TestCaseBase):
+
+    def test_plain_values(self):
+        body = '''<?xml version="1.0"?>
+            <xbrl xmlns="http://www.xbrl.org/2003/instance"
+                  xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+              <context id="c1">
+                <period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period>
+              </context>
+              <us-gaap:Revenues contextRef="c1" decimals="-6" id="RevenuesInMillions">1</us-gaap:Revenues>
+            </xbrl>
+        '''
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=body)
+        loader = ReportItemLoader(response=response)
+        loader.context.update({'end_date': '2013-06-30', 'doc_type': '10-Q'})
+        loader.add_xpath('revenues', '//us-gaap:Revenues')
+
+        imd_value = loader._values['revenues'][0]
+        self.assertFalse(hasattr(imd_value, '__dict__'))
+        self.assertEqual(imd_value.local_name, 'Revenues')
+        self.assertEqual(imd_value.value, 1.0)
+        self.assertEqual(imd_value.decimals, '-6')
+        self.assertEqual(imd_value.element_id, 'RevenuesInMillions')
+        self.assertEqual(imd_value.context_id, 'c1')
+        self.assertEqual(imd_value.start_date, datetime(2013, 4, 1))
+        self.assertEqual(imd_value.end_date, datetime(2013, 6, 30))
+        self.assertIsNone(imd_value.instant)
+        self.assertEqual(imd_value.memberness, 0)
+        self.assertFalse(imd_value.is_member)
+
+        self.assertEqual(loader.get_output_value('revenues'), 1000000.0)
+
+    def test_max_min(self):
+        values = [IntermediateValue('A', 2.0), IntermediateValue('B', 3.0), IntermediateValue('C', 3.0),
+                  IntermediateValue('D', -1.0)]
+        self.assertEqual(imd_max(values), 3.0)
+        self.assertEqual(imd_min(values), -1.0)
+        self.assertIsNone(imd_max([]))
+
+    def test_filter_member(self):
+        values = [IntermediateValue('A', 1.0, memberness=2), IntermediateValue('B', 2.0, memberness=0),
+                  IntermediateValue('C', 3.0, memberness=1), IntermediateValue('D', 4.0, memberness=0)]
+        self.assertEqual([v.local_name for v in imd_filter_member(values)], ['B', 'D'])
+
+    def test_mult(self):
+        values = [IntermediateValue('A', 5.0, element_id='Foo_InThousands'),
+                  IntermediateValue('B', 5.0, element_id='Foo'),
+                  IntermediateValue('C', 5.0)]
+        self.assertEqual([v.value for v in imd_mult(values)], [5000.0, 5.0, 5.0])
+
+        # Values may be shared by other fields, so they must not be changed
+        self.assertEqual([v.value for v in values], [5.0, 5.0, 5.0])
+        self.assertEqual([v.value for v in imd_mult(values)], [5000.0, 5.0, 5.0])
+
+    def test_shared_facts(self):
+        body = '''<?xml version="1.0"?>
+            <xbrl xmlns="http://www.xbrl.org/2003/instance"
+                  xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+              <context id="c1">
+                <period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period>
+              </context>
+              <us-gaap:NetIncomeLoss contextRef="c1" id="NetIncomeInMillions">5</us-gaap:NetIncomeLoss>
+            </xbrl>
+        '''
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=body)
+        loader = ReportItemLoader(response=response)
+        loader.context.update({'end_date': '2013-06-30', 'doc_type': '10-Q'})
+        loader.add_xpath('net_income', '//us-gaap:NetIncomeLoss')
+        loader.add_xpath('op_income', '//*[local-name()="NetIncomeLoss"]')
+
+        # Matched once, scaled up once for each field
+        self.assertIs(loader._values['net_income'][0], loader._values['op_income'][0])
+        self.assertEqual(len(loader.context['match_cache']), 1)
+        self.assertEqual(loader.get_output_value('net_income'), 5000000.0)
+        self.assertEqual(loader.get_output_value('op_income'), 5000000.0)
+
+    def test_per_share_value(self):
+        self.assertEqual(imd_get_per_share_value([IntermediateValue('A', 1.5)]), 1.5)
+        self.assertAlmostEqual(imd_get_per_share_value([IntermediateValue('A', 320000.0, decimals='-4')]), 0.32)
+        self.assertIsNone(imd_get_per_share_value([IntermediateValue('A', 320000.0)]))
+        self.assertIsNone(imd_get_per_share_value([IntermediateValue('A', 320000.0, decimals='INF')]))
+
+
+class ContextTableTest(TestCaseBase):
+
+    def setUp(self):
+        body = '''<?xml version="1.0"?>
+            <xbrl xmlns="http://www.xbrl.org/2003/instance"
+                  xmlns:xbrldi="http://xbrl.org/2006/xbrldi">
+              <context id="c1">
+                <period><instant>2013-06-30</instant></period>
+              </context>
+              <context id="c2">
+                <period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period>
+              </context>
+              <context id="c3">
+                <entity><segment>
+                  <xbrldi:explicitMember dimension="us-gaap:StatementBusinessSegmentsAxis">abc:PartsMember</xbrldi:explicitMember>
+                </segment></entity>
+                <period><startDate>2013-04-01</startDate><endDate>2013-06-31</endDate></period>
+              </context>
+              <context id="c4">
+                <entity><segment>
+                  <xbrldi:explicitMember dimension="dei:LegalEntityAxis">us-gaap:ParentCompanyMember</xbrldi:explicitMember>
+                </segment></entity>
+                <period><instant>2012-12-31</instant></period>
+              </context>
+            </xbrl>
+        '''
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=body)
+        self.table = ContextTable(ReportItemLoader(response=response).fact_index)
+
+    def test_periods(self):
+        self.assertEqual(self.table['c1'].instant, datetime(2013, 6, 30))
+        self.assertIsNone(self.table['c1'].end_date)
+
+        self.assertIsNone(self.table['c2'].instant)
+        self.assertEqual(self.table['c2'].start_date, datetime(2013, 4, 1))
+        self.assertEqual(self.table['c2'].end_date, datetime(2013, 6, 30))
+
+        # Invalid end date
+        self.assertIsNone(self.table['c3'].start_date)
+        self.assertIsNone(self.table['c3'].end_date)
+
+        self.assertEqual(self.table.end_date_texts, set(['2013-06-30', '2013-06-31']))
+
+        with self.assertRaises(KeyError):
+            self.table['c5']
+
+    def test_members(self):
+        self.assertEqual(self.table['c1'].members, [])
+        self.assertEqual(self.table['c1'].memberness, 0)
+        self.assertFalse(self.table['c1'].is_member)
+
+        self.assertEqual(self.table['c3'].members, ['abc:PartsMember'])
+        self.assertEqual(self.table['c3'].memberness, 3)
+        self.assertTrue(self.table['c3'].is_member)
+
+        self.assertEqual(self.table['c4'].memberness, 2)
+        self.assertFalse(self.table['c4'].is_member)
+
+
+class StreamingXbrlParserTest(TestCaseBase):
+
+    body = '''<?xml version="1.0"?>
+        <xbrl xmlns="http://www.xbrl.org/2003/instance"
+              xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+              xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31"
+              xmlns:abc="http://abc.com/20130630">
+          <context id="c1">
+            <period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period>
+          </context>
+          <unit id="usd"><measure>iso4217:USD</measure></unit>
+          <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+          <dei:DocumentPeriodEndDate contextRef="c1">2013-06-30</dei:DocumentPeriodEndDate>
+          <us-gaap:SegmentReportingDisclosureTextBlock contextRef="c1">Very long text</us-gaap:SegmentReportingDisclosureTextBlock>
+          <us-gaap:Revenues contextRef="c1" unitRef="usd">100</us-gaap:Revenues>
+          <abc:SomethingElse contextRef="c1" unitRef="usd">200</abc:SomethingElse>
+          <abc:TotalRevenues contextRef="c1" unitRef="usd">300</abc:TotalRevenues>
+          <us-gaap:NetIncomeLoss contextRef="c1" unitRef="usd">50</us-gaap:NetIncomeLoss>
+        </xbrl>
+    '''
+
+    def test_parse(self):
+        parser = StreamingXbrlParser(['//us-gaap:Revenues', '//*[contains(local-name(), "NetIncome")]'])
+        root = parser.parse(cStringIO.StringIO(self.body.strip()))
+
+        local_names = [split_tag(e.tag)[1] for e in root]
+        self.assertEqual(local_names, ['context', 'DocumentType', 'DocumentPeriodEndDate',
+                                       'Revenues', 'NetIncomeLoss'])
+
+        # Context is kept as a whole
+        self.assertEqual(len(list(root[0].iter())), 4)
+
+    def test_same_item(self):
+        response = XmlResponse('http://sec.gov/Archives/edgar/data/123/abc-20130630.xml', body=self.body)
+        item = ReportItemLoader(response=response).load_item()
+        self.assertEqual(item['revenues'], 100.0)
+        self.assertEqual(item['net_income'], 50.0)
+
+        streamed_item = ReportItemLoader(response=response, streaming=True).load_item()
+        self.assertEqual(streamed_item, item)
+
+    def test_text_blocks(self):
+        # Substring predicates of the fields match these names
+        body = self.body.replace('SegmentReportingDisclosureTextBlock', 'RevenueRecognitionPolicyTextBlock')
+        body = body.replace('<abc:SomethingElse', '<us-gaap:CashAndCashEquivalentsPolicyTextBlock'
+                            ).replace('</abc:SomethingElse>', '</us-gaap:CashAndCashEquivalentsPolicyTextBlock>')
+
+        # Leading whitespace is fine
+        root = ReportItemLoader.parse_streaming('\n  ' + body)._root
+        local_names = [split_tag(e.tag)[1] for e in root]
+        self.assertNotIn('RevenueRecognitionPolicyTextBlock', local_names)
+        self.assertNotIn('CashAndCashEquivalentsPolicyTextBlock', local_names)
+        self.assertIn('Revenues', local_names)
+        self.assertIn('TotalRevenues', local_names)
+
+        # Unless it's asked for by name
+        parser = StreamingXbrlParser(['//us-gaap:RevenueRecognitionPolicyTextBlock'])
+        root = parser.parse(cStringIO.StringIO(body.strip()))
+        self.assertIn('RevenueRecognitionPolicyTextBlock', [split_tag(e.tag)[1] for e in root])
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+
+from scrapy.exceptions import NotConfigured
+from scrapy.spider import Spider
+from scrapy.statscol import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+
+from pystock_crawler import loaderstats, workers
+from pystock_crawler.tests.base import TestCaseBase
+from pystock_crawler.tests.test_workers import BODY
+
+
+URL = 'http://sec.gov/Archives/edgar/data/123/abc-20130630.xml'
+
+
+class LoaderStatsTest(TestCaseBase):
+
+    def setUp(self):
+        self.spider = Spider('edgar')
+        self.stats = MemoryStatsCollector(get_crawler())
+        self.stats.open_spider(self.spider)
+
+    def record(self, times=1):
+        __, field_stats, __, __ = workers.parse_report(URL, BODY)
+        for __ in xrange(times):
+            loaderstats.record_field_stats(self.stats, field_stats, self.spider)
+
+    def test_record_field_stats(self):
+        self.record(times=2)
+        stats = self.stats.get_stats()
+
+        self.assertEqual(stats['loader/documents'], 2)
+
+        # '//us-gaap:Revenues' is the 2nd XPath of revenues
+        self.assertEqual(stats['loader/revenues/evaluated'], 2 * 3)
+        self.assertEqual(stats['loader/revenues/candidates'], 2)
+        self.assertEqual(stats['loader/revenues/matched/1'], 2)
+        self.assertNotIn('loader/revenues/unmatched', stats)
+        self.assertGreater(stats['loader/revenues/time'], 0)
+
+        self.assertEqual(stats['loader/net_income/unmatched'], 2)
+        self.assertEqual(stats['loader/net_income/candidates'], 0)
+
+        self.assertNotIn('loader/revenues/learned', stats)
+
+        # Fields that don't come from add_xpaths() only have output_time
+        self.assertIn('loader/symbol/output_time', stats)
+        self.assertNotIn('loader/symbol/evaluated', stats)
+
+    def test_record_learned(self):
+        __, field_stats, __, __ = workers.parse_report(URL, BODY, concept_hints={'revenues': '//us-gaap:Revenues'})
+        loaderstats.record_field_stats(self.stats, field_stats, self.spider)
+        stats = self.stats.get_stats()
+        self.assertEqual(stats['loader/revenues/learned'], 1)
+        self.assertEqual(stats['loader/revenues/matched/1'], 1)
+        self.assertEqual(stats['loader/revenues/evaluated'], 2)
+
+    def test_summarize(self):
+        self.record()
+        summary = loaderstats.summarize(self.stats.get_stats())
+
+        self.assertEqual(summary['documents'], 1)
+        revenues = summary['fields']['revenues']
+        self.assertEqual(revenues['evaluated'], 3)
+        self.assertEqual(revenues['matched'], [
+            {'index': 1, 'xpath': '//us-gaap:Revenues', 'count': 1}
+        ])
+        self.assertEqual(summary['fields']['net_income']['matched'], [])
+        self.assertEqual(summary['fields']['net_income']['unmatched'], 1)
+
+    def test_dump(self):
+        self.assertRaises(NotConfigured, loaderstats.LoaderStatsDump, get_crawler())
+
+        dir_path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(dir_path, 'loaderstats.json')
+            crawler = get_crawler({'LOADERSTATS_ENABLED': True, 'LOADERSTATS_FILE': filename})
+            crawler.stats = self.stats
+            ext = loaderstats.LoaderStatsDump.from_crawler(crawler)
+
+            self.record()
+            ext._spider_closed(self.spider)
+
+            with open(filename) as f:
+                summary = json.load(f)
+            self.assertEqual(summary['documents'], 1)
+            self.assertEqual(summary['fields']['revenues']['matched'][0]['index'], 1)
+        finally:
+            shutil.rmtree(dir_path)
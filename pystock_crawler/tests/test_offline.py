@@ -0,0 +1,53 @@
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Request
+from scrapy.spider import Spider
+from scrapy.utils.test import get_crawler
+
+from pystock_crawler.offline import OfflineMiddleware
+from pystock_crawler.tests.base import TestCaseBase
+
+
+class OfflineMiddlewareTest(TestCaseBase):
+
+    def setUp(self):
+        self.crawler = get_crawler({
+            'OFFLINE_ENABLED': True,
+            'HTTPCACHE_ENABLED': True,
+            'OFFLINE_MAX_LISTED': 2
+        })
+        self.spider = Spider('edgar')
+        self.spider.set_crawler(self.crawler)
+        self.crawler.stats.open_spider(self.spider)
+        self.middleware = OfflineMiddleware.from_crawler(self.crawler)
+
+        self.messages = []
+        self.spider.log = lambda message, level=None: self.messages.append(message)
+
+    def test_not_configured(self):
+        with self.assertRaises(NotConfigured):
+            OfflineMiddleware(get_crawler())
+        with self.assertRaises(NotConfigured):
+            OfflineMiddleware(get_crawler({'OFFLINE_ENABLED': True, 'HTTPCACHE_ENABLED': False}))
+
+    def test_all_cached(self):
+        self.middleware._spider_closed(self.spider)
+        self.assertEqual(self.messages, ['Offline: all requests were in the HTTP cache'])
+
+    def test_missing(self):
+        urls = ['http://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=%s' % symbol
+                for symbol in ('AAPL', 'FB', 'GOOG')]
+        for url in urls:
+            with self.assertRaises(IgnoreRequest):
+                self.middleware.process_request(Request(url), self.spider)
+
+        # Local files aren't downloaded
+        self.assertIsNone(self.middleware.process_request(Request('file:///tmp/abc-20130630.xml'), self.spider))
+
+        self.assertEqual(self.crawler.stats.get_value('offline/miss', spider=self.spider), 3)
+        self.middleware._spider_closed(self.spider)
+        self.assertEqual(self.messages, ['\n'.join([
+            'Offline: 3 requests were not in the HTTP cache:',
+            '  ' + urls[0],
+            '  ' + urls[1],
+            '  ... and 1 more'
+        ])])
@@ -0,0 +1,229 @@
+import cPickle as pickle
+import csv
+import os
+import shutil
+import tempfile
+
+from pystock_crawler import reparse
+from pystock_crawler.concepts import ConceptCache
+from pystock_crawler.httpcache import ZlibCodec
+from pystock_crawler.tests.base import TestCaseBase
+
+
+BODY = '''<?xml version="1.0"?>
+<xbrl xmlns="http://www.xbrl.org/2003/instance"
+      xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+      xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+  <context id="c1">
+    <period><startDate>%(start_date)s</startDate><endDate>%(end_date)s</endDate></period>
+  </context>
+  <dei:DocumentType contextRef="c1">%(doc_type)s</dei:DocumentType>
+  <dei:DocumentFiscalPeriodFocus contextRef="c1">Q2</dei:DocumentFiscalPeriodFocus>
+  <dei:DocumentFiscalYearFocus contextRef="c1">2013</dei:DocumentFiscalYearFocus>
+  <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+</xbrl>
+'''
+
+
+# A 10-Q that compares with the same quarter of last year
+COMPARATIVE_BODY = '''<?xml version="1.0"?>
+<xbrl xmlns="http://www.xbrl.org/2003/instance"
+      xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+      xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+  <context id="c1">
+    <period><startDate>%(year)d-04-01</startDate><endDate>%(year)d-06-30</endDate></period>
+  </context>
+  <context id="c2">
+    <period><startDate>%(prev_year)d-04-01</startDate><endDate>%(prev_year)d-06-30</endDate></period>
+  </context>
+  <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+  <dei:DocumentFiscalPeriodFocus contextRef="c1">Q2</dei:DocumentFiscalPeriodFocus>
+  <dei:DocumentFiscalYearFocus contextRef="c1">%(year)d</dei:DocumentFiscalYearFocus>
+  <us-gaap:Revenues contextRef="c1">%(revenues)d</us-gaap:Revenues>
+  <us-gaap:Revenues contextRef="c2">%(prev_revenues)d</us-gaap:Revenues>
+</xbrl>
+'''
+
+
+class ReparseTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.write_report('data/123/0001/abc-20130630.xml', '10-Q', '2013-04-01', '2013-06-30')
+        self.write_report('data/456/0002/xyz-20131231.xml', '10-K', '2013-01-01', '2013-12-31')
+        self.write_report('data/456/0002/brk-b-20131231.xml', '10-K', '2013-01-01', '2013-12-31')
+        self.write_report('data/456/0003/xyz-20140331.xml', '8-K', '2014-01-01', '2014-03-31')
+        self.write_report('data/456/0003/xyz-20140331_lab.xml', '10-Q', '2014-01-01', '2014-03-31')
+        self.write_file('data/789/0004/broken-20140630.xml', 'not xml')
+        self.output = os.path.join(self.dir_path, 'out.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def write_file(self, path, content):
+        path = os.path.join(self.dir_path, path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def write_report(self, path, doc_type, start_date, end_date):
+        self.write_file(path, BODY % {
+            'doc_type': doc_type,
+            'start_date': start_date,
+            'end_date': end_date
+        })
+
+    def test_iter_report_files(self):
+        files = list(reparse.iter_report_files(self.dir_path))
+        filenames = [os.path.basename(path) for url, path in files]
+        self.assertEqual(filenames, [
+            'abc-20130630.xml', 'brk-b-20131231.xml', 'xyz-20131231.xml', 'xyz-20140331.xml',
+            'broken-20140630.xml'
+        ])
+        for url, path in files:
+            self.assertTrue(url.startswith('file://'))
+            self.assertTrue(url.endswith(os.path.basename(path)))
+
+    def test_is_cache_dir(self):
+        self.assertFalse(reparse.is_cache_dir(self.dir_path))
+        self.assertTrue(reparse.is_cache_dir('.scrapy/httpcache/edgar.leveldb'))
+        self.assertTrue(reparse.is_cache_dir('.scrapy/httpcache/edgar.leveldb/'))
+
+        os.makedirs(os.path.join(self.dir_path, 'edgar.leveldb'))
+        self.assertTrue(reparse.is_cache_dir(self.dir_path))
+
+    def test_reparse(self):
+        num_reports = reparse.reparse(self.dir_path, self.output, processes=2)
+        self.assertEqual(num_reports, 3)
+
+        with open(self.output) as f:
+            rows = list(csv.reader(f))
+
+        header = rows.pop(0)
+        rows.sort()
+        self.assertEqual(header, [
+            'symbol', 'end_date', 'amend', 'period_focus', 'fiscal_year', 'doc_type',
+            'revenues', 'op_income', 'net_income', 'eps_basic', 'eps_diluted', 'dividend',
+            'assets', 'cur_assets', 'cur_liab', 'cash', 'equity', 'cash_flow_op',
+            'cash_flow_inv', 'cash_flow_fin'
+        ])
+
+        self.assertEqual([row[:7] for row in rows], [
+            ['ABC', '2013-06-30', 'False', 'Q2', '2013', '10-Q', '100.0'],
+            ['BRK', '2013-12-31', 'False', 'FY', '2013', '10-K', '100.0'],
+            ['XYZ', '2013-12-31', 'False', 'FY', '2013', '10-K', '100.0']
+        ])
+
+    def test_reparse_missing_file(self):
+        # A file that vanished after it was listed
+        missing_path = os.path.join(self.dir_path, 'data/789/0005/gone-20140630.xml')
+        iter_report_files = reparse.iter_report_files
+
+        def iter_with_missing_file(dir_path):
+            for url, file_path in iter_report_files(dir_path):
+                yield url, file_path
+            yield 'file://%s' % missing_path, missing_path
+
+        reparse.iter_report_files = iter_with_missing_file
+        try:
+            num_reports = reparse.reparse(self.dir_path, self.output, processes=2)
+        finally:
+            reparse.iter_report_files = iter_report_files
+        self.assertEqual(num_reports, 3)
+
+        url, (ok, value) = reparse._reparse_job(('file://%s' % missing_path, missing_path, None, {}))
+        self.assertFalse(ok)
+        self.assertIn('IOError', value)
+
+    def test_reparse_concept_cache(self):
+        concept_path = os.path.join(self.dir_path, 'concepts.json')
+        self.assertEqual(reparse.reparse(self.dir_path, self.output, processes=2,
+                                         concept_cache_path=concept_path), 3)
+        with open(self.output) as f:
+            rows = sorted(csv.reader(f))
+
+        # Hints of the first run are used by the next one
+        concept_cache = ConceptCache(concept_path)
+        self.assertIn('revenues', concept_cache.companies['ABC'])
+        jobs = list(reparse.iter_jobs(self.dir_path, concept_cache=concept_cache))
+        self.assertEqual(jobs[0][3]['concept_hints'], concept_cache.companies['ABC'])
+
+        self.assertEqual(reparse.reparse(self.dir_path, self.output, processes=2,
+                                         concept_cache_path=concept_path, verify_concepts=True), 3)
+        with open(self.output) as f:
+            self.assertEqual(sorted(csv.reader(f)), rows)
+
+    def test_reparse_streaming(self):
+        num_reports = reparse.reparse(self.dir_path, self.output, processes=1, streaming=True)
+        self.assertEqual(num_reports, 3)
+
+    def test_reparse_fields(self):
+        num_reports = reparse.reparse(self.dir_path, self.output, processes=1, fields=['revenues', 'dividend'])
+        self.assertEqual(num_reports, 3)
+
+        with open(self.output) as f:
+            rows = list(csv.reader(f))
+
+        self.assertEqual(rows[0], [
+            'symbol', 'end_date', 'amend', 'period_focus', 'fiscal_year', 'doc_type',
+            'revenues', 'dividend'
+        ])
+        self.assertEqual(sorted(row[6:] for row in rows[1:]), [['100.0', '0.0']] * 3)
+
+    def test_reparse_comparatives(self):
+        dir_path = os.path.join(self.dir_path, 'comparatives')
+        for accession, year, revenues, prev_revenues in (('000000000114000001', 2014, 120, 101),
+                                                          ('000000000113000001', 2013, 100, 80)):
+            self.write_file('comparatives/Archives/edgar/data/123/%s/abc-%d0630.xml' % (accession, year), COMPARATIVE_BODY % {
+                'year': year,
+                'prev_year': year - 1,
+                'revenues': revenues,
+                'prev_revenues': prev_revenues
+            })
+
+        num_reports = reparse.reparse(dir_path, self.output, processes=1, comparatives=True)
+        self.assertEqual(num_reports, 2)
+
+        with open(self.output) as f:
+            rows = list(csv.DictReader(f))
+
+        # The comparative period of 2014 is dropped in favor of the 2013 report
+        rows.sort(key=lambda row: row['end_date'])
+        self.assertEqual([(row['end_date'], row['fiscal_year'], row['revenues'], row['accession'], row['comparative'])
+                          for row in rows], [
+            ('2012-06-30', '2012', '80.0', '0000000001-13-000001', 'True'),
+            ('2013-06-30', '2013', '100.0', '0000000001-13-000001', 'False'),
+            ('2014-06-30', '2014', '120.0', '0000000001-14-000001', 'False')
+        ])
+
+    def test_reparse_cache(self):
+        import leveldb
+
+        cache_path = os.path.join(self.dir_path, 'httpcache')
+        os.makedirs(cache_path)
+        db = leveldb.LevelDB(os.path.join(cache_path, 'edgar.leveldb'))
+        codec = ZlibCodec()
+        for key, url, body, compressed in (
+                ('1', 'http://www.sec.gov/Archives/edgar/data/123/0001/abc-20130630.xml',
+                 BODY % {'doc_type': '10-Q', 'start_date': '2013-04-01', 'end_date': '2013-06-30'}, False),
+                ('2', 'http://www.sec.gov/Archives/edgar/data/456/0002/xyz-20131231.xml',
+                 BODY % {'doc_type': '10-K', 'start_date': '2013-01-01', 'end_date': '2013-12-31'}, True),
+                ('3', 'http://www.sec.gov/Archives/edgar/data/456/0002/0000000002-13-000002-index.htm',
+                 '<html></html>', True)):
+            data = {'status': 200, 'url': url, 'headers': {}, 'body': body}
+            if compressed:
+                data.update(codec=codec.name, dict_id=0, body=codec.compress(body))
+            db.Put('%s_data' % key, pickle.dumps(data, protocol=2))
+            db.Put('%s_time' % key, '0')
+        del db
+
+        num_reports = reparse.reparse(cache_path, self.output, processes=1)
+        self.assertEqual(num_reports, 2)
+
+        with open(self.output) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(sorted((row['symbol'], row['end_date'], row['revenues']) for row in rows), [
+            ('ABC', '2013-06-30', '100.0'),
+            ('XYZ', '2013-12-31', '100.0')
+        ])
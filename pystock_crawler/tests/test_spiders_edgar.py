@@ -1,10 +1,34 @@
+import json
 import os
+import shutil
 import tempfile
+import zipfile
 
-from scrapy.http import HtmlResponse, XmlResponse
+from cStringIO import StringIO
+from scrapy import signals
+from scrapy.http import HtmlResponse, Request, Response, XmlResponse
+from scrapy.utils.test import get_crawler
 
 from pystock_crawler.spiders.edgar import EdgarSpider, URLGenerator
 from pystock_crawler.tests.base import TestCaseBase
+from pystock_crawler.tests.test_fullindex import MASTER_IDX
+
+
+REPORT_BODY = '''<?xml version="1.0"?>
+    <xbrl xmlns="http://www.xbrl.org/2003/instance"
+          xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+          xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+      <context id="c1">
+        <startDate>2013-03-31</startDate>
+        <endDate>2013-06-28</endDate>
+      </context>
+      <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+      <dei:DocumentFiscalPeriodFocus contextRef="c1">Q2</dei:DocumentFiscalPeriodFocus>
+      <dei:DocumentPeriodEndDate contextRef="c1">2013-06-28</dei:DocumentPeriodEndDate>
+      <dei:DocumentFiscalYearFocus contextRef="c1">2013</dei:DocumentFiscalYearFocus>
+      <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+    </xbrl>
+'''
 
 
 def make_url(symbol, start_date='', end_date=''):
@@ -79,6 +103,13 @@ class EdgarSpiderTest(TestCaseBase):
         with self.assertRaises(ValueError):
             EdgarSpider(enddate='12345678')
 
+    def test_invalid_fields(self):
+        self.assertIsNone(EdgarSpider().fields)
+        self.assertEqual(EdgarSpider(fields='revenues,eps_basic').fields, ['revenues', 'eps_basic'])
+
+        with self.assertRaises(ValueError):
+            EdgarSpider(fields='revenues,price')
+
     def test_symbol_file_and_dates(self):
         # create a mock file of a list of symbols
         f = tempfile.NamedTemporaryFile('w', delete=False)
@@ -220,3 +251,174 @@ class EdgarSpiderTest(TestCaseBase):
             'equity': 300.0,
             'cash': 150.0
         })
+
+        # Only extract some of the fields
+        spider = EdgarSpider(fields='revenues,eps_basic')
+        item = spider.parse_10qk(response)
+        self.assert_item(item, {
+            'symbol': 'ABC',
+            'amend': False,
+            'doc_type': '10-Q',
+            'period_focus': 'Q2',
+            'fiscal_year': 2013,
+            'end_date': '2013-06-28',
+            'revenues': 100.0,
+            'eps_basic': 0.2
+        })
+
+    def test_full_index(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(dir_path, 'master.idx'), 'w') as f:
+                f.write(MASTER_IDX)
+
+            spider = EdgarSpider(symbols='0000320193,GOOG,1000045', startdate='20140120')
+            spider.set_crawler(get_crawler({'EDGAR_FULL_INDEX_DIR': dir_path}))
+            requests = list(spider.start_requests())
+        finally:
+            shutil.rmtree(dir_path)
+
+        # Symbols that aren't CIKs in the index go to the browse page
+        self.assertEqual([request.url for request in requests], [
+            'http://www.sec.gov/Archives/edgar/data/320193/000119312514024487/0001193125-14-024487-xbrl.zip',
+            'http://www.sec.gov/Archives/edgar/data/320193/000119312514111111/0001193125-14-111111-xbrl.zip',
+            make_url('GOOG', start_date='20140120'),
+            'http://www.sec.gov/Archives/edgar/data/1000045/000119312514055198/0001193125-14-055198-xbrl.zip'
+        ])
+        self.assertEqual(requests[0].callback, spider.parse_xbrl_zip)
+        self.assertEqual([request.meta['symbols'] for request in requests],
+                         [['0000320193'], ['0000320193'], ['GOOG'], ['1000045']])
+
+    def test_parse_xbrl_zip(self):
+        data = StringIO()
+        zip_file = zipfile.ZipFile(data, 'w')
+        zip_file.writestr('abc-20130628.xml', REPORT_BODY)
+        zip_file.writestr('abc-20130628_lab.xml', '<linkbase/>')
+        zip_file.writestr('abc-20130628.xsd', '<schema/>')
+        zip_file.close()
+
+        url = 'http://www.sec.gov/Archives/edgar/data/123/000012313013000001/0000123130-13-000001-xbrl.zip'
+        spider = EdgarSpider()
+        item = spider.parse_xbrl_zip(Response(url, body=data.getvalue()))
+        self.assertEqual(item['symbol'], 'ABC')
+        self.assertEqual(item['end_date'], '2013-06-28')
+        self.assertEqual(item['revenues'], 100.0)
+
+        self.assertIsNone(spider.parse_xbrl_zip(Response(url, body='Not Found')))
+
+    def test_page_link_cache(self):
+        # The rules of a spider share a cache, and spiders don't
+        spider = EdgarSpider()
+        caches = [rule.link_extractor.cache for rule in spider._rules]
+        self.assertIs(caches[0], caches[1])
+        self.assertIsNot(EdgarSpider()._rules[0].link_extractor.cache, caches[0])
+
+    def test_crawl_state(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir_path, 'state.json')
+            with open(path, 'w') as f:
+                f.write('{"symbols": {"GOOG": {"end_date": "2013-12-31", "accession": "0001288776-14-000020"}},'
+                        ' "accessions": ["0001288776-14-000020"]}')
+
+            crawler = get_crawler({'EDGAR_STATE_FILE': path})
+            spider = EdgarSpider(symbols='GOOG,abc,BRK.A', startdate='20120101')
+            spider.set_crawler(crawler)
+            spider._follow_links = True  # HACK
+
+            # Only the filings after the last exported report
+            requests = list(spider.start_requests())
+            self.assertEqual([r.url for r in requests], [
+                make_url('GOOG', start_date='20140101'),
+                make_url('abc', start_date='20120101'),
+                make_url('BRK.A', start_date='20120101')
+            ])
+            self.assertEqual([r.meta['symbols'] for r in requests], [['GOOG'], ['abc'], ['BRK.A']])
+
+            # The requested symbols are passed on to the filings
+            body = '''
+                <html><body>
+                <a href="/Archives/edgar/data/1288776/000128877614000020/0001288776-14-000020-index.htm">Link</a>
+                <a href="/Archives/edgar/data/1288776/000128877614000040/0001288776-14-000040-index.htm">Link</a>
+                </body></html>
+            '''
+            requests = list(spider.parse(HtmlResponse(requests[0].url, body=body, request=requests[0])))
+            self.assertEqual([r.url for r in requests], [
+                'http://www.sec.gov/Archives/edgar/data/1288776/000128877614000040/0001288776-14-000040-index.htm'
+            ])
+            self.assertEqual(requests[0].meta['symbols'], ['GOOG'])
+
+            def scrape(url, symbol):
+                request = Request(url, meta={'symbols': [symbol]})
+                response = XmlResponse(url, body=REPORT_BODY, request=request)
+                item = spider.parse_10qk(response)
+                crawler.signals.send_catch_log(signals.item_scraped, item=item, response=response,
+                                               spider=spider)
+
+            # Not recorded until the report is scraped
+            url = 'http://sec.gov/Archives/edgar/data/123/000012313013000001/abc-20130628.xml'
+            spider.parse_10qk(XmlResponse(url, body=REPORT_BODY, request=Request(url, meta={'symbols': ['abc']})))
+            self.assertFalse(spider.crawl_state.is_exported('0000123130-13-000001'))
+            scrape(url, 'abc')
+
+            # A report with another symbol is recorded for the symbol requested
+            url = 'http://sec.gov/Archives/edgar/data/1067983/000106798313000001/brk-20130628.xml'
+            scrape(url, 'BRK.A')
+
+            crawler.signals.send_catch_log(signals.spider_closed, spider=spider)
+
+            with open(path) as f:
+                state = json.load(f)
+            self.assertEqual(sorted(state['symbols']), ['ABC', 'BRK.A', 'GOOG'])
+            self.assertEqual(state['symbols']['ABC'], {'end_date': '2013-06-28', 'accession': '0000123130-13-000001'})
+            self.assertEqual(state['symbols']['BRK.A'], {'end_date': '2013-06-28', 'accession': '0001067983-13-000001'})
+            self.assertEqual(state['accessions'], ['0000123130-13-000001', '0001067983-13-000001',
+                                                   '0001288776-14-000020'])
+
+            # The next crawl starts after them
+            spider = EdgarSpider(symbols='abc,BRK.A', startdate='20120101')
+            spider.set_crawler(get_crawler({'EDGAR_STATE_FILE': path}))
+            self.assertEqual(list(spider.start_urls), [
+                make_url('abc', start_date='20130629'),
+                make_url('BRK.A', start_date='20130629')
+            ])
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_cik_map(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir_path, 'ticker.txt')
+            with open(path, 'w') as f:
+                f.write('goog\t1288776\ngoogl\t1288776\n')
+
+            crawler = get_crawler({'EDGAR_CIK_MAP': path})
+            spider = EdgarSpider(symbols='GOOG,FB,GOOGL,0000789019', startdate='20120101')
+            spider.set_crawler(crawler)
+
+            # GOOG and GOOGL are crawled once by their CIK, and a CIK as it is
+            self.assertEqual(list(spider.start_urls), [
+                make_url('1288776', start_date='20120101'),
+                make_url('FB', start_date='20120101'),
+                make_url('789019', start_date='20120101')
+            ])
+
+            # The CIK of FB is found on its browse page
+            body = '<a href="/cgi-bin/browse-edgar?action=getcompany&amp;CIK=0001326801&amp;owner=exclude">'
+            list(spider.parse(HtmlResponse(make_url('FB', start_date='20120101'), body=body)))
+            crawler.signals.send_catch_log(signals.spider_closed, spider=spider)
+            with open(path) as f:
+                self.assertEqual(f.read(), 'fb\t1326801\ngoog\t1288776\ngoogl\t1288776\n')
+
+            # Both GOOG and GOOGL get the reports
+            url = 'http://sec.gov/Archives/edgar/data/1288776/000128877613000001/goog-20130628.xml'
+            items = spider.parse_10qk(XmlResponse(url, body=REPORT_BODY))
+            self.assertEqual([item['symbol'] for item in items], ['GOOG', 'GOOGL'])
+            self.assertEqual([item['revenues'] for item in items], [100.0, 100.0])
+
+            # Reports of CIKs keep their symbols
+            url = 'http://sec.gov/Archives/edgar/data/789019/000078901913000001/msft-20130628.xml'
+            item = spider.parse_10qk(XmlResponse(url, body=REPORT_BODY))
+            self.assertEqual(item['symbol'], 'MSFT')
+        finally:
+            shutil.rmtree(dir_path)
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+
+from pystock_crawler import sqlitekv
+from pystock_crawler.tests.base import TestCaseBase
+
+
+class SqliteDBTest(TestCaseBase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir_path, 'edgar.sqlite')
+        self.db = sqlitekv.SqliteDB(self.path)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dir_path)
+
+    def test_get_put(self):
+        self.assertRaises(KeyError, self.db.Get, 'a')
+        self.assertIsNone(self.db.Get('a', default=None))
+
+        # Values are binary
+        self.db.Put('a', '\x00\xff\x80')
+        self.assertEqual(self.db.Get('a'), '\x00\xff\x80')
+        self.db.Delete('a')
+        self.assertIsNone(self.db.Get('a', default=None))
+
+    def test_write_batch(self):
+        self.db.Put('a', '1')
+        batch = sqlitekv.WriteBatch()
+        batch.Put('b', '2')
+        batch.Delete('a')
+        self.db.Write(batch)
+        self.assertEqual(list(self.db.RangeIter()), [('b', '2')])
+
+        # Seen by other connections
+        other = sqlitekv.SqliteDB(self.path, create_if_missing=False)
+        self.assertEqual(other.Get('b'), '2')
+        other.close()
+
+    def test_range_iter(self):
+        batch = sqlitekv.WriteBatch()
+        for i in xrange(sqlitekv.PAGE_SIZE * 2 + 5):
+            batch.Put('%05d' % i, str(i))
+        self.db.Write(batch)
+
+        keys = list(self.db.RangeIter(include_value=False))
+        self.assertEqual(len(keys), sqlitekv.PAGE_SIZE * 2 + 5)
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(list(self.db.RangeIter(key_from='00003', key_to='00005')),
+                         [('00003', '3'), ('00004', '4'), ('00005', '5')])
+
+        self.db.CompactRange()
+        self.assertEqual(self.db.Get('00010'), '10')
+
+    def test_missing(self):
+        self.assertRaises(IOError, sqlitekv.SqliteDB, os.path.join(self.dir_path, 'x.sqlite'),
+                          create_if_missing=False)
@@ -1,5 +1,8 @@
 import cStringIO
+import json
 import os
+import shutil
+import tempfile
 
 from pystock_crawler import utils
 from pystock_crawler.tests.base import SAMPLE_DATA_DIR, TestCaseBase
@@ -38,6 +41,25 @@ class UtilsTest(TestCaseBase):
         with self.assertRaises(ValueError):
             utils.parse_limit_arg('abc')
 
+    def test_parse_fields_arg(self):
+        self.assertIsNone(utils.parse_fields_arg(''))
+        self.assertIsNone(utils.parse_fields_arg(None))
+        self.assertEqual(utils.parse_fields_arg('eps_basic,revenues'), ['eps_basic', 'revenues'])
+        self.assertEqual(utils.parse_fields_arg('revenues,'), ['revenues'])
+
+        with self.assertRaises(ValueError):
+            utils.parse_fields_arg('revenues,price')
+
+    def test_get_export_fields(self):
+        export_fields = ('symbol', 'date', 'close', 'end_date', 'doc_type', 'revenues', 'net_income', 'eps_basic')
+        self.assertEqual(utils.get_export_fields(export_fields, None), list(export_fields))
+        self.assertEqual(utils.get_export_fields(export_fields, ['eps_basic', 'revenues']), [
+            'symbol', 'date', 'close', 'end_date', 'doc_type', 'revenues', 'eps_basic'
+        ])
+        self.assertEqual(utils.get_export_fields(export_fields, ['revenues'], comparatives=True), [
+            'symbol', 'date', 'close', 'end_date', 'doc_type', 'revenues', 'accession', 'comparative'
+        ])
+
     def test_load_symbols(self):
         try:
             filename = os.path.join(SAMPLE_DATA_DIR, 'test_symbols.txt')
@@ -49,6 +71,25 @@ class UtilsTest(TestCaseBase):
         finally:
             os.remove(filename)
 
+    def test_open_atomic(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir_path, 'data.json')
+            utils.write_json_atomic(path, {'b': 1, 'a': [2]})
+            with open(path) as f:
+                self.assertEqual(json.load(f), {'a': [2], 'b': 1})
+
+            # A failed write leaves the file as it was
+            with self.assertRaises(ValueError):
+                with utils.open_atomic(path) as f:
+                    f.write('{')
+                    raise ValueError()
+            with open(path) as f:
+                self.assertEqual(json.load(f), {'a': [2], 'b': 1})
+            self.assertEqual(os.listdir(dir_path), ['data.json'])
+        finally:
+            shutil.rmtree(dir_path)
+
     def test_parse_csv(self):
         f = cStringIO.StringIO('name,age\nAvon,30\nOmar,29\nJoe,45\n')
         items = list(utils.parse_csv(f))
@@ -0,0 +1,119 @@
+import os
+import signal
+import time
+
+from scrapy.http import XmlResponse
+
+from pystock_crawler import workers
+from pystock_crawler.tests.base import TestCaseBase
+
+
+BODY = '''<?xml version="1.0"?>
+<xbrl xmlns="http://www.xbrl.org/2003/instance"
+      xmlns:dei="http://xbrl.sec.gov/dei/2011-01-31"
+      xmlns:us-gaap="http://fasb.org/us-gaap/2011-01-31">
+  <context id="c1">
+    <period><startDate>2013-04-01</startDate><endDate>2013-06-30</endDate></period>
+  </context>
+  <dei:DocumentType contextRef="c1">10-Q</dei:DocumentType>
+  <dei:DocumentFiscalPeriodFocus contextRef="c1">Q2</dei:DocumentFiscalPeriodFocus>
+  <dei:DocumentFiscalYearFocus contextRef="c1">2013</dei:DocumentFiscalYearFocus>
+  <us-gaap:Revenues contextRef="c1">100</us-gaap:Revenues>
+</xbrl>
+'''
+
+
+def _kill_worker(url, body, kwargs):
+    # Like the OOM killer
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+class WorkersTest(TestCaseBase):
+
+    url = 'http://sec.gov/Archives/edgar/data/123/abc-20130630.xml'
+
+    def test_parse_report(self):
+        fields, field_stats, concept_hints, comparatives = workers.parse_report(self.url, BODY)
+        self.assertIsInstance(fields, dict)
+        self.assertEqual(fields['symbol'], 'ABC')
+        self.assertEqual(fields['doc_type'], '10-Q')
+        self.assertEqual(fields['period_focus'], 'Q2')
+        self.assertEqual(fields['fiscal_year'], 2013)
+        self.assertEqual(fields['end_date'], '2013-06-30')
+        self.assertEqual(fields['revenues'], 100.0)
+
+        self.assertEqual(field_stats['revenues']['matched'], [1])
+        self.assertIsNone(concept_hints)
+        self.assertEqual(comparatives, [])
+        self.assertNotIn('accession', fields)
+
+        self.assertEqual(workers.parse_report(self.url, BODY, streaming=True)[0], fields)
+
+    def test_parse_report_with_fields(self):
+        for streaming in (False, True):
+            fields, field_stats, __, __ = workers.parse_report(self.url, BODY, streaming, fields=['net_income'])
+            self.assertEqual(fields['symbol'], 'ABC')
+            self.assertEqual(fields['end_date'], '2013-06-30')
+            self.assertNotIn('revenues', fields)
+            self.assertNotIn('dividend', fields)
+            self.assertIn('net_income', field_stats)
+            self.assertNotIn('revenues', field_stats)
+
+    def test_parse_report_with_concept_hints(self):
+        fields, field_stats, concept_hints, __ = workers.parse_report(self.url, BODY, concept_hints={})
+        self.assertEqual(concept_hints['revenues'], '//us-gaap:Revenues')
+        self.assertEqual(field_stats['revenues']['learned'], 0)
+
+        hinted_fields, field_stats, __, __ = workers.parse_report(self.url, BODY, concept_hints=concept_hints,
+                                                                  verify_concepts=True)
+        self.assertEqual(hinted_fields, fields)
+        self.assertEqual(field_stats['revenues']['learned'], 1)
+        self.assertEqual(field_stats['revenues']['mismatches'], 0)
+
+    def test_parse_report_safely(self):
+        ok, (fields, field_stats, __, __) = workers._parse_report_safely(self.url, BODY, {})
+        self.assertTrue(ok)
+        self.assertEqual(fields['revenues'], 100.0)
+
+        # No date in URL
+        ok, error = workers._parse_report_safely('http://sec.gov/abc.xml', BODY, {})
+        self.assertFalse(ok)
+        self.assertIn('ValueError', error)
+
+    def wait(self, pool, d):
+        results = []
+        d.addBoth(results.append)
+        for __ in xrange(100):
+            if results:
+                break
+            time.sleep(0.05)
+            pool._poll()
+        return results[0]
+
+    def test_pool(self):
+        pool = workers.ReportParserPool(processes=1)
+        try:
+            item, field_stats, __, __ = self.wait(pool, pool.parse(XmlResponse(self.url, body=BODY)))
+            self.assertEqual(item['revenues'], 100.0)
+
+            failure = self.wait(pool, pool.parse(XmlResponse('http://sec.gov/abc.xml', body=BODY)))
+            self.assertIsInstance(failure.value, workers.ReportParserError)
+            self.assertIn('ValueError', str(failure.value))
+        finally:
+            pool.close()
+
+    def test_pool_worker_killed(self):
+        parse_report_safely = workers._parse_report_safely
+        workers._parse_report_safely = _kill_worker
+        pool = workers.ReportParserPool(processes=1, timeout=1)
+        try:
+            failure = self.wait(pool, pool.parse(XmlResponse(self.url, body=BODY)))
+            self.assertIsInstance(failure.value, workers.ReportParserError)
+            self.assertIn(self.url, str(failure.value))
+
+            # The slot is free again
+            self.assertEqual(pool.semaphore.tokens, pool.max_pending)
+            self.assertEqual(pool.pending, {})
+        finally:
+            workers._parse_report_safely = parse_report_safely
+            pool.close()
@@ -1,7 +1,19 @@
 import csv
+import json
+import os
 
+from contextlib import contextmanager
 from datetime import datetime
 
+from pystock_crawler.items import ReportItem
+
+
+# Fields that identify a report. They're always extracted.
+REPORT_KEY_FIELDS = ('symbol', 'amend', 'doc_type', 'period_focus', 'fiscal_year', 'end_date')
+
+# Fields that tell where the values of a comparative period come from
+COMPARATIVE_FIELDS = ('accession', 'comparative')
+
 
 def check_date_arg(value, arg_name=None):
     if value:
@@ -25,6 +37,34 @@ def parse_limit_arg(value):
     return 0, None
 
 
+def parse_fields_arg(value):
+    '''Parse a comma-separated list of ReportItem fields. Return None if `value` is empty.'''
+    if not value:
+        return None
+
+    fields = [field for field in value.split(',') if field]
+    unknown = [field for field in fields if field not in ReportItem.fields]
+    if unknown:
+        raise ValueError("Option 'fields' has unknown fields: '%s'" % ','.join(unknown))
+    return fields
+
+
+def get_export_fields(export_fields, fields, comparatives=False):
+    '''
+    Remove report fields that aren't in `fields` from `export_fields`, keeping
+    REPORT_KEY_FIELDS and the fields of other items. Add COMPARATIVE_FIELDS if
+    `comparatives` is True.
+
+    '''
+    export_fields = list(export_fields)
+    if fields is not None:
+        export_fields = [field for field in export_fields
+                         if field in fields or field in REPORT_KEY_FIELDS or field not in ReportItem.fields]
+    if comparatives:
+        export_fields += [field for field in COMPARATIVE_FIELDS if field not in export_fields]
+    return export_fields
+
+
 def load_symbols(file_path):
     symbols = []
     with open(file_path) as f:
@@ -36,6 +76,29 @@ def load_symbols(file_path):
     return symbols
 
 
+@contextmanager
+def open_atomic(path, mode='w'):
+    '''
+    Open a temporary file to write in place of `path`. It replaces `path`
+    once it's closed without an error, so a crash never leaves a broken file.
+
+    '''
+    tmp_path = '%s.tmp' % path
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.rename(tmp_path, path)
+
+
+def write_json_atomic(path, data):
+    with open_atomic(path) as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+
+
 def parse_csv(file_like):
     reader = csv.reader(file_like)
     headers = reader.next()
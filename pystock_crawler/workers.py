@@ -0,0 +1,148 @@
+'''
+Parse XBRL reports in worker processes, so that parsing a large document
+doesn't block the Twisted reactor and all downloads along with it.
+
+'''
+import multiprocessing
+import signal
+import traceback
+
+from scrapy import log
+from scrapy.http import XmlResponse
+from twisted.internet import defer, reactor, task
+
+from pystock_crawler.items import ReportItem
+from pystock_crawler.loaders import ReportItemLoader
+
+
+def parse_report(url, body, streaming=False, concept_hints=None, verify_concepts=False, fields=None,
+                 comparatives=False):
+    '''
+    Parse an XML report. Return the fields of the ReportItem as a dict, the
+    field_stats of the loader, the updated `concept_hints` and a list of the
+    fields of comparative periods (empty unless `comparatives` is True).
+
+    '''
+    response = XmlResponse(url, body=body)
+    loader = ReportItemLoader(response=response, streaming=streaming, fields=fields,
+                              comparatives=comparatives, concept_hints=concept_hints,
+                              verify_concepts=verify_concepts)
+    fields = dict(loader.load_item())
+    comparative_fields = []
+    if comparatives:
+        comparative_fields = [dict(item) for item in loader.load_comparative_items()]
+    return fields, loader.field_stats, concept_hints, comparative_fields
+
+
+def _parse_report_safely(url, body, kwargs):
+    # Pool.apply_async() in Python 2 has no error callback, so exceptions are
+    # passed back as the result
+    try:
+        return True, parse_report(url, body, **kwargs)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+def _init_worker():
+    # Let the parent process handle Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class ReportParserError(Exception):
+    pass
+
+
+class ReportParserPool(object):
+    '''
+    A pool of processes that parse XBRL reports.
+
+    parse() returns a Deferred that fires with a ReportItem, the field_stats
+    of the loader that parsed it, the updated concept hints and a list of
+    comparative ReportItems. At most
+    `max_pending` reports are handed to the pool at a time. The rest wait in
+    the parent process, and Scrapy stops downloading while the responses
+    waiting for callbacks exceed SCRAPER_SLOT_MAX_ACTIVE_SIZE.
+
+    A worker that dies, e.g., killed for running out of memory, loses its
+    report without a word in Python 2, so every report has `timeout` seconds
+    to be parsed. Then its Deferred fails with ReportParserError and frees
+    the slot.
+
+    '''
+    DEFAULT_TIMEOUT = 600
+
+    # Seconds between checks of the results
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, processes=None, max_pending=None, timeout=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_pending = max_pending or self.processes * 2
+        self.timeout = timeout or self.DEFAULT_TIMEOUT
+        self.semaphore = defer.DeferredSemaphore(self.max_pending)
+        self.pool = multiprocessing.Pool(self.processes, _init_worker)
+
+        # AsyncResult -> (Deferred, url, deadline)
+        self.pending = {}
+        self.poller = task.LoopingCall(self._poll)
+        self.pids = self._get_pids()
+        self.num_timeouts = 0
+
+    def parse(self, response, **kwargs):
+        # kwargs are passed to parse_report()
+        return self.semaphore.run(self._parse, response.url, response.body, kwargs)
+
+    def close(self):
+        if self.poller.running:
+            self.poller.stop()
+        if self.num_timeouts:
+            # Workers that are still stuck on a report would never finish
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+
+    def _parse(self, url, body, kwargs):
+        d = defer.Deferred()
+        result = self.pool.apply_async(_parse_report_safely, (url, body, kwargs))
+        self.pending[result] = (d, url, reactor.seconds() + self.timeout)
+        if not self.poller.running:
+            self.poller.start(self.POLL_INTERVAL, now=False)
+        return d
+
+    def _get_pids(self):
+        return set(process.pid for process in self.pool._pool)
+
+    def _poll(self):
+        now = reactor.seconds()
+        for result, (d, url, deadline) in self.pending.items():
+            if result.ready():
+                del self.pending[result]
+                try:
+                    value = result.get()
+                except Exception:
+                    value = False, traceback.format_exc()
+                self._fire(d, url, value)
+            elif now > deadline:
+                del self.pending[result]
+                self.num_timeouts += 1
+                d.errback(ReportParserError('Not parsed in %d seconds, the worker may have died: %s' %
+                                            (self.timeout, url)))
+
+        # The pool replaces dead workers, but it can't tell which report was lost
+        pids = self._get_pids()
+        if self.pids - pids:
+            log.msg('%d parser processes died, their reports fail after %d seconds' % (
+                len(self.pids - pids), self.timeout), level=log.WARNING)
+        self.pids = pids
+
+        if not self.pending:
+            self.poller.stop()
+
+    def _fire(self, d, url, result):
+        ok, value = result
+        if ok:
+            fields, field_stats, concept_hints, comparative_fields = value
+            comparatives = [ReportItem(a) for a in comparative_fields]
+            d.callback((ReportItem(fields), field_stats, concept_hints, comparatives))
+        else:
+            d.errback(ReportParserError('Error while parsing %s\n%s' % (url, value)))